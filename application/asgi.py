@@ -1,18 +1,66 @@
+from typing import Optional, Type
+
 import uvicorn
 from fastapi import FastAPI
 
-from .config import get_config
-from .routers import ad
+from . import database, metrics
+from .config import Config, get_config
+from .routers import metrics as metrics_router, status
+
+
+def create_app(config: Optional[Type[Config]] = None) -> FastAPI:
+    """The app of the config, of the environment by default.
+
+    Its database engines are created when it starts and disposed when it stops. They are those of the process,
+    so only one config can be started at a time.
+
+    The config given only sets DEBUG, ASYNC_DATABASE, METRICS_ENABLED and the database settings: the URLs,
+    the pools, the SQLite pragmas and the DATABASE_REPLICA_* settings. The other modules read the config
+    of the environment (CONFIG) when they are imported, so it still decides the caches (AD_CACHE_SIZE,
+    AD_NOT_FOUND_TTL, LIST_CACHE_*), the serialization (FAST_SERIALIZATION, AD_CARD_JSON, PHOTO_STORAGE),
+    the counts (AD_COUNT_*), the query budgets and the slow query log (QUERY_BUDGET_ENFORCED,
+    SLOW_QUERY_THRESHOLD) and AD_BATCH_MAX_SIZE.
+    """
+    config = config or get_config()
+    app = FastAPI(
+        debug=config.DEBUG,
+        title='Ad service',
+        description='A service for storing and submitting ads'
+    )
+    # only the routes of the mode are imported, building them is a good part of the import time
+    if config.ASYNC_DATABASE:
+        from .routers import ad_async as ad
+    else:
+        from .routers import ad
+    app.include_router(ad.router)
+    app.include_router(status.router)
+
+    if config.METRICS_ENABLED:
+        app.add_middleware(metrics.MetricsMiddleware)
+        app.include_router(metrics_router.router)
+
+    @app.on_event('startup')
+    def connect_database():
+        database.connect(config)
+
+        if config.METRICS_ENABLED:
+            metrics.instrument_engine('database', database.engine)
+            if database.async_engine is not None:
+                metrics.instrument_engine('async_database', database.async_engine.sync_engine)
+            for index, replica in enumerate(database.replicas.engines):
+                metrics.instrument_engine(f'replica_{index}', replica)
+            for index, replica in enumerate(database.async_replicas.engines):
+                metrics.instrument_engine(f'async_replica_{index}', replica.sync_engine)
+
+    @app.on_event('shutdown')
+    async def disconnect_database():
+        await database.disconnect()
+
+    return app
 
-config = get_config()
 
-application = FastAPI(
-    debug=config.DEBUG,
-    title='Ad service',
-    description='A service for storing and submitting ads'
-)
-application.include_router(ad.router)
+application = create_app()
 
 
 if __name__ == '__main__':
-    uvicorn.run(application, port=8000, debug=config.DEBUG)
+    uvicorn.run(application, port=8000, debug=get_config().DEBUG)
@@ -0,0 +1,243 @@
+import importlib
+import logging
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from .config import get_config
+
+config = get_config()
+
+logger = logging.getLogger(__name__)
+
+
+# counter value of a backend that cannot be read, never a real version
+UNAVAILABLE = -1
+
+
+class LRUCache:
+    """A thread-safe mapping bounded by the number of entries, evicting the least recently used one.
+
+    Entries expire after ``ttl`` seconds when it is set.
+    """
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            try:
+                value, expires_at = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+
+class CacheBackend(ABC):
+    """A byte store with counters. Implementations backed by a shared store let every worker use one cache."""
+
+    # identifies the counters, empty when they are shared by all the workers
+    scope = ''
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        pass
+
+    @abstractmethod
+    def set(self, key: str, value: bytes):
+        pass
+
+    @abstractmethod
+    def counter(self, key: str) -> int:
+        """The value of the counter, UNAVAILABLE if it cannot be read."""
+
+    @abstractmethod
+    def incr(self, key: str) -> int:
+        pass
+
+    @abstractmethod
+    def clear(self):
+        pass
+
+
+class InMemoryBackend(CacheBackend):
+    """Per-process backend, values are evicted in LRU order."""
+
+    def __init__(self, maxsize: int, url: Optional[str] = None):
+        # counters of different processes are unrelated, even when they hold the same value
+        self.scope = uuid.uuid4().hex[:8]
+        self.values = LRUCache(maxsize)
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.values.get(key)
+
+    def set(self, key: str, value: bytes):
+        self.values.set(key, value)
+
+    def counter(self, key: str) -> int:
+        return self._counters.get(key, 0)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+
+            return self._counters[key]
+
+    def clear(self):
+        with self._lock:
+            self.values.clear()
+            self._counters.clear()
+
+
+class RedisBackend(CacheBackend):
+    """Backend shared by all the workers. Requires the ``redis`` package.
+
+    Eviction is left to the server, which should run with ``maxmemory-policy allkeys-lru``. Redis errors and
+    timeouts (LIST_CACHE_TIMEOUT) are logged and make reads misses and writes no-ops, the requests then go
+    to the database.
+    """
+
+    prefix = 'ad-service:'
+
+    def __init__(self, maxsize: int, url: Optional[str] = None):
+        import redis
+
+        self._errors = redis.RedisError
+        self._redis = redis.Redis.from_url(
+            url, socket_timeout=config.LIST_CACHE_TIMEOUT, socket_connect_timeout=config.LIST_CACHE_TIMEOUT
+        )
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            return self._redis.get(self.prefix + key)
+        except self._errors as e:
+            logger.warning('Cache read of %s failed: %r', key, e)
+            return None
+
+    def set(self, key: str, value: bytes):
+        try:
+            self._redis.set(self.prefix + key, value)
+        except self._errors as e:
+            logger.warning('Cache write of %s failed: %r', key, e)
+
+    def counter(self, key: str) -> int:
+        try:
+            return int(self._redis.get(self.prefix + key) or 0)
+        except self._errors as e:
+            logger.warning('Cache read of %s failed: %r', key, e)
+            return UNAVAILABLE
+
+    def incr(self, key: str) -> int:
+        try:
+            return self._redis.incr(self.prefix + key)
+        except self._errors as e:
+            # the entries of the current version stay reachable, until they are evicted or the next increment
+            logger.error('Cache increment of %s failed, cached entries may be stale: %r', key, e)
+            return UNAVAILABLE
+
+    def clear(self):
+        for key in self._redis.scan_iter(self.prefix + '*'):
+            self._redis.delete(key)
+
+
+class VersionedCache:
+    """Entries are stored under a version, so bumping it invalidates all of them without a scan.
+
+    Read the version before querying the data to cache: a concurrent bump then only makes the entry unreachable.
+    Nothing is read or written under the UNAVAILABLE version, returned while the backend cannot be read.
+    """
+
+    def __init__(self, backend: CacheBackend, namespace: str):
+        self.backend = backend
+        self.namespace = namespace
+
+    def version(self) -> int:
+        return self.backend.counter(f'{self.namespace}:version')
+
+    def bump(self):
+        self.backend.incr(f'{self.namespace}:version')
+
+    def get(self, version: int, key: str) -> Optional[bytes]:
+        if version == UNAVAILABLE:
+            return None
+
+        return self.backend.get(f'{self.namespace}:{version}:{key}')
+
+    def set(self, version: int, key: str, value: bytes):
+        if version != UNAVAILABLE:
+            self.backend.set(f'{self.namespace}:{version}:{key}', value)
+
+
+def _backend(path: str) -> CacheBackend:
+    module, _, name = path.rpartition('.')
+
+    return getattr(importlib.import_module(module), name)(config.LIST_CACHE_SIZE, config.LIST_CACHE_URL)
+
+
+# serialized AdOut payloads by (ad_edits version, ad ID, requested fields)
+ads = LRUCache(config.AD_CACHE_SIZE)
+
+# (read source, ID) of the ads that were not found, with the ad_pages version read before the query: they no longer
+# count once ads are created, which clears them in the process too
+missing_ads = LRUCache(config.AD_CACHE_SIZE, ttl=config.AD_NOT_FOUND_TTL)
+
+# serialized list pages by sort parameters and page, invalidated by every insert
+ad_pages = VersionedCache(_backend(config.LIST_CACHE_BACKEND), 'ad_pages')
+
+# only its version is used: it goes in the keys of ads and in their ETags, and is bumped by the rare edits of ads,
+# so that unlike inserts they reach the ads cached by every process
+ad_edits = VersionedCache(ad_pages.backend, 'ad_edits')
+
+
+def clear():
+    ads.clear()
+    missing_ads.clear()
+    ad_pages.backend.clear()
@@ -1,25 +1,144 @@
 import os
+from typing import List, Optional
 
 BASEDIR = os.path.abspath(os.path.dirname(__file__))
 
 
+def _async_url(url: Optional[str]) -> Optional[str]:
+    drivers = {
+        'postgresql': 'postgresql+asyncpg',
+        'postgres': 'postgresql+asyncpg',
+        'sqlite': 'sqlite+aiosqlite'
+    }
+
+    if url is None:
+        return None
+
+    scheme, _, rest = url.partition('://')
+
+    return f'{drivers.get(scheme, scheme)}://{rest}'
+
+
+def _urls(name: str) -> List[str]:
+    # comma separated
+    return [url for url in os.getenv(name, '').split(',') if url]
+
+
 class Config:
     DEBUG = False
+    # serve the routes with async handlers on top of an AsyncEngine
+    ASYNC_DATABASE = os.getenv('ASYNC_DATABASE', '0') == '1'
+    # number of serialized ads kept in memory by GET /ad/{ad_id}
+    AD_CACHE_SIZE = int(os.getenv('AD_CACHE_SIZE', 10_000))
+    # seconds a 404 for an ad ID is remembered, unless an ad is created sooner
+    AD_NOT_FOUND_TTL = float(os.getenv('AD_NOT_FOUND_TTL', 5))
+    # store of the GET /ad/ page cache: application.cache.InMemoryBackend is per process,
+    # application.cache.RedisBackend at LIST_CACHE_URL is shared by all the workers
+    LIST_CACHE_BACKEND = os.getenv('LIST_CACHE_BACKEND', 'application.cache.InMemoryBackend')
+    LIST_CACHE_URL = os.getenv('LIST_CACHE_URL')
+    # seconds the Redis backend waits for the server before treating the request as a miss
+    LIST_CACHE_TIMEOUT = float(os.getenv('LIST_CACHE_TIMEOUT', 0.5))
+    # number of pages kept by the in-process backend
+    LIST_CACHE_SIZE = int(os.getenv('LIST_CACHE_SIZE', 1000))
+    # rows (per pg_class.reltuples) above which GET /ad/?envelope=true serves the PostgreSQL estimate
+    # instead of the ad_count counter, which drifts if ads are inserted around the application
+    AD_COUNT_ESTIMATE_THRESHOLD = int(os.getenv('AD_COUNT_ESTIMATE_THRESHOLD', 1_000_000))
+    # matching ads past which the filtered GET /ad/?envelope=true stops counting, unless exact=true;
+    # the total is then a lower bound and has_next tells whether there are more pages
+    AD_COUNT_FILTERED_LIMIT = int(os.getenv('AD_COUNT_FILTERED_LIMIT', 10_000))
+    # maximum number of ads accepted by POST /ad/batch
+    AD_BATCH_MAX_SIZE = int(os.getenv('AD_BATCH_MAX_SIZE', 1000))
+    # render read responses with precompiled orjson serializers instead of re-validating them through the DTOs
+    FAST_SERIALIZATION = os.getenv('FAST_SERIALIZATION', '1') == '1'
+    # store the rendered JSON of a list item in its ad_card row when the ad is written, so that a page is
+    # assembled from stored bytes; rows without it (backfilled by the migration) are rendered when read
+    AD_CARD_JSON = os.getenv('AD_CARD_JSON', '1') == '1'
+    # where GET /ad/{ad_id} and the export read the photos of an ad: 'embedded' from the ad.photo_urls column,
+    # 'table' from the photo rows; both are always written
+    PHOTO_STORAGE = os.getenv('PHOTO_STORAGE', 'embedded')
+    # record request latency and SQL statements per route, served at GET /metrics in the Prometheus format
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') == '1'
+    # seconds, statements running at least that long are logged with their parameters and route; 0 disables the log
+    SLOW_QUERY_THRESHOLD = float(os.getenv('SLOW_QUERY_THRESHOLD', 0.1))
+    # raise instead of logging when a route issues more statements than its query budget
+    QUERY_BUDGET_ENFORCED = os.getenv('QUERY_BUDGET_ENFORCED', '0') == '1'
+
+    # python -m application.serve: address, worker processes (0 for one per CPU available to the process,
+    # or a single one if LIST_CACHE_BACKEND is per process),
+    # seconds the workers get to finish their requests on shutdown and reload before they are killed,
+    # requests after which a worker is replaced (0 keeps them), and whether requests are logged
+    SERVER_HOST = os.getenv('SERVER_HOST', '127.0.0.1')
+    SERVER_PORT = int(os.getenv('SERVER_PORT', 8000))
+    SERVER_WORKERS = int(os.getenv('SERVER_WORKERS', 0))
+    SERVER_GRACEFUL_TIMEOUT = float(os.getenv('SERVER_GRACEFUL_TIMEOUT', 30))
+    SERVER_MAX_REQUESTS = int(os.getenv('SERVER_MAX_REQUESTS', 0))
+    SERVER_ACCESS_LOG = os.getenv('SERVER_ACCESS_LOG', '1') == '1'
+    SERVER_BACKLOG = int(os.getenv('SERVER_BACKLOG', 2048))
+
+    # connection pool, per engine and per process, so the database sees up to workers x (size + overflow)
+    # connections; size it against the threadpool (40 threads by default)
+    DATABASE_POOL_SIZE = int(os.getenv('DATABASE_POOL_SIZE', 5))
+    DATABASE_MAX_OVERFLOW = int(os.getenv('DATABASE_MAX_OVERFLOW', 10))
+    # seconds to wait for a free connection before failing the request
+    DATABASE_POOL_TIMEOUT = float(os.getenv('DATABASE_POOL_TIMEOUT', 30))
+    # seconds after which a connection is replaced, -1 to keep connections forever
+    DATABASE_POOL_RECYCLE = int(os.getenv('DATABASE_POOL_RECYCLE', -1))
+    # test connections with a round-trip on checkout
+    DATABASE_POOL_PRE_PING = os.getenv('DATABASE_POOL_PRE_PING', '0') == '1'
+    # milliseconds, PostgreSQL only, 0 disables the limit
+    DATABASE_STATEMENT_TIMEOUT = int(os.getenv('DATABASE_STATEMENT_TIMEOUT', 0))
+
+    # read replicas: the GET routes read from them, the rest goes to the primary database
+    DATABASE_REPLICA_URLS = []
+    ASYNC_DATABASE_REPLICA_URLS = []
+    # 'round_robin' or 'least_connections', by connections checked out from the pool of each replica
+    DATABASE_REPLICA_STRATEGY = os.getenv('DATABASE_REPLICA_STRATEGY', 'round_robin')
+    # seconds a replica that failed to connect is left out before it is tried again
+    DATABASE_REPLICA_RETRY_AFTER = float(os.getenv('DATABASE_REPLICA_RETRY_AFTER', 30))
+    # seconds after a client creates ads during which its reads go to the primary, so that it sees them;
+    # keep it above the replication lag
+    DATABASE_REPLICA_STICKY_SECONDS = float(os.getenv('DATABASE_REPLICA_STICKY_SECONDS', 5))
+
+    # SQLite pragmas applied to every new connection, None leaves the SQLite default
+    SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    # pages if positive, KiB if negative
+    SQLITE_CACHE_SIZE = int(os.getenv('SQLITE_CACHE_SIZE', -64 * 1024))
+    # seconds to wait for a lock held by another connection
+    SQLITE_BUSY_TIMEOUT = float(os.getenv('SQLITE_BUSY_TIMEOUT', 5))
 
 
 class DevelopmentConfig(Config):
     DEBUG = True
     SQLALCHEMY_DATABASE_URL = 'sqlite:///' + os.path.join(os.path.dirname(BASEDIR), 'db.sqlite3')
+    SQLALCHEMY_ASYNC_DATABASE_URL = _async_url(SQLALCHEMY_DATABASE_URL)
+    # e.g. a copy of db.sqlite3, to try the replica routing locally
+    DATABASE_REPLICA_URLS = _urls('DATABASE_REPLICA_URLS')
+    ASYNC_DATABASE_REPLICA_URLS = [_async_url(url) for url in DATABASE_REPLICA_URLS]
 
 
 class ProdConfig(Config):
     DEBUG = False
     SQLALCHEMY_DATABASE_URL = os.getenv('DATABASE_URL')
+    SQLALCHEMY_ASYNC_DATABASE_URL = os.getenv('ASYNC_DATABASE_URL', _async_url(SQLALCHEMY_DATABASE_URL))
+    DATABASE_POOL_SIZE = int(os.getenv('DATABASE_POOL_SIZE', 20))
+    DATABASE_MAX_OVERFLOW = int(os.getenv('DATABASE_MAX_OVERFLOW', 20))
+    DATABASE_POOL_TIMEOUT = float(os.getenv('DATABASE_POOL_TIMEOUT', 10))
+    DATABASE_POOL_RECYCLE = int(os.getenv('DATABASE_POOL_RECYCLE', 1800))
+    DATABASE_POOL_PRE_PING = os.getenv('DATABASE_POOL_PRE_PING', '1') == '1'
+    DATABASE_STATEMENT_TIMEOUT = int(os.getenv('DATABASE_STATEMENT_TIMEOUT', 5000))
+    DATABASE_REPLICA_URLS = _urls('DATABASE_REPLICA_URLS')
+    ASYNC_DATABASE_REPLICA_URLS = _urls('ASYNC_DATABASE_REPLICA_URLS') or [
+        _async_url(url) for url in DATABASE_REPLICA_URLS
+    ]
 
 
 class TestConfig(Config):
     DEBUG = False
+    QUERY_BUDGET_ENFORCED = os.getenv('QUERY_BUDGET_ENFORCED', '1') == '1'
     SQLALCHEMY_DATABASE_URL = 'sqlite:///' + os.path.join(os.path.dirname(BASEDIR), 'db.test.sqlite3')
+    SQLALCHEMY_ASYNC_DATABASE_URL = _async_url(SQLALCHEMY_DATABASE_URL)
 
 
 def get_config():
@@ -1,54 +1,538 @@
+import base64
+import binascii
+import datetime
+import json
+import random
+from decimal import Decimal, InvalidOperation
 from enum import Enum
-from typing import List, Optional
+from typing import Any, AsyncIterator, Iterator, List, NamedTuple, Optional, Tuple
 
-from sqlalchemy.orm import Session
+from sqlalchemy import and_, bindparam, event, func, insert, literal_column, or_, select, sql, Text, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, load_only, object_session, Session, selectinload
+from sqlalchemy.sql import Select, Update
 from sqlalchemy.sql.expression import asc, desc
 
-from .database.models import Ad, Photo
-from .dto import AdIn
+from . import cache
+from .config import get_config
+from .database.models import Ad, AD_COUNT_SHARDS, AdCard, AdCount, Photo, SEARCH_DOCUMENT, TEXT_SEARCH_CONFIG
+from .dto import AdIn, AdShort
+from .serializers import Serializer
+
+config = get_config()
 
 PAGE_SIZE = 10
 
+EXPORT_BATCH_SIZE = 1000
+
+# SQLite binds at most 999 parameters per statement before 3.32, which bounds the rows of a multi-row INSERT
+SQLITE_MAX_VARIABLE_NUMBER = 999
+
 
 class SortOrder(str, Enum):
     ASC = 'asc'
     DESC = 'desc'
 
 
-def get_ads(db: Session, date_order: Optional[SortOrder], price_order: Optional[SortOrder], page: int) -> List[Ad]:
+class InvalidCursor(ValueError):
+    pass
+
+
+class AdFilters(NamedTuple):
+    """Inclusive bounds on the ads of a list, None leaves a side open."""
+
+    price_min: Optional[Decimal] = None
+    price_max: Optional[Decimal] = None
+    date_from: Optional[datetime.datetime] = None
+    date_to: Optional[datetime.datetime] = None
+
+
+NO_FILTERS = AdFilters()
+
+
+def _sort_keys(
+    date_order: Optional[SortOrder], price_order: Optional[SortOrder], model: type = AdCard
+) -> List[Tuple[Any, SortOrder]]:
+    keys = []
+
+    if date_order is not None:
+        keys.append((model.date, date_order))
+    if price_order is not None:
+        keys.append((model.price, price_order))
+    # the ID breaks ties and follows the direction of the last key,
+    # so every combination is served by a single index scan
+    keys.append((model.id, keys[-1][1] if keys else SortOrder.ASC))
+
+    return keys
+
+
+def _after(keys: List[Tuple[Any, SortOrder]], values: List[Any]):
+    # (k1, k2, k3) > (v1, v2, v3) expanded by hand, since the directions may differ
+    criteria = []
+
+    for i, (column, order) in enumerate(keys):
+        bound = column > values[i] if order == SortOrder.ASC else column < values[i]
+        criteria.append(and_(*[c == v for (c, _), v in zip(keys[:i], values)], bound))
+
+    # the redundant bound on the leading key lets the database seek the index instead of scanning it
+    column, order = keys[0]
+    leading = column >= values[0] if order == SortOrder.ASC else column <= values[0]
+
+    return and_(leading, or_(*criteria))
+
+
+def _filter_criteria(filters: AdFilters) -> list:
+    criteria = []
+
+    if filters.price_min is not None:
+        criteria.append(AdCard.price >= filters.price_min)
+    if filters.price_max is not None:
+        criteria.append(AdCard.price <= filters.price_max)
+    if filters.date_from is not None:
+        criteria.append(AdCard.date >= filters.date_from)
+    if filters.date_to is not None:
+        criteria.append(AdCard.date <= filters.date_to)
+
+    return criteria
+
+
+def make_cursor(ad: AdCard, date_order: Optional[SortOrder], price_order: Optional[SortOrder]) -> str:
+    values = []
+
+    if date_order is not None:
+        values.append(ad.date.isoformat())
+    if price_order is not None:
+        values.append(str(ad.price))
+    values.append(ad.id)
+
+    payload = json.dumps([date_order, price_order, values], separators=(',', ':'))
+
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def parse_cursor(cursor: str, date_order: Optional[SortOrder], price_order: Optional[SortOrder]) -> List[Any]:
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        cursor_date_order, cursor_price_order, values = json.loads(payload)
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise InvalidCursor(cursor)
+
+    if (cursor_date_order, cursor_price_order) != (date_order, price_order):
+        raise InvalidCursor(cursor)
+    if not isinstance(values, list) or len(values) != len(_sort_keys(date_order, price_order)):
+        raise InvalidCursor(cursor)
+
+    try:
+        values = list(values)
+        if date_order is not None:
+            values[0] = datetime.datetime.fromisoformat(values[0])
+        if price_order is not None:
+            values[-2] = Decimal(values[-2])
+        if not isinstance(values[-1], int):
+            raise TypeError(values[-1])
+    except (InvalidOperation, ValueError, TypeError):
+        raise InvalidCursor(cursor)
+
+    return values
+
+
+def _ads_statement(
+    date_order: Optional[SortOrder],
+    price_order: Optional[SortOrder],
+    page: int,
+    after: Optional[List[Any]],
+    limit: int = PAGE_SIZE,
+    filters: AdFilters = NO_FILTERS
+) -> Select:
     order = {
         SortOrder.ASC: asc,
         SortOrder.DESC: desc
     }
 
-    query = db.query(Ad)
-    order_criteria = []
+    keys = _sort_keys(date_order, price_order)
+    statement = select(AdCard) \
+        .where(*_filter_criteria(filters)) \
+        .order_by(*[order[key_order](column) for column, key_order in keys])
 
-    if date_order is not None:
-        order_criteria.append(order[date_order](Ad.date))
-    if price_order is not None:
-        order_criteria.append(order[price_order](Ad.price))
-    query = query.order_by(*order_criteria)
-    
-    return query \
-        .join(Photo) \
-        .offset(PAGE_SIZE * (page - 1)) \
-        .limit(PAGE_SIZE)
+    if after is not None:
+        # keyset pagination: seek past the last row of the previous page instead of skipping rows
+        statement = statement.where(_after(keys, after))
+    else:
+        statement = statement.offset(PAGE_SIZE * (page - 1))
 
+    return statement.limit(limit)
 
-def get_ad_by_id(db: Session, id: int) -> Optional[Ad]:
-    return db.query(Ad).get(id)
 
+def _photos_embedded() -> bool:
+    return config.PHOTO_STORAGE == 'embedded'
 
-def save_ad(db: Session, ad: AdIn) -> Ad:
-    ad_item = Ad(
+
+def _export_statement(since_id: Optional[int], since_date: Optional[datetime.datetime]) -> Select:
+    # yield_per streams the rows (through a server-side cursor where available) and loads photos batch by batch
+    statement = select(Ad) \
+        .order_by(Ad.id) \
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+    if not _photos_embedded():
+        statement = statement.options(selectinload(Ad.photos))
+
+    if since_id is not None:
+        statement = statement.where(Ad.id > since_id)
+    if since_date is not None:
+        # the lowest ID posted since the date, read from ix_ad_date_id, bounds the scan in ID order;
+        # id + 0 keeps SQLite from looking for the minimum by walking the primary key instead
+        first_id = select(func.min(Ad.id + 0)).where(Ad.date >= since_date).scalar_subquery()
+        statement = statement.where(Ad.date >= since_date, Ad.id >= first_id)
+
+    return statement
+
+
+def _fts5_query(q: str) -> str:
+    # every word as a quoted string, so that the FTS5 query syntax does not apply to the user input
+    return ' '.join('"{}"'.format(word.replace('"', '""')) for word in q.split())
+
+
+def _search_statement(
+    dialect: str,
+    q: str,
+    date_order: Optional[SortOrder],
+    price_order: Optional[SortOrder],
+    page: int
+) -> Select:
+    if dialect == 'postgresql':
+        index = sql.table('ad_search', sql.column('ad_id'), sql.column('document'))
+        query = func.websearch_to_tsquery(TEXT_SEARCH_CONFIG, q)
+        statement = select(Ad).join(index, index.c.ad_id == Ad.id).where(index.c.document.op('@@')(query))
+        rank = func.ts_rank(index.c.document, query).desc()
+    else:
+        index = sql.table('ad_search', sql.column('rowid'))
+        statement = select(Ad) \
+            .join(index, index.c.rowid == Ad.id) \
+            .where(literal_column('ad_search').op('MATCH')(_fts5_query(q)))
+        # lower is better; a match in the name weighs ten times one in the description
+        rank = func.bm25(literal_column('ad_search'), 10.0, 1.0)
+
+    if date_order is None and price_order is None:
+        order_by = [rank, Ad.id]
+    else:
+        keys = _sort_keys(date_order, price_order, Ad)
+        order_by = [asc(column) if order == SortOrder.ASC else desc(column) for column, order in keys]
+
+    return statement.order_by(*order_by).offset(PAGE_SIZE * (page - 1)).limit(PAGE_SIZE)
+
+
+def _new_ad(ad: AdIn) -> Ad:
+    return Ad(
         name=ad.name,
         description=ad.description,
-        price=ad.price
+        price=ad.price,
+        main_photo_url=ad.photos[0].url,
+        photo_urls=[str(photo.url) for photo in ad.photos],
+        photos=[Photo(**photo.dict()) for photo in ad.photos]
     )
+
+
+_card_serializer = Serializer(AdShort)
+
+
+def card_json(id: int, name: str, price: Decimal, main_photo_url: str) -> Optional[str]:
+    """The ad_card.json of an ad, None unless AD_CARD_JSON and FAST_SERIALIZATION are set."""
+    if not (config.AD_CARD_JSON and config.FAST_SERIALIZATION):
+        return None
+
+    return _card_serializer.render({'id': id, 'name': name, 'price': price, 'main_photo': {'url': main_photo_url}}) \
+        .decode()
+
+
+# executed once per ad, in the transaction that inserts the ads, once they are flushed;
+# the date comes from the ad row, where the database sets it
+_insert_card = insert(AdCard).from_select(
+    ['id', 'name', 'price', 'date', 'main_photo_url', 'json'],
+    select(Ad.id, Ad.name, Ad.price, Ad.date, Ad.main_photo_url, bindparam('json', type_=Text))
+        .where(Ad.id == bindparam('ad_id'))
+)
+
+
+def _card_params(id: int, ad: AdIn) -> dict:
+    return {'ad_id': id, 'json': card_json(id, ad.name, ad.price, ad.photos[0].url)}
+
+
+@event.listens_for(Ad, 'after_update')
+def _update_card(mapper, connection, ad: Ad):
+    # the API never edits ads, this keeps the card of an ad edited through the ORM in line with it
+    connection.execute(update(AdCard).where(AdCard.id == ad.id).values(
+        name=ad.name,
+        price=ad.price,
+        date=ad.date,
+        main_photo_url=ad.main_photo_url,
+        json=card_json(ad.id, ad.name, ad.price, ad.main_photo_url)
+    ))
+    object_session(ad).info['ads_updated'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_updated_ads(session: Session):
+    # after the commit, so that a concurrent read cannot cache the old ad under the new version
+    if session.info.pop('ads_updated', False):
+        _ads_updated()
+
+
+def _count_created(count: int) -> Update:
+    # executed in the transaction that inserts the ads
+    return update(AdCount).where(AdCount.id == random.randint(1, AD_COUNT_SHARDS)).values(value=AdCount.value + count)
+
+
+def _index_ads(db: Session, ids: List[int]):
+    # executed in the transaction that inserts the ads, once they are flushed
+    if db.get_bind().dialect.name == 'postgresql':
+        statement = f'INSERT INTO ad_search (ad_id, document) SELECT id, {SEARCH_DOCUMENT} FROM ad WHERE id IN :ids'
+    else:
+        statement = 'INSERT INTO ad_search (rowid, name, description) ' \
+                    'SELECT id, name, description FROM ad WHERE id IN :ids'
+
+    db.execute(text(statement).bindparams(bindparam('ids', expanding=True)), {'ids': ids})
+
+
+def _ads_created():
+    cache.missing_ads.clear()
+    cache.ad_pages.bump()
+
+
+def _ads_updated():
+    cache.ad_edits.bump()
+    cache.ad_pages.bump()
+
+
+_next_ad_ids = text("SELECT nextval(pg_get_serial_sequence('ad', 'id')) FROM generate_series(1, :count)")
+
+
+def _insert_ads(db: Session, ads: List[AdIn]) -> List[int]:
+    rows = [{
+        'name': ad.name,
+        'description': ad.description,
+        'price': ad.price,
+        'main_photo_url': ad.photos[0].url,
+        'photo_urls': [str(photo.url) for photo in ad.photos]
+    } for ad in ads]
+
+    if db.get_bind().dialect.name == 'postgresql':
+        # the IDs are taken from the sequence up front, as the importer does, then the rows go in a single
+        # multi-row INSERT: the order of the rows of RETURNING is not guaranteed to be the one of VALUES
+        ids = db.execute(_next_ad_ids, {'count': len(rows)}).scalars().all()
+        db.execute(insert(Ad).values([{**row, 'id': id} for id, row in zip(ids, rows)]))
+    else:
+        # a multi-row INSERT per chunk: it holds the write lock throughout, so its rows take consecutive
+        # rowids ending with lastrowid
+        chunk_size = SQLITE_MAX_VARIABLE_NUMBER // len(rows[0])
+        ids = []
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            last_id = db.execute(insert(Ad).values(chunk)).lastrowid
+            ids.extend(range(last_id - len(chunk) + 1, last_id + 1))
+
+    db.execute(insert(Photo), [
+        {'url': photo.url, 'ad_id': id} for id, ad in zip(ids, ads) for photo in ad.photos
+    ])
+    db.execute(_insert_card, [_card_params(id, ad) for id, ad in zip(ids, ads)])
+    _index_ads(db, ids)
+    db.execute(_count_created(len(ids)))
+
+    return ids
+
+
+def get_ads(
+    db: Session,
+    date_order: Optional[SortOrder],
+    price_order: Optional[SortOrder],
+    page: int,
+    after: Optional[List[Any]] = None,
+    filters: AdFilters = NO_FILTERS
+) -> List[AdCard]:
+    return db.execute(_ads_statement(date_order, price_order, page, after, filters=filters)).scalars().all()
+
+
+def get_ads_page(
+    db: Session,
+    date_order: Optional[SortOrder],
+    price_order: Optional[SortOrder],
+    page: int,
+    after: Optional[List[Any]] = None,
+    filters: AdFilters = NO_FILTERS
+) -> Tuple[List[AdCard], bool]:
+    """The ads of the page and whether there is a next one, told by fetching one more row than needed."""
+    ads = db.execute(_ads_statement(date_order, price_order, page, after, PAGE_SIZE + 1, filters)).scalars().all()
+
+    return ads[:PAGE_SIZE], len(ads) > PAGE_SIZE
+
+
+def count_ads(db: Session, exact: bool = False, filters: AdFilters = NO_FILTERS) -> int:
+    """COUNT(*) if exact, otherwise the PostgreSQL estimate for large tables or the ad_count counter.
+
+    Filtered counts stop at AD_COUNT_FILTERED_LIMIT unless exact.
+    """
+    if filters != NO_FILTERS:
+        matching = select(AdCard.id).where(*_filter_criteria(filters))
+        if not exact:
+            matching = matching.limit(config.AD_COUNT_FILTERED_LIMIT)
+
+        return db.execute(select(func.count()).select_from(matching.subquery())).scalar_one()
+
+    if not exact and db.get_bind().dialect.name == 'postgresql':
+        estimate = db.execute(text("SELECT reltuples::bigint FROM pg_class WHERE oid = 'ad'::regclass")).scalar()
+        if estimate is not None and estimate >= config.AD_COUNT_ESTIMATE_THRESHOLD:
+            return estimate
+
+    count = None if exact else db.execute(select(func.sum(AdCount.value))).scalar()
+
+    if count is None:
+        count = db.execute(select(func.count()).select_from(Ad)).scalar_one()
+
+    return count
+
+
+def search_ads(
+    db: Session,
+    q: str,
+    date_order: Optional[SortOrder],
+    price_order: Optional[SortOrder],
+    page: int
+) -> List[Ad]:
+    """Ads matching all the words of q, by relevance unless an order is given."""
+    if not q.split():
+        return []
+
+    return db.execute(_search_statement(db.get_bind().dialect.name, q, date_order, price_order, page)).scalars().all()
+
+
+def _ad_statement(id: int, description: bool, photos: bool) -> Select:
+    # the columns of AdShort, main_photo_url included, plus only the extra fields that are requested
+    columns = [Ad.name, Ad.price, Ad.main_photo_url]
+
+    if description:
+        columns.append(Ad.description)
+    if photos and _photos_embedded():
+        columns.append(Ad.photo_urls)
+
+    statement = select(Ad).options(load_only(*columns)).where(Ad.id == id)
+
+    if photos and not _photos_embedded():
+        # joined rather than loaded by a second statement: an ad has at most 3 photos
+        statement = statement.options(joinedload(Ad.photos).load_only(Photo.url))
+
+    return statement
+
+
+def get_ad_by_id(db: Session, id: int, description: bool = False, photos: bool = False) -> Optional[Ad]:
+    """The ad, in a single statement that reads the description and the photos only if they are requested."""
+    return db.execute(_ad_statement(id, description, photos)).unique().scalar_one_or_none()
+
+
+def photo_urls(ad: Ad) -> List[str]:
+    """The photo URLs of the ad, from the layout set by PHOTO_STORAGE; the photo rows may be lazy loaded."""
+    if _photos_embedded():
+        return ad.photo_urls
+
+    return [photo.url for photo in ad.photos]
+
+
+def export_ads(
+    db: Session, since_id: Optional[int] = None, since_date: Optional[datetime.datetime] = None
+) -> Iterator[Ad]:
+    yield from db.execute(_export_statement(since_id, since_date)).scalars()
+
+
+def save_ad(db: Session, ad: AdIn) -> Ad:
+    ad_item = _new_ad(ad)
     db.add(ad_item)
-    db.add_all([Photo(**photo.dict(), ad=ad_item) for photo in ad.photos])
+    db.flush()
+    db.execute(_insert_card, _card_params(ad_item.id, ad))
+    _index_ads(db, [ad_item.id])
+    db.execute(_count_created(1))
     db.commit()
+    _ads_created()
     db.refresh(ad_item)
 
     return ad_item
+
+
+def save_ads(db: Session, ads: List[AdIn]) -> List[int]:
+    ids = _insert_ads(db, ads)
+    db.commit()
+    _ads_created()
+
+    return ids
+
+
+async def get_ads_async(
+    db: AsyncSession,
+    date_order: Optional[SortOrder],
+    price_order: Optional[SortOrder],
+    page: int,
+    after: Optional[List[Any]] = None,
+    filters: AdFilters = NO_FILTERS
+) -> List[AdCard]:
+    return (await db.execute(_ads_statement(date_order, price_order, page, after, filters=filters))).scalars().all()
+
+
+async def get_ads_page_async(
+    db: AsyncSession,
+    date_order: Optional[SortOrder],
+    price_order: Optional[SortOrder],
+    page: int,
+    after: Optional[List[Any]] = None,
+    filters: AdFilters = NO_FILTERS
+) -> Tuple[List[AdCard], bool]:
+    statement = _ads_statement(date_order, price_order, page, after, PAGE_SIZE + 1, filters)
+    ads = (await db.execute(statement)).scalars().all()
+
+    return ads[:PAGE_SIZE], len(ads) > PAGE_SIZE
+
+
+async def count_ads_async(db: AsyncSession, exact: bool = False, filters: AdFilters = NO_FILTERS) -> int:
+    return await db.run_sync(count_ads, exact, filters)
+
+
+async def search_ads_async(
+    db: AsyncSession,
+    q: str,
+    date_order: Optional[SortOrder],
+    price_order: Optional[SortOrder],
+    page: int
+) -> List[Ad]:
+    return await db.run_sync(search_ads, q, date_order, price_order, page)
+
+
+async def get_ad_by_id_async(
+    db: AsyncSession, id: int, description: bool = False, photos: bool = False
+) -> Optional[Ad]:
+    # lazy loading is not available on AsyncSession, so nothing left out may be read from the ad
+    return (await db.execute(_ad_statement(id, description, photos))).unique().scalar_one_or_none()
+
+
+async def export_ads_async(
+    db: AsyncSession, since_id: Optional[int] = None, since_date: Optional[datetime.datetime] = None
+) -> AsyncIterator[Ad]:
+    async for ad in (await db.stream(_export_statement(since_id, since_date))).scalars():
+        yield ad
+
+
+async def save_ad_async(db: AsyncSession, ad: AdIn) -> Ad:
+    ad_item = _new_ad(ad)
+    db.add(ad_item)
+    await db.flush()
+    await db.execute(_insert_card, _card_params(ad_item.id, ad))
+    await db.run_sync(_index_ads, [ad_item.id])
+    await db.execute(_count_created(1))
+    await db.commit()
+    _ads_created()
+    await db.refresh(ad_item)
+
+    return ad_item
+
+
+async def save_ads_async(db: AsyncSession, ads: List[AdIn]) -> List[int]:
+    ids = await db.run_sync(_insert_ads, ads)
+    await db.commit()
+    _ads_created()
+
+    return ids
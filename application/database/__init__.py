@@ -1,22 +1,225 @@
-from sqlalchemy import create_engine
+import math
+import time
+from typing import Optional, Type
+
+from fastapi import Request, Response
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-from ..config import get_config
+from ..config import Config, get_config
+from .pool import InstrumentedAsyncAdaptedQueuePool, InstrumentedQueuePool
+from .replicas import ReplicaSession, ReplicaSet
 
 config = get_config()
 
 SQLALCHEMY_DATABASE_URL = config.SQLALCHEMY_DATABASE_URL
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def engine_options(url: str, is_async: bool = False, config: Type[Config] = config) -> dict:
+    backend = make_url(url).get_backend_name()
+    options = dict(
+        poolclass=InstrumentedAsyncAdaptedQueuePool if is_async else InstrumentedQueuePool,
+        pool_size=config.DATABASE_POOL_SIZE,
+        max_overflow=config.DATABASE_MAX_OVERFLOW,
+        pool_timeout=config.DATABASE_POOL_TIMEOUT,
+        pool_recycle=config.DATABASE_POOL_RECYCLE,
+        pool_pre_ping=config.DATABASE_POOL_PRE_PING
+    )
+
+    if backend == 'sqlite':
+        # sessions are closed in another threadpool thread than the one that used them
+        options['connect_args'] = {'check_same_thread': False, 'timeout': config.SQLITE_BUSY_TIMEOUT}
+    elif backend == 'postgresql' and config.DATABASE_STATEMENT_TIMEOUT:
+        if is_async:
+            options['connect_args'] = {'server_settings': {'statement_timeout': str(config.DATABASE_STATEMENT_TIMEOUT)}}
+        else:
+            options['connect_args'] = {'options': f'-c statement_timeout={config.DATABASE_STATEMENT_TIMEOUT}'}
+
+    return options
+
+
+def set_sqlite_pragmas(engine: Engine, config: Type[Config] = config):
+    pragmas = {
+        'journal_mode': config.SQLITE_JOURNAL_MODE,
+        'synchronous': config.SQLITE_SYNCHRONOUS,
+        'mmap_size': config.SQLITE_MMAP_SIZE,
+        'cache_size': config.SQLITE_CACHE_SIZE
+    }
+
+    @event.listens_for(engine, 'connect')
+    def connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            if value is not None:
+                cursor.execute(f'PRAGMA {name} = {value}')
+        cursor.close()
+
+
+def _create_engine(url: str, config: Type[Config]) -> Engine:
+    engine = create_engine(url, **engine_options(url, config=config))
+
+    if engine.dialect.name == 'sqlite':
+        set_sqlite_pragmas(engine, config)
+
+    return engine
+
+
+def _create_async_engine(url: str, config: Type[Config]) -> AsyncEngine:
+    engine = create_async_engine(url, **engine_options(url, is_async=True, config=config))
+
+    if engine.dialect.name == 'sqlite':
+        set_sqlite_pragmas(engine.sync_engine, config)
+
+    return engine
+
+
+# created by connect() when the app starts, so that importing the package opens nothing
+# and every worker process of the server gets engines and pools of its own
+engine: Optional[Engine] = None
+async_engine: Optional[AsyncEngine] = None
+replicas = ReplicaSet([])
+async_replicas = ReplicaSet([])
+# the config the engines above were created from
+connected_config: Optional[Type[Config]] = None
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+AsyncSessionLocal = sessionmaker(class_=AsyncSession, autoflush=False, expire_on_commit=False)
+# bound to the replica of each read, falling back to the primary
+ReplicaSessionLocal = sessionmaker(class_=ReplicaSession, autocommit=False, autoflush=False)
+AsyncReplicaSessionLocal = sessionmaker(
+    class_=AsyncSession, sync_session_class=ReplicaSession, autoflush=False, expire_on_commit=False
+)
+
+
+def connect(config: Type[Config] = config) -> Engine:
+    """Create the engines of the config and bind the session factories to them, once; returns the primary engine.
+
+    The engines and the session factories are shared by the process, so connecting with another config
+    before disconnect() raises a RuntimeError rather than handing out the engines of the first one.
+    """
+    global engine, async_engine, replicas, async_replicas, connected_config
+
+    if engine is not None:
+        if config is not connected_config:
+            raise RuntimeError(
+                f'The database is connected with {connected_config.__name__}, disconnect it before connecting '
+                f'with {config.__name__}'
+            )
+        return engine
+
+    connected_config = config
+
+    engine = _create_engine(config.SQLALCHEMY_DATABASE_URL, config)
+    replicas = ReplicaSet(
+        [_create_engine(url, config) for url in config.DATABASE_REPLICA_URLS],
+        config.DATABASE_REPLICA_STRATEGY,
+        config.DATABASE_REPLICA_RETRY_AFTER
+    )
+    # the async driver is only imported when the async mode is enabled
+    if config.ASYNC_DATABASE:
+        async_engine = _create_async_engine(config.SQLALCHEMY_ASYNC_DATABASE_URL, config)
+        async_replicas = ReplicaSet(
+            [_create_async_engine(url, config) for url in config.ASYNC_DATABASE_REPLICA_URLS],
+            config.DATABASE_REPLICA_STRATEGY,
+            config.DATABASE_REPLICA_RETRY_AFTER
+        )
+
+    SessionLocal.configure(bind=engine)
+    AsyncSessionLocal.configure(bind=async_engine)
+
+    return engine
+
+
+async def disconnect():
+    """Close the connections of all engines and forget them, connect() creates new ones."""
+    global engine, async_engine, replicas, async_replicas, connected_config
+
+    if engine is not None:
+        engine.dispose()
+    if async_engine is not None:
+        await async_engine.dispose()
+    for replica in replicas.engines:
+        replica.dispose()
+    for replica in async_replicas.engines:
+        await replica.dispose()
+
+    engine, async_engine, connected_config = None, None, None
+    replicas, async_replicas = ReplicaSet([]), ReplicaSet([])
+    SessionLocal.configure(bind=None)
+    AsyncSessionLocal.configure(bind=None)
+
+
+# Unix time until which the reads of the client go to the primary, set when it creates ads
+READ_PRIMARY_COOKIE = 'read_primary_until'
 
 Base = declarative_base()
 
 
+def stick_to_primary(response: Response):
+    """Send the reads of the client to the primary for DATABASE_REPLICA_STICKY_SECONDS, so that it sees its writes."""
+    if not (replicas or async_replicas):
+        return
+
+    # the config of the app that connected, which create_app() may have been given instead of the environment's
+    sticky_seconds = (connected_config or config).DATABASE_REPLICA_STICKY_SECONDS
+    response.set_cookie(
+        READ_PRIMARY_COOKIE,
+        f'{time.time() + sticky_seconds:.3f}',
+        max_age=math.ceil(sticky_seconds),
+        httponly=True,
+        samesite='lax'
+    )
+
+
+def _reads_primary(request: Request) -> bool:
+    try:
+        return float(request.cookies.get(READ_PRIMARY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def read_source(request: Request) -> str:
+    """'replica' when the read session of the request is on a replica, which may lag behind, 'primary' otherwise."""
+    return 'replica' if getattr(request.state, 'read_replica', False) else 'primary'
+
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+def get_read_db(request: Request):
+    """A session on a replica for the routes that only read, on the primary if there is none available.
+
+    A replica that turns out to be down when the session first connects costs a retry on the primary rather than
+    a failed request, see ReplicaSession.
+    """
+    replica = None if _reads_primary(request) else replicas.choose()
+    db = ReplicaSessionLocal(bind=replica, info={'primary': engine}) if replica is not None else SessionLocal()
+
+    request.state.read_replica = replica is not None
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_async_read_db(request: Request):
+    replica = None if _reads_primary(request) else async_replicas.choose()
+    db = AsyncReplicaSessionLocal(bind=replica, info={'primary': async_engine.sync_engine}) \
+        if replica is not None else AsyncSessionLocal()
+
+    request.state.read_replica = replica is not None
+    async with db:
+        yield db
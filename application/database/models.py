@@ -1,8 +1,15 @@
-from sqlalchemy import Column, DECIMAL, DateTime, ForeignKey, func, Integer, String
+from sqlalchemy import (
+    BigInteger, Column, DDL, DECIMAL, DateTime, event, ForeignKey, func, Index, Integer, JSON, String, Text
+)
+from sqlalchemy.dialects import sqlite
 from sqlalchemy.orm import relationship
 
 from . import Base
 
+# CURRENT_TIMESTAMP has no fractional seconds on sqlite, so values bound
+# from python are stored the same way to keep keyset comparisons exact
+AdDate = DateTime().with_variant(sqlite.DATETIME(truncate_microseconds=True), 'sqlite')
+
 
 class Ad(Base):
     __tablename__ = 'ad'
@@ -13,11 +20,56 @@ class Ad(Base):
 
     description = Column(String(1000), nullable=False)
 
-    price = Column(DECIMAL, index=True)
+    price = Column(DECIMAL)
+
+    date = Column(AdDate, server_default=func.now())
+
+    # denormalized url of the first photo, so list pages never touch the photo table
+    main_photo_url = Column(String(512))
+
+    # the URLs of the photos, in order, written along with the photo rows: an ad has at most 3 of them,
+    # so with PHOTO_STORAGE=embedded an ad and its photos are read in a single primary key lookup
+    photo_urls = Column(JSON)
+
+    photos = relationship('Photo', back_populates='ad', order_by='Photo.id')
+
+    __table_args__ = (
+        # the list reads ad_card; these serve the export since a date and the search ordered by date or price
+        Index('ix_ad_date_id', 'date', 'id'),
+        Index('ix_ad_price_id', 'price', 'id'),
+    )
+
+
+class AdCard(Base):
+    """Read model of the ad list: what a list item shows and the sort keys, written in the transaction of the ad.
+
+    The rows are narrow, so a page is read from an index without touching the wide ad rows.
+    """
+
+    __tablename__ = 'ad_card'
+
+    id = Column(Integer, ForeignKey('ad.id'), primary_key=True)
+
+    name = Column(String(200), nullable=False)
+
+    price = Column(DECIMAL)
+
+    date = Column(AdDate)
+
+    main_photo_url = Column(String(512))
 
-    date = Column(DateTime, index=True, server_default=func.now())
+    # the AdShort JSON rendered when the ad was written, NULL for the rows rendered when read
+    json = Column(Text)
 
-    photos = relationship('Photo', back_populates='ad')
+    __table_args__ = (
+        # keyset pagination indexes, one per date_order/price_order combination
+        # (a backward scan serves the opposite directions); the trailing column of the
+        # single-key ones lets a range filter on the other key be checked in the index
+        Index('ix_ad_card_date_id_price', 'date', 'id', 'price'),
+        Index('ix_ad_card_price_id_date', 'price', 'id', 'date'),
+        Index('ix_ad_card_date_price_id', 'date', 'price', 'id'),
+        Index('ix_ad_card_date_price_desc_id_desc', date, price.desc(), id.desc()),
+    )
 
 
 class Photo(Base):
@@ -27,6 +79,49 @@ class Photo(Base):
 
     url = Column(String(512), nullable=False)
 
-    ad_id = Column(Integer, ForeignKey('ad.id'))
+    ad_id = Column(Integer, ForeignKey('ad.id'), index=True)
 
     ad = relationship('Ad', back_populates='photos')
+
+
+# rows of ad_count: concurrent inserts each update one of them, picked at random, instead of all waiting
+# for the lock of a single row until they commit
+AD_COUNT_SHARDS = 16
+
+
+class AdCount(Base):
+    """Number of ads, the sum of AD_COUNT_SHARDS rows kept up to date in the transactions that create ads."""
+
+    __tablename__ = 'ad_count'
+
+    id = Column(Integer, primary_key=True)
+
+    value = Column(BigInteger, nullable=False)
+
+
+event.listen(AdCount.__table__, 'after_create', DDL(
+    'INSERT INTO ad_count (id, value) VALUES ' + ', '.join(f'({id}, 0)' for id in range(1, AD_COUNT_SHARDS + 1))
+))
+
+
+# Full-text index over the name and the description, kept out of the ORM as it has no portable form:
+# a weighted tsvector per ad behind a GIN index on PostgreSQL, a contentless FTS5 table keyed by ad ID on SQLite.
+# 'simple' does no stemming, the ads are written in several languages.
+TEXT_SEARCH_CONFIG = 'simple'
+
+SEARCH_DOCUMENT = (
+    f"setweight(to_tsvector('{TEXT_SEARCH_CONFIG}', name), 'A') || "
+    f"setweight(to_tsvector('{TEXT_SEARCH_CONFIG}', description), 'B')"
+)
+
+for statement in (
+    'CREATE TABLE ad_search (ad_id INTEGER PRIMARY KEY REFERENCES ad (id), document TSVECTOR NOT NULL)',
+    'CREATE INDEX ix_ad_search_document ON ad_search USING gin (document)'
+):
+    event.listen(Ad.__table__, 'after_create', DDL(statement).execute_if(dialect='postgresql'))
+
+event.listen(Ad.__table__, 'after_create', DDL(
+    "CREATE VIRTUAL TABLE ad_search USING fts5(name, description, content='')"
+).execute_if(dialect='sqlite'))
+
+event.listen(Ad.__table__, 'before_drop', DDL('DROP TABLE IF EXISTS ad_search'))
@@ -0,0 +1,57 @@
+import threading
+import time
+
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool
+
+
+class _CheckoutTimer:
+    """Measures how long checkouts wait for a connection, opening a new one included."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.checkout_time = 0.0
+        self.max_checkout_time = 0.0
+        self._stats_lock = threading.Lock()
+
+    def _do_get(self):
+        started_at = time.perf_counter()
+
+        try:
+            return super()._do_get()
+        finally:
+            elapsed = time.perf_counter() - started_at
+
+            with self._stats_lock:
+                self.checkouts += 1
+                self.checkout_time += elapsed
+                self.max_checkout_time = max(self.max_checkout_time, elapsed)
+
+
+class InstrumentedQueuePool(_CheckoutTimer, QueuePool):
+    pass
+
+
+class InstrumentedAsyncAdaptedQueuePool(_CheckoutTimer, AsyncAdaptedQueuePool):
+    pass
+
+
+def pool_status(pool: Pool) -> dict:
+    status = {'class': type(pool).__name__}
+
+    if isinstance(pool, QueuePool):
+        status.update(
+            size=pool.size(),
+            max_overflow=pool._max_overflow,
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=max(pool.overflow(), 0)
+        )
+    if isinstance(pool, _CheckoutTimer):
+        status.update(
+            checkouts=pool.checkouts,
+            checkout_time=pool.checkout_time,
+            max_checkout_time=pool.max_checkout_time
+        )
+
+    return status
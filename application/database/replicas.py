@@ -0,0 +1,91 @@
+import functools
+import itertools
+import logging
+import time
+from typing import Any, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import ExceptionContext
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+STRATEGIES = ('round_robin', 'least_connections')
+
+
+def _sync_engine(engine: Any):
+    # AsyncEngine events and pools live on its sync_engine
+    return getattr(engine, 'sync_engine', engine)
+
+
+class ReplicaSet:
+    """Picks the replica engine a read goes to, by round-robin or by fewest checked out connections.
+
+    A replica that fails to connect or loses its connection is left out for ``retry_after`` seconds, then
+    tried again by the next read. choose() returns None when no replica is available, reads then go to the primary.
+    """
+
+    def __init__(self, engines: List[Any], strategy: str = 'round_robin', retry_after: float = 30):
+        if strategy not in STRATEGIES:
+            raise ValueError(f'Unknown replica strategy: {strategy}')
+
+        self.engines = list(engines)
+        self.strategy = strategy
+        self.retry_after = retry_after
+        self._down_until = [0.0] * len(self.engines)
+        self._turn = itertools.count()
+
+        for index, engine in enumerate(self.engines):
+            event.listen(_sync_engine(engine), 'handle_error', functools.partial(self._handle_error, index))
+
+    def __bool__(self) -> bool:
+        return bool(self.engines)
+
+    def choose(self) -> Optional[Any]:
+        now = time.monotonic()
+        available = [engine for engine, down_until in zip(self.engines, self._down_until) if down_until <= now]
+
+        if not available:
+            return None
+
+        # rotating the candidates spreads the ties of least_connections as well
+        turn = next(self._turn) % len(available)
+        available = available[turn:] + available[:turn]
+
+        if self.strategy == 'least_connections':
+            return min(available, key=lambda engine: _sync_engine(engine).pool.checkedout())
+
+        return available[0]
+
+    def is_down(self, engine: Any) -> bool:
+        return self._down_until[self.engines.index(engine)] > time.monotonic()
+
+    def _handle_error(self, index: int, context: ExceptionContext):
+        # no connection means it could not be opened; errors of a statement on a live connection do not count
+        if context.connection is None or context.is_disconnect:
+            self._down_until[index] = time.monotonic() + self.retry_after
+            logger.warning(
+                'Replica %s is unavailable, reads go to the other databases for %.0f s: %s',
+                _sync_engine(self.engines[index]).url, self.retry_after, context.original_exception
+            )
+
+
+class ReplicaSession(Session):
+    """A session on a replica that moves to the primary engine, ``info['primary']``, if the replica fails to connect.
+
+    The connection is only opened on first use, so reads served from the caches never check one out. The failure
+    marks the replica down in its ReplicaSet, which leaves it out of the next reads.
+    """
+
+    def _connection_for_bind(self, engine, execution_options=None, **kw):
+        try:
+            return super()._connection_for_bind(engine, execution_options, **kw)
+        except DBAPIError:
+            primary = self.info.get('primary')
+            if primary is None or engine is primary:
+                raise
+
+            logger.warning('Read retried on the primary database')
+            self.bind = primary
+            return super()._connection_for_bind(primary, execution_options, **kw)
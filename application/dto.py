@@ -3,6 +3,10 @@ from typing import List, Optional
 
 from pydantic import BaseModel, Field, HttpUrl, condecimal, conlist, constr
 
+from .config import get_config
+
+config = get_config()
+
 
 class Message(BaseModel):
     detail: str = Field(..., example='NOT_FOUND')
@@ -31,6 +35,9 @@ class AdIn(AdBase):
     photos: conlist(Photo, min_items=1, max_items=3)
 
 
+AdBatchIn = conlist(AdIn, min_items=1, max_items=config.AD_BATCH_MAX_SIZE)
+
+
 class AdCreated(BaseModel):
     id: int = Field(..., title='Ad ID', example=1)
 
@@ -56,3 +63,15 @@ class AdOut(AdShort):
 
     class Config:
         orm_mode = True
+
+
+class AdPage(BaseModel):
+    items: List[AdShort]
+
+    total: int = Field(
+        ..., title='Number of ads, estimated for large tables and capped when filtered, unless exact=true', example=42
+    )
+
+    pages: int = Field(..., example=5)
+
+    has_next: bool = Field(..., example=True)
@@ -0,0 +1,223 @@
+"""Bulk import of ads from a JSONL dump, one AdIn object per line.
+
+    python -m application.importer ads.jsonl [--batch-size 10000] [--jobs 4]
+
+Lines are validated in parallel processes. Every ad is inserted in a single transaction:
+COPY on PostgreSQL, batched executemany on SQLite. Invalid lines are reported and skipped.
+"""
+import argparse
+import asyncio
+import contextlib
+import csv
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+from decimal import Decimal
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy.engine import Engine
+
+from . import cache, database
+from .crud import card_json
+from .database.models import AD_COUNT_SHARDS, SEARCH_DOCUMENT
+from .dto import AdIn
+
+BATCH_SIZE = 10_000
+
+# name, description, price, photo URLs
+Row = Tuple[str, str, Decimal, List[str]]
+
+
+def _chunks(items: Iterable, size: int) -> Iterator[list]:
+    items = iter(items)
+    chunk = list(itertools.islice(items, size))
+
+    while chunk:
+        yield chunk
+        chunk = list(itertools.islice(items, size))
+
+
+def _validate(lines: List[Tuple[int, str]]) -> Tuple[List[Row], List[str]]:
+    rows, errors = [], []
+
+    for line_number, line in lines:
+        if not line.strip():
+            continue
+
+        try:
+            ad = AdIn.parse_raw(line)
+        except ValidationError as e:
+            errors.append(f'line {line_number}: {e.json(indent=None)}')
+        else:
+            # plain tuples are much cheaper than models to send back from the worker processes
+            rows.append((ad.name, ad.description, ad.price, [str(photo.url) for photo in ad.photos]))
+
+    return rows, errors
+
+
+def read_ads(
+    lines: Iterable[str], batch_size: int = BATCH_SIZE, jobs: int = 1, errors=sys.stderr
+) -> Iterator[List[Row]]:
+    """Validate the lines against AdIn, in ``jobs`` processes, and yield them in batches of valid rows."""
+    chunks = _chunks(enumerate(lines, 1), batch_size)
+
+    with contextlib.ExitStack() as stack:
+        if jobs > 1:
+            results = stack.enter_context(multiprocessing.Pool(jobs)).imap(_validate, chunks)
+        else:
+            results = map(_validate, chunks)
+
+        for rows, chunk_errors in results:
+            for error in chunk_errors:
+                print(error, file=errors)
+            if rows:
+                yield rows
+
+
+def _copy(cursor, table: str, columns: Tuple[str, ...], rows: Iterable[tuple]):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    cursor.copy_expert(f'COPY {table} ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)', buffer)
+
+
+def _import_postgresql(connection, batches: Iterable[List[Row]]) -> Iterator[int]:
+    cursor = connection.cursor()
+
+    for batch in batches:
+        # IDs are taken from the sequence up front, so photos can reference them within the same COPY stream
+        cursor.execute("SELECT nextval(pg_get_serial_sequence('ad', 'id')) FROM generate_series(1, %s)", (len(batch),))
+        ids = [id for id, in cursor.fetchall()]
+
+        _copy(cursor, 'ad', ('id', 'name', 'description', 'price', 'main_photo_url', 'photo_urls'), (
+            (id, name, description, price, urls[0], json.dumps(urls))
+            for id, (name, description, price, urls) in zip(ids, batch)
+        ))
+        _copy(cursor, 'photo', ('url', 'ad_id'), (
+            (url, id) for id, (*_, urls) in zip(ids, batch) for url in urls
+        ))
+        # the dates are set by the database, so the cards are taken from the ads
+        cursor.execute(
+            'INSERT INTO ad_card (id, name, price, date, main_photo_url, json) '
+            'SELECT ad.id, ad.name, ad.price, ad.date, ad.main_photo_url, card.json '
+            'FROM unnest(%s::integer[], %s::text[]) AS card (id, json) JOIN ad ON ad.id = card.id',
+            (ids, [card_json(id, name, price, urls[0]) for id, (name, _, price, urls) in zip(ids, batch)])
+        )
+        cursor.execute(
+            f'INSERT INTO ad_search (ad_id, document) SELECT id, {SEARCH_DOCUMENT} FROM ad WHERE id = ANY(%s)', (ids,)
+        )
+        cursor.execute(
+            'UPDATE ad_count SET value = value + %s WHERE id = %s', (len(batch), random.randint(1, AD_COUNT_SHARDS))
+        )
+
+        yield len(batch)
+
+
+def _import_sqlite(connection, batches: Iterable[List[Row]]) -> Iterator[int]:
+    cursor = connection.cursor()
+    # durability is only needed once the import is committed, and the whole database is written anyway
+    cursor.execute('PRAGMA synchronous = OFF')
+    cursor.execute('PRAGMA temp_store = MEMORY')
+    cursor.execute('PRAGMA cache_size = -262144')  # 256 MiB
+    # the write lock is held until commit, so IDs can be assigned here
+    cursor.execute('BEGIN IMMEDIATE')
+    next_id = cursor.execute('SELECT coalesce(max(id), 0) + 1 FROM ad').fetchone()[0]
+
+    for batch in batches:
+        ids = range(next_id, next_id + len(batch))
+        next_id += len(batch)
+
+        cursor.executemany(
+            'INSERT INTO ad (id, name, description, price, main_photo_url, photo_urls) VALUES (?, ?, ?, ?, ?, ?)',
+            [
+                (id, name, description, float(price), urls[0], json.dumps(urls))
+                for id, (name, description, price, urls) in zip(ids, batch)
+            ]
+        )
+        cursor.executemany(
+            'INSERT INTO photo (url, ad_id) VALUES (?, ?)',
+            [(url, id) for id, (*_, urls) in zip(ids, batch) for url in urls]
+        )
+        cursor.executemany(
+            'INSERT INTO ad_card (id, name, price, date, main_photo_url, json) '
+            'SELECT id, name, price, date, main_photo_url, ? FROM ad WHERE id = ?',
+            [(card_json(id, name, price, urls[0]), id) for id, (name, _, price, urls) in zip(ids, batch)]
+        )
+        cursor.execute(
+            'INSERT INTO ad_search (rowid, name, description) '
+            'SELECT id, name, description FROM ad WHERE id BETWEEN ? AND ?',
+            (ids[0], ids[-1])
+        )
+        cursor.execute(
+            'UPDATE ad_count SET value = value + ? WHERE id = ?', (len(batch), random.randint(1, AD_COUNT_SHARDS))
+        )
+
+        yield len(batch)
+
+
+def import_ads(batches: Iterable[List[Row]], engine: Optional[Engine] = None, progress=None) -> int:
+    # the engine of the app by default, created for the command line
+    engine = engine or database.connect()
+
+    importers = {
+        'postgresql': _import_postgresql,
+        'sqlite': _import_sqlite
+    }
+
+    if engine.dialect.name not in importers:
+        raise ValueError(f'Unsupported database: {engine.dialect.name}')
+
+    started_at = time.perf_counter()
+    total = 0
+    connection = engine.raw_connection()
+    # the connection is tuned for the import, so it is closed afterwards instead of going back to the pool
+    connection.detach()
+
+    try:
+        for count in importers[engine.dialect.name](connection, batches):
+            total += count
+            if progress is not None:
+                elapsed = time.perf_counter() - started_at
+                print(f'{total} ads, {total / elapsed:.0f} rows/s', file=progress)
+        connection.commit()
+    except BaseException:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+    # the pages and 404s cached under the previous version are stale, in the servers sharing the backend too
+    cache.ad_pages.bump()
+
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m application.importer', description='Import ads from a JSONL file')
+    parser.add_argument('file', type=argparse.FileType('r', encoding='utf-8'), help='one AdIn JSON object per line')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='ads per COPY or executemany')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(), help='processes validating the input')
+    args = parser.parse_args(argv)
+
+    started_at = time.perf_counter()
+    try:
+        with args.file:
+            total = import_ads(read_ads(args.file, args.batch_size, args.jobs), progress=sys.stdout)
+    finally:
+        asyncio.run(database.disconnect())
+    elapsed = time.perf_counter() - started_at
+
+    print(f'Imported {total} ads in {elapsed:.1f}s ({total / elapsed if elapsed else 0:.0f} rows/s)')
+    if isinstance(cache.ad_pages.backend, cache.InMemoryBackend):
+        # the version bumped by the import is the one of this process
+        print('The list cache is per process: restart the running servers to serve the imported ads')
+
+
+if __name__ == '__main__':
+    main()
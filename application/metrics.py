@@ -0,0 +1,269 @@
+"""Prometheus metrics: request latency per route template, SQL statements per route, pool and cache gauges.
+Also logs slow statements and checks the per-route query budgets.
+
+Metrics are per process. Everything is recorded on the event loop thread once a response is sent, and SQL
+statements are counted on a per-request object, so no locks are taken on the hot path.
+"""
+import bisect
+import contextvars
+import logging
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from . import cache
+from .config import get_config
+from .database.pool import pool_status
+
+config = get_config()
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+UNMATCHED_ROUTE = '<unmatched>'
+
+
+def _labels(names: Tuple[str, ...], values: Tuple) -> str:
+    pairs = (
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in zip(names, values)
+    )
+
+    return '{' + ','.join(pairs) + '}' if names else ''
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values: Dict[Tuple, float] = {}
+
+    def inc(self, labels: Tuple = (), amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> Iterator[str]:
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} counter'
+        for labels, value in self.values.items():
+            yield f'{self.name}{_labels(self.labelnames, labels)} {value}'
+
+
+class Histogram:
+    def __init__(
+        self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # per labels: a count per bucket (the last one is +Inf), the sum and the total count
+        self.values: Dict[Tuple, list] = {}
+
+    def observe(self, labels: Tuple, value: float):
+        try:
+            counts, total = self.values[labels]
+        except KeyError:
+            counts, total = self.values[labels] = [[0] * (len(self.buckets) + 1), [0.0, 0]]
+
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        total[0] += value
+        total[1] += 1
+
+    def render(self) -> Iterator[str]:
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} histogram'
+        for labels, (counts, (total, count)) in self.values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                yield f'{self.name}_bucket{_labels(self.labelnames + ("le",), labels + (le,))} {cumulative}'
+            yield f'{self.name}_sum{_labels(self.labelnames, labels)} {total}'
+            yield f'{self.name}_count{_labels(self.labelnames, labels)} {count}'
+
+
+class Gauge:
+    """Sampled from ``collect`` at scrape time."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...], collect: Callable):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.collect = collect
+
+    def render(self) -> Iterator[str]:
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} gauge'
+        for labels, value in self.collect():
+            yield f'{self.name}{_labels(self.labelnames, labels)} {value}'
+
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+
+def query_budget(limit: int):
+    """Caps the number of SQL statements a route may issue per request, see QUERY_BUDGET_ENFORCED."""
+
+    def decorator(endpoint):
+        endpoint.query_budget = limit
+        return endpoint
+
+    return decorator
+
+
+_route_templates: Dict[Callable, str] = {}
+
+
+def route_template(scope) -> str:
+    endpoint = scope.get('endpoint')
+
+    if endpoint is None:
+        return UNMATCHED_ROUTE
+    if endpoint not in _route_templates:
+        _route_templates.update(
+            (route.endpoint, route.path) for route in scope['app'].routes if hasattr(route, 'endpoint')
+        )
+
+    return _route_templates.setdefault(endpoint, UNMATCHED_ROUTE)
+
+
+class RequestStats:
+    __slots__ = ('scope', 'statements', 'statement_time')
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.statements = 0
+        self.statement_time = 0.0
+
+
+current_request: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar('current_request', default=None)
+
+request_duration = Histogram(
+    'http_request_duration_seconds', 'HTTP request latency, by route template', ('route', 'method', 'status')
+)
+db_statements = Counter('db_statements_total', 'SQL statements executed, by route template', ('route',))
+db_statement_time = Counter(
+    'db_statement_duration_seconds_total', 'Time spent executing SQL statements, by route template', ('route',)
+)
+
+engines: Dict[str, Engine] = {}
+
+
+def _pool_gauges(key: str) -> Callable:
+    def collect():
+        for name, engine in engines.items():
+            status = pool_status(engine.pool)
+            if key in status:
+                yield (name,), status[key]
+
+    return collect
+
+
+def _cache_gauges(key: str) -> Callable:
+    def collect():
+        yield ('ads',), cache.ads.stats()[key]
+        yield ('missing_ads',), cache.missing_ads.stats()[key]
+
+    return collect
+
+
+registry: List = [
+    request_duration,
+    db_statements,
+    db_statement_time,
+    Gauge('db_pool_size', 'Connections kept by the pool', ('engine',), _pool_gauges('size')),
+    Gauge('db_pool_checked_out', 'Connections in use', ('engine',), _pool_gauges('checked_out')),
+    Gauge('db_pool_overflow', 'Connections open above the pool size', ('engine',), _pool_gauges('overflow')),
+    Gauge('db_pool_checkouts', 'Connection checkouts since start', ('engine',), _pool_gauges('checkouts')),
+    Gauge(
+        'db_pool_checkout_seconds', 'Time spent waiting for connections since start', ('engine',),
+        _pool_gauges('checkout_time')
+    ),
+    Gauge('cache_entries', 'Entries held by the cache', ('cache',), _cache_gauges('size')),
+    Gauge('cache_hits', 'Cache hits since start', ('cache',), _cache_gauges('hits')),
+    Gauge('cache_misses', 'Cache misses since start', ('cache',), _cache_gauges('misses')),
+    Gauge('cache_evictions', 'Cache evictions since start', ('cache',), _cache_gauges('evictions')),
+]
+
+
+def render() -> str:
+    return '\n'.join(line for metric in registry for line in metric.render()) + '\n'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # kept on the execution context rather than the connection, so a statement that raises leaves nothing behind
+    context._query_started_at = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._query_started_at
+    stats = current_request.get()
+
+    if stats is not None:
+        stats.statements += 1
+        stats.statement_time += elapsed
+
+    if config.SLOW_QUERY_THRESHOLD and elapsed >= config.SLOW_QUERY_THRESHOLD:
+        logger.warning(
+            'Slow query (%.1f ms) on %s: %s; parameters: %r',
+            elapsed * 1000,
+            f'{stats.scope["method"]} {route_template(stats.scope)}' if stats is not None else '-',
+            statement,
+            parameters
+        )
+
+
+def instrument_engine(name: str, engine: Engine):
+    """Count and time the statements of the engine (the sync_engine of an AsyncEngine) and report its pool."""
+    engines[name] = engine
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+class MetricsMiddleware:
+    """Plain ASGI middleware: BaseHTTPMiddleware would add a task per request and buffer streaming responses."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        status = 500
+        stats = RequestStats(scope)
+        token = current_request.set(stats)
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        started_at = time.perf_counter()
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started_at
+            current_request.reset(token)
+
+            route = route_template(scope)
+            request_duration.observe((route, scope['method'], status), elapsed)
+            if stats.statements:
+                db_statements.inc((route,), stats.statements)
+                db_statement_time.inc((route,), stats.statement_time)
+
+        budget = getattr(scope.get('endpoint'), 'query_budget', None)
+
+        if budget is not None and stats.statements > budget:
+            message = f'{scope["method"]} {route} issued {stats.statements} SQL statements, the budget is {budget}'
+            # the response is already sent, so this fails the test client but not the client of a server
+            if config.QUERY_BUDGET_ENFORCED:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
@@ -1,47 +1,249 @@
+import datetime
+from decimal import Decimal
 from enum import Enum
-from typing import List, Optional
+from typing import Any, List, Optional, Union
 
-from fastapi import APIRouter, Depends, Path, Query
+from fastapi import APIRouter, Depends, Path, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from fastapi.exceptions import HTTPException
 from sqlalchemy.orm import Session
 
-from .. import crud
+from .. import cache, crud
+from ..config import get_config
 from ..crud import SortOrder
-from ..database import get_db
-from ..dto import AdCreated, AdIn, AdOut, AdShort, Message
+from ..database import get_db, get_read_db, read_source, stick_to_primary
+from ..database.models import Ad, AdCard
+from ..dto import AdBatchIn, AdCreated, AdIn, AdOut, AdPage, AdShort, Message
+from ..metrics import query_budget
+from ..serializers import dumps, Serializer
+
+config = get_config()
 
 router = APIRouter(prefix='/ad', tags=['ad'])
 
 
-@router.get('/', response_model=List[AdShort], summary='Get a paginated list of ads')
-def get_ads(
-    date_order: Optional[SortOrder] = Query(None, title='Sort by date'),
-    price_order: Optional[SortOrder] = Query(None, title='Sort by price'),
-    page: Optional[int] = Query(1, ge=1, title='Page number. 10 items per page'),
-    db: Session = Depends(get_db)
-):    
-    return [{
+class ExtraFields(Enum):
+    DESCRIPTION = 'description'
+    PHOTOS = 'photos'
+
+
+# the helpers below are shared with the async routes in ad_async
+
+def parse_cursor(cursor: Optional[str], date_order: Optional[SortOrder], price_order: Optional[SortOrder]):
+    try:
+        return crud.parse_cursor(cursor, date_order, price_order) if cursor is not None else None
+    except crud.InvalidCursor:
+        raise HTTPException(status_code=400, detail='INVALID_CURSOR')
+
+
+def ad_short(ad: Ad) -> dict:
+    return {
         'id': ad.id,
         'name': ad.name,
         'price': ad.price,
-        'main_photo': ad.photos[0]
-    } for ad in crud.get_ads(db, date_order, price_order, page)]
+        'main_photo': {'url': ad.main_photo_url}
+    }
 
 
-@router.post('/', status_code=201, response_model=AdCreated, summary='Create a new ad')
-def add_ad(ad: AdIn, db: Session = Depends(get_db)):
-    ad = crud.save_ad(db, ad)
+def ad_out(ad: Ad, fields: List[ExtraFields]) -> dict:
+    data = ad_short(ad)
 
-    return ad
+    if ExtraFields.DESCRIPTION in fields:
+        data['description'] = ad.description
+    if ExtraFields.PHOTOS in fields:
+        data['photos'] = [{'url': url} for url in crud.photo_urls(ad)]
 
+    return data
 
-class ExtraFields(Enum):
-    DESCRIPTION = 'description'
-    PHOTOS = 'photos'
+
+ad_out_serializer = Serializer(AdOut, exclude_none=True)
+
+ad_short_serializer = Serializer(AdShort)
+
+
+def render_ad_out(ad: Ad, fields: List[ExtraFields]) -> bytes:
+    return ad_out_serializer.render(ad_out(ad, fields))
+
+
+def render_card(card: AdCard) -> bytes:
+    # the stored JSON is the fast path, FAST_SERIALIZATION=0 renders the card through the model
+    if card.json is not None and config.FAST_SERIALIZATION:
+        return card.json.encode()
+
+    return ad_short_serializer.render(ad_short(card))
+
+
+def render_ads(
+    ads: List[AdCard],
+    date_order: Optional[SortOrder],
+    price_order: Optional[SortOrder],
+    has_next: bool,
+    total: Optional[int] = None
+) -> bytes:
+    next_cursor = crud.make_cursor(ads[-1], date_order, price_order) if has_next else ''
+    content = b'[' + b','.join(render_card(card) for card in ads) + b']'
+
+    if total is not None:
+        # the items are already JSON, so the rest of the AdPage object is rendered around them
+        rest = dumps({'total': total, 'pages': -(-total // crud.PAGE_SIZE), 'has_next': has_next})
+        content = b'{"items":' + content + b',' + rest[1:]
+
+    # the cursor goes first, on its own line, so that a cached page restores the header as well
+    return next_cursor.encode() + b'\n' + content
+
+
+def ads_response(page: bytes, etag: str) -> Response:
+    next_cursor, _, content = page.partition(b'\n')
+    response = Response(content, media_type='application/json', headers={'ETag': etag})
+
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor.decode()
+
+    return response
+
+
+def search_response(ads: List[Ad]) -> Response:
+    return Response(ad_short_serializer.render_many(ad_short(ad) for ad in ads), media_type='application/json')
+
+
+def render_export_line(ad: Ad) -> bytes:
+    return dumps({
+        'id': ad.id,
+        'name': ad.name,
+        'description': ad.description,
+        'price': float(ad.price),
+        'date': ad.date.isoformat(),
+        'photos': [{'url': url} for url in crud.photo_urls(ad)]
+    }) + b'\n'
+
+
+def _key_value(value: Any) -> str:
+    return '' if value is None else value.isoformat() if isinstance(value, datetime.datetime) else str(value)
+
+
+def page_key(
+    source: str,
+    date_order: Optional[SortOrder],
+    price_order: Optional[SortOrder],
+    page: int,
+    after: Optional[List[Any]],
+    filters: crud.AdFilters,
+    envelope: bool,
+    exact: bool
+) -> str:
+    # the key ends up in the ETag, which must not contain commas or spaces. The cursor goes in decoded, so
+    # only a valid one gets there, and its encodings (padding or not) share the page
+    cursor = '' if after is None else '|'.join(_key_value(value) for value in after)
+    bounds = '|'.join(_key_value(value) for value in filters)
+    count = ('exact' if exact else 'count') if envelope else 'list'
+
+    # pages read from a replica are kept apart, so that the reads that go to the primary to see their writes,
+    # and their ETags, never get one that lags behind
+    orders = f'{date_order and date_order.value}:{price_order and price_order.value}'
+
+    return f'{source}:{orders}:{page}:{cursor}:{bounds}:{count}'
+
+
+def ad_etag(ad_id: int, fields: List[ExtraFields], edits: int) -> str:
+    # the ID and the requested fields identify the representation until an ad is edited
+    fields = '.'.join(sorted({field.value for field in fields}))
+
+    return f'"ad-{cache.ad_edits.backend.scope}-{edits}-{ad_id}-{fields}"'
+
+
+def page_etag(version: int, key: str) -> str:
+    return f'"ads-{cache.ad_pages.backend.scope}-{version}-{key}"'
+
+
+def not_modified(request: Request, etag: str, found: bool = False) -> Optional[Response]:
+    """The 304 response if the client has the representation.
+
+    If-None-Match: * only matches a resource that exists, so the route passes found=True once it has loaded it
+    or found it in the cache, and the tags alone are checked before.
+    """
+    if_none_match = request.headers.get('if-none-match')
+
+    if if_none_match is None:
+        return None
+
+    # If-None-Match uses the weak comparison
+    tags = {tag.strip()[2:] if tag.strip().startswith('W/') else tag.strip() for tag in if_none_match.split(',')}
+
+    if etag in tags or (found and '*' in tags):
+        return Response(status_code=304, headers={'ETag': etag})
+
+    return None
+
+
+def get_cached_ad(ad_id: int, fields: List[ExtraFields], edits: int, source: str) -> Optional[bytes]:
+    content = cache.ads.get((edits, ad_id, frozenset(fields))) if edits != cache.UNAVAILABLE else None
+
+    # a 404 holds until the ads version changes, which any process creating ads does with a shared backend;
+    # like pages, 404s of replicas are kept apart from those of the primary
+    if content is None and cache.missing_ads.get((source, ad_id)) == cache.ad_pages.version():
+        raise HTTPException(status_code=404, detail='NOT_FOUND')
+
+    return content
 
 
-@router.get(
-    '/{ad_id}',
+def cache_ad(
+    ad_id: int, fields: List[ExtraFields], ad: Optional[Ad], version: int, edits: int, source: str
+) -> bytes:
+    """Cache the ad, or that it was not found in the source, under the versions read before the query."""
+    if ad is None:
+        if version != cache.UNAVAILABLE:
+            cache.missing_ads.set((source, ad_id), version)
+        raise HTTPException(status_code=404, detail='NOT_FOUND')
+
+    content = render_ad_out(ad, fields)
+    if edits != cache.UNAVAILABLE:
+        cache.ads.set((edits, ad_id, frozenset(fields)), content)
+
+    return content
+
+
+get_ads_params = dict(
+    path='/',
+    response_model=Union[List[AdShort], AdPage],
+    summary='Get a paginated list of ads',
+    description='A list of ads, or with `envelope=true` an object that adds the total count, '
+                'the number of pages and whether there is a next page',
+    responses={
+        400: {'model': Message, 'description': 'Invalid cursor'}
+    }
+)
+
+add_ad_params = dict(path='/', status_code=201, response_model=AdCreated, summary='Create a new ad')
+
+add_ads_params = dict(
+    path='/batch',
+    status_code=201,
+    response_model=List[AdCreated],
+    summary='Create several ads in one transaction',
+    description='Either all the ads are created or none of them. '
+                'Validation errors are reported per ad, `loc` starts with its index in the list'
+)
+
+export_ads_params = dict(
+    path='/export',
+    response_class=StreamingResponse,
+    summary='Export all ads with their photos',
+    description='Newline-delimited JSON, one ad per line in ID order. '
+                'Pass the last exported ID as `since_id` to continue an export incrementally',
+    responses={
+        200: {'content': {'application/x-ndjson': {}}, 'description': 'Ads'}
+    }
+)
+
+search_ads_params = dict(
+    path='/search',
+    response_model=List[AdShort],
+    summary='Search ads by name and description',
+    description='Ads containing all the words of `q`, the most relevant first unless an order is given'
+)
+
+get_ad_by_id_params = dict(
+    path='/{ad_id}',
     response_model=AdOut,
     response_model_exclude_none=True,
     summary='Get an ad by ID',
@@ -49,26 +251,121 @@ class ExtraFields(Enum):
         404: {'model': Message, 'description': 'Ad not found'}
     }
 )
+
+
+@router.get(**get_ads_params)
+# the page, then for the envelope the counter, after the estimate on PostgreSQL
+@query_budget(3)
+def get_ads(
+    request: Request,
+    date_order: Optional[SortOrder] = Query(None, title='Sort by date'),
+    price_order: Optional[SortOrder] = Query(None, title='Sort by price'),
+    page: Optional[int] = Query(1, ge=1, title='Page number. 10 items per page'),
+    cursor: Optional[str] = Query(
+        None, title='Cursor from the X-Next-Cursor header of the previous page. Takes precedence over page'
+    ),
+    price_min: Optional[Decimal] = Query(None, ge=0, title='Minimum price, inclusive'),
+    price_max: Optional[Decimal] = Query(None, ge=0, title='Maximum price, inclusive'),
+    date_from: Optional[datetime.datetime] = Query(None, title='Posted at or after'),
+    date_to: Optional[datetime.datetime] = Query(None, title='Posted at or before'),
+    envelope: bool = Query(False, title='Wrap the ads with the total count, the number of pages and has_next'),
+    exact: bool = Query(False, title='Count the ads exactly instead of from the counter or an estimate'),
+    db: Session = Depends(get_read_db)
+):
+    filters = crud.AdFilters(price_min, price_max, date_from, date_to)
+    version = cache.ad_pages.version()
+    after = parse_cursor(cursor, date_order, price_order)
+    key = page_key(read_source(request), date_order, price_order, page, after, filters, envelope, exact)
+    etag = page_etag(version, key)
+    not_modified_response = not_modified(request, etag)
+
+    if not_modified_response is not None:
+        return not_modified_response
+
+    content = cache.ad_pages.get(version, key)
+
+    if content is None:
+        ads, has_next = crud.get_ads_page(db, date_order, price_order, page, after, filters)
+        total = crud.count_ads(db, exact, filters) if envelope else None
+        content = render_ads(ads, date_order, price_order, has_next, total)
+        cache.ad_pages.set(version, key, content)
+
+    not_modified_response = not_modified(request, etag, found=True)
+
+    if not_modified_response is not None:
+        return not_modified_response
+
+    return ads_response(content, etag)
+
+
+@router.post(**add_ad_params)
+# the ad, up to 3 photos, the card, the search index, the counter and the refresh
+@query_budget(8)
+def add_ad(ad: AdIn, response: Response, db: Session = Depends(get_db)):
+    ad = crud.save_ad(db, ad)
+    stick_to_primary(response)
+
+    return ad
+
+
+@router.post(**add_ads_params)
+def add_ads(ads: AdBatchIn, response: Response, db: Session = Depends(get_db)):
+    ids = crud.save_ads(db, ads)
+    stick_to_primary(response)
+
+    return [{'id': id} for id in ids]
+
+
+@router.get(**export_ads_params)
+def export_ads(
+    since_id: Optional[int] = Query(None, title='Export ads with greater IDs only'),
+    since_date: Optional[datetime.datetime] = Query(None, title='Export ads posted at or after this date only'),
+    db: Session = Depends(get_read_db)
+):
+    lines = (render_export_line(ad) for ad in crud.export_ads(db, since_id, since_date))
+
+    return StreamingResponse(lines, media_type='application/x-ndjson')
+
+
+@router.get(**search_ads_params)
+@query_budget(1)
+def search_ads(
+    q: str = Query(..., min_length=1, max_length=200, title='Words to look for'),
+    date_order: Optional[SortOrder] = Query(None, title='Sort by date'),
+    price_order: Optional[SortOrder] = Query(None, title='Sort by price'),
+    page: Optional[int] = Query(1, ge=1, title='Page number. 10 items per page'),
+    db: Session = Depends(get_read_db)
+):
+    return search_response(crud.search_ads(db, q, date_order, price_order, page))
+
+
+@router.get(**get_ad_by_id_params)
+# the ad, with its photo rows when they are requested and not embedded
+@query_budget(1)
 def get_ad_by_id(
+    request: Request,
     ad_id: int = Path(..., title="Ad ID"),
     fields: Optional[List[ExtraFields]] = Query([], title='Additional fields'),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
-    ad = crud.get_ad_by_id(db, ad_id)
+    edits = cache.ad_edits.version()
+    etag = ad_etag(ad_id, fields, edits)
+    not_modified_response = not_modified(request, etag)
 
-    if ad is None:
-        raise HTTPException(status_code=404, detail='NOT_FOUND')
-    
-    data = {
-        'id': ad.id,
-        'name': ad.name,
-        'price': ad.price,
-        'main_photo': ad.photos[0]
-    }
+    if not_modified_response is not None:
+        return not_modified_response
 
-    if ExtraFields.DESCRIPTION in fields:
-        data['description'] = ad.description
-    if ExtraFields.PHOTOS in fields:
-        data['photos'] = ad.photos
-    
-    return data
+    content = get_cached_ad(ad_id, fields, edits, read_source(request))
+
+    if content is None:
+        version = cache.ad_pages.version()
+        description, photos = ExtraFields.DESCRIPTION in fields, ExtraFields.PHOTOS in fields
+        ad = crud.get_ad_by_id(db, ad_id, description, photos)
+        content = cache_ad(ad_id, fields, ad, version, edits, read_source(request))
+
+    not_modified_response = not_modified(request, etag, found=True)
+
+    if not_modified_response is not None:
+        return not_modified_response
+
+    return Response(content, media_type='application/json', headers={'ETag': etag})
@@ -0,0 +1,138 @@
+import datetime
+from decimal import Decimal
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Path, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import cache, crud
+from ..crud import SortOrder
+from ..database import get_async_db, get_async_read_db, read_source, stick_to_primary
+from ..dto import AdBatchIn, AdIn
+from ..metrics import query_budget
+from .ad import (
+    ad_etag, add_ad_params, add_ads_params, ads_response, cache_ad, export_ads_params, ExtraFields,
+    get_ad_by_id_params, get_ads_params, get_cached_ad, not_modified, page_etag, page_key, parse_cursor, render_ads,
+    render_export_line, search_ads_params, search_response
+)
+
+router = APIRouter(prefix='/ad', tags=['ad'])
+
+
+@router.get(**get_ads_params)
+# the page, then for the envelope the counter, after the estimate on PostgreSQL
+@query_budget(3)
+async def get_ads(
+    request: Request,
+    date_order: Optional[SortOrder] = Query(None, title='Sort by date'),
+    price_order: Optional[SortOrder] = Query(None, title='Sort by price'),
+    page: Optional[int] = Query(1, ge=1, title='Page number. 10 items per page'),
+    cursor: Optional[str] = Query(
+        None, title='Cursor from the X-Next-Cursor header of the previous page. Takes precedence over page'
+    ),
+    price_min: Optional[Decimal] = Query(None, ge=0, title='Minimum price, inclusive'),
+    price_max: Optional[Decimal] = Query(None, ge=0, title='Maximum price, inclusive'),
+    date_from: Optional[datetime.datetime] = Query(None, title='Posted at or after'),
+    date_to: Optional[datetime.datetime] = Query(None, title='Posted at or before'),
+    envelope: bool = Query(False, title='Wrap the ads with the total count, the number of pages and has_next'),
+    exact: bool = Query(False, title='Count the ads exactly instead of from the counter or an estimate'),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    filters = crud.AdFilters(price_min, price_max, date_from, date_to)
+    version = cache.ad_pages.version()
+    after = parse_cursor(cursor, date_order, price_order)
+    key = page_key(read_source(request), date_order, price_order, page, after, filters, envelope, exact)
+    etag = page_etag(version, key)
+    not_modified_response = not_modified(request, etag)
+
+    if not_modified_response is not None:
+        return not_modified_response
+
+    content = cache.ad_pages.get(version, key)
+
+    if content is None:
+        ads, has_next = await crud.get_ads_page_async(db, date_order, price_order, page, after, filters)
+        total = await crud.count_ads_async(db, exact, filters) if envelope else None
+        content = render_ads(ads, date_order, price_order, has_next, total)
+        cache.ad_pages.set(version, key, content)
+
+    not_modified_response = not_modified(request, etag, found=True)
+
+    if not_modified_response is not None:
+        return not_modified_response
+
+    return ads_response(content, etag)
+
+
+@router.post(**add_ad_params)
+# the ad, up to 3 photos, the card, the search index, the counter and the refresh
+@query_budget(8)
+async def add_ad(ad: AdIn, response: Response, db: AsyncSession = Depends(get_async_db)):
+    ad = await crud.save_ad_async(db, ad)
+    stick_to_primary(response)
+
+    return ad
+
+
+@router.post(**add_ads_params)
+async def add_ads(ads: AdBatchIn, response: Response, db: AsyncSession = Depends(get_async_db)):
+    ids = await crud.save_ads_async(db, ads)
+    stick_to_primary(response)
+
+    return [{'id': id} for id in ids]
+
+
+@router.get(**export_ads_params)
+async def export_ads(
+    since_id: Optional[int] = Query(None, title='Export ads with greater IDs only'),
+    since_date: Optional[datetime.datetime] = Query(None, title='Export ads posted at or after this date only'),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    lines = (render_export_line(ad) async for ad in crud.export_ads_async(db, since_id, since_date))
+
+    return StreamingResponse(lines, media_type='application/x-ndjson')
+
+
+@router.get(**search_ads_params)
+@query_budget(1)
+async def search_ads(
+    q: str = Query(..., min_length=1, max_length=200, title='Words to look for'),
+    date_order: Optional[SortOrder] = Query(None, title='Sort by date'),
+    price_order: Optional[SortOrder] = Query(None, title='Sort by price'),
+    page: Optional[int] = Query(1, ge=1, title='Page number. 10 items per page'),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    return search_response(await crud.search_ads_async(db, q, date_order, price_order, page))
+
+
+@router.get(**get_ad_by_id_params)
+# the ad, with its photo rows when they are requested and not embedded
+@query_budget(1)
+async def get_ad_by_id(
+    request: Request,
+    ad_id: int = Path(..., title="Ad ID"),
+    fields: Optional[List[ExtraFields]] = Query([], title='Additional fields'),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    edits = cache.ad_edits.version()
+    etag = ad_etag(ad_id, fields, edits)
+    not_modified_response = not_modified(request, etag)
+
+    if not_modified_response is not None:
+        return not_modified_response
+
+    content = get_cached_ad(ad_id, fields, edits, read_source(request))
+
+    if content is None:
+        version = cache.ad_pages.version()
+        description, photos = ExtraFields.DESCRIPTION in fields, ExtraFields.PHOTOS in fields
+        ad = await crud.get_ad_by_id_async(db, ad_id, description, photos)
+        content = cache_ad(ad_id, fields, ad, version, edits, read_source(request))
+
+    not_modified_response = not_modified(request, etag, found=True)
+
+    if not_modified_response is not None:
+        return not_modified_response
+
+    return Response(content, media_type='application/json', headers={'ETag': etag})
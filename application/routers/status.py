@@ -0,0 +1,22 @@
+import anyio.to_thread
+from fastapi import APIRouter
+
+from .. import database
+from ..database.pool import pool_status
+
+router = APIRouter(prefix='/status', tags=['status'])
+
+
+@router.get('/pool', summary='Get database connection pool statistics')
+async def get_pool_status():
+    # sync handlers hold a thread for the whole request, so the pool should not be much smaller than the threadpool
+    threadpool = anyio.to_thread.current_default_thread_limiter()
+
+    return {
+        'database': pool_status(database.engine.pool),
+        'async_database': pool_status(database.async_engine.pool) if database.async_engine is not None else None,
+        'threadpool': {
+            'size': threadpool.total_tokens,
+            'busy': threadpool.borrowed_tokens
+        }
+    }
@@ -0,0 +1,294 @@
+"""Prefork server: preloads the application, binds the socket and forks uvicorn workers that share it.
+
+    python -m application.serve [--host 0.0.0.0] [--port 80] [--workers 4]
+
+The defaults come from the SERVER_* settings of the config. The master process only supervises the workers,
+replacing those that exit, and takes these signals:
+
+* TERM, INT: graceful shutdown. The workers stop accepting connections and finish their requests,
+  within SERVER_GRACEFUL_TIMEOUT seconds, after which they are killed.
+* HUP: graceful reload. The master re-executes itself on the same socket, so the code and the config on disk
+  are loaded again, forks new workers and drains the old ones like on shutdown. The reload is skipped if
+  the application fails to import.
+"""
+import argparse
+import gc
+import logging
+import logging.config
+import os
+import select
+import signal
+import socket
+import subprocess
+import sys
+import time
+from typing import Dict, Iterable, List, Optional, Set
+
+import uvicorn
+from uvicorn.config import LOGGING_CONFIG
+
+from . import cache
+from .asgi import application
+from .config import get_config
+
+config = get_config()
+
+logger = logging.getLogger('uvicorn.error')
+
+# passed through os.execv on reload
+LISTEN_FD = 'SERVER_LISTEN_FD'
+OLD_WORKERS = 'SERVER_OLD_WORKERS'
+
+# exit status of a worker whose application did not start, the master then shuts down instead of respawning it
+BOOT_FAILURE = 3
+
+SIGNALS = (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGCHLD)
+
+
+def cpu_count() -> int:
+    # the CPUs the process may run on, which may be fewer than the machine has
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def default_workers() -> int:
+    # a worker per CPU only when they share the cache versions (an empty scope), otherwise pages and 404s
+    # cached by one worker would outlive the ads created through the others
+    return 1 if cache.ad_pages.backend.scope else cpu_count()
+
+
+def listen(host: str, port: int, backlog: int) -> socket.socket:
+    """The socket inherited from the master before a reload, or a new one."""
+    fd = os.environ.pop(LISTEN_FD, None)
+
+    if fd is not None:
+        return socket.socket(fileno=int(fd))
+
+    sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+
+    return sock
+
+
+def _exit_status(status: int) -> int:
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+
+    return os.WEXITSTATUS(status)
+
+
+class Master:
+    def __init__(
+        self,
+        sock: socket.socket,
+        size: int,
+        argv: List[str],
+        graceful_timeout: float = config.SERVER_GRACEFUL_TIMEOUT,
+        max_requests: int = config.SERVER_MAX_REQUESTS,
+        access_log: bool = config.SERVER_ACCESS_LOG
+    ):
+        self.socket = sock
+        self.size = size
+        self.argv = argv
+        self.graceful_timeout = graceful_timeout
+        self.max_requests = max_requests
+        self.access_log = access_log
+        self.workers: Set[int] = set()
+        # PID: time after which the worker is killed
+        self.draining: Dict[int, float] = {}
+        self.stopping = False
+        self.exit_code = 0
+        self._signals: List[int] = []
+        self._wakeup_fds = None
+
+    def run(self, old_workers: Iterable[int] = ()) -> int:
+        self._install_signal_handlers()
+        logger.info('Master [%d] listening on %s with %d workers', os.getpid(), self.socket.getsockname(), self.size)
+        # objects created so far are left out of the collections, which would otherwise write
+        # to every page holding them and undo the sharing of memory with the workers
+        gc.freeze()
+        self._scale()
+        self._drain(old_workers)
+
+        while True:
+            signum = self._next_signal(timeout=1)
+
+            if signum in (signal.SIGTERM, signal.SIGINT) and not self.stopping:
+                logger.info('Shutting down, draining the workers')
+                self._stop()
+            elif signum == signal.SIGHUP and not self.stopping:
+                self._reload()
+
+            self._reap()
+            self._kill_overdue()
+
+            if self.stopping and not self.workers and not self.draining:
+                return self.exit_code
+            if not self.stopping:
+                self._scale()
+
+    def _install_signal_handlers(self):
+        read_fd, write_fd = os.pipe()
+        os.set_blocking(read_fd, False)
+        os.set_blocking(write_fd, False)
+        self._wakeup_fds = (read_fd, write_fd)
+        # wakes up the select() of _next_signal as soon as a signal arrives
+        signal.set_wakeup_fd(write_fd)
+
+        for signum in SIGNALS:
+            signal.signal(signum, self._on_signal)
+
+    def _on_signal(self, signum: int, frame):
+        self._signals.append(signum)
+
+    def _next_signal(self, timeout: float) -> Optional[int]:
+        if not self._signals:
+            select.select([self._wakeup_fds[0]], [], [], timeout)
+            try:
+                os.read(self._wakeup_fds[0], 4096)
+            except BlockingIOError:
+                pass
+
+        return self._signals.pop(0) if self._signals else None
+
+    def _scale(self):
+        while len(self.workers) < self.size:
+            self._spawn()
+
+    def _spawn(self):
+        pid = os.fork()
+
+        if pid == 0:
+            status = 1
+            try:
+                status = self._work()
+            except SystemExit as e:
+                status = e.code if isinstance(e.code, int) else 1
+            except BaseException:
+                logger.exception('Worker [%d] failed', os.getpid())
+            finally:
+                os._exit(status)
+
+        self.workers.add(pid)
+        logger.info('Started worker [%d]', pid)
+
+    def _work(self) -> int:
+        for signum in SIGNALS:
+            signal.signal(signum, signal.SIG_DFL)
+        signal.set_wakeup_fd(-1)
+        for fd in self._wakeup_fds:
+            os.close(fd)
+
+        # the app creates its engines when it starts, so every worker has pools of its own
+        server = uvicorn.Server(uvicorn.Config(
+            application,
+            lifespan='on',
+            access_log=self.access_log,
+            limit_max_requests=self.max_requests or None
+        ))
+        server.run(sockets=[self.socket])
+
+        return 0 if server.started else BOOT_FAILURE
+
+    def _drain(self, pids: Iterable[int]):
+        deadline = time.monotonic() + self.graceful_timeout
+
+        for pid in list(pids):
+            self.workers.discard(pid)
+            self.draining[pid] = deadline
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def _stop(self, exit_code: int = 0):
+        self.stopping = True
+        self.exit_code = exit_code
+        self._drain(self.workers)
+
+    def _reload(self):
+        # the master would take the server down with it if it failed to import the new code
+        if subprocess.run([sys.executable, '-c', 'import application.asgi']).returncode != 0:
+            logger.error('Reload skipped, the application fails to import')
+            return
+
+        logger.info('Reloading')
+        os.set_inheritable(self.socket.fileno(), True)
+        os.environ[LISTEN_FD] = str(self.socket.fileno())
+        # the workers stay children of the process across exec, the new master drains them
+        os.environ[OLD_WORKERS] = ','.join(str(pid) for pid in self.workers | set(self.draining))
+        os.execv(sys.executable, [sys.executable, '-m', 'application.serve', *self.argv])
+
+    def _reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+
+            status = _exit_status(status)
+
+            if self.draining.pop(pid, None) is not None:
+                logger.info('Worker [%d] stopped', pid)
+            elif pid in self.workers:
+                self.workers.discard(pid)
+                if status == BOOT_FAILURE:
+                    logger.error('Worker [%d] failed to start the application, shutting down', pid)
+                    self._stop(exit_code=1)
+                elif not self.stopping:
+                    log = logger.info if status == 0 else logger.warning
+                    log('Worker [%d] exited with status %d, replacing it', pid, status)
+
+    def _kill_overdue(self):
+        now = time.monotonic()
+
+        for pid, deadline in self.draining.items():
+            if deadline <= now:
+                logger.warning('Worker [%d] did not stop within %.0f s, killing it', pid, self.graceful_timeout)
+                self.draining[pid] = float('inf')
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+
+
+def main(argv: Optional[List[str]] = None):
+    argv = sys.argv[1:] if argv is None else argv
+    parser = argparse.ArgumentParser(prog='python -m application.serve', description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default=config.SERVER_HOST)
+    parser.add_argument('--port', type=int, default=config.SERVER_PORT)
+    parser.add_argument(
+        '--workers', type=int, default=config.SERVER_WORKERS,
+        help='0 for one per CPU with a shared LIST_CACHE_BACKEND, one otherwise'
+    )
+    parser.add_argument('--graceful-timeout', type=float, default=config.SERVER_GRACEFUL_TIMEOUT)
+    parser.add_argument('--max-requests', type=int, default=config.SERVER_MAX_REQUESTS, help='0 keeps workers')
+    parser.add_argument('--no-access-log', dest='access_log', action='store_false', default=config.SERVER_ACCESS_LOG)
+    args = parser.parse_args(argv)
+
+    logging.config.dictConfig(LOGGING_CONFIG)
+    size = args.workers or default_workers()
+
+    if size > 1 and cache.ad_pages.backend.scope:
+        logger.warning(
+            'The caches are per worker: ads created through one worker do not refresh the pages and 404s cached '
+            'by the others. Set LIST_CACHE_BACKEND=application.cache.RedisBackend to share them'
+        )
+
+    old_workers = [int(pid) for pid in os.environ.pop(OLD_WORKERS, '').split(',') if pid]
+    master = Master(
+        listen(args.host, args.port, config.SERVER_BACKLOG), size, argv,
+        args.graceful_timeout, args.max_requests, args.access_log
+    )
+
+    sys.exit(master.run(old_workers))
+
+
+if __name__ == '__main__':
+    main()
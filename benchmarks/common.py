@@ -0,0 +1,115 @@
+import json
+import platform
+import statistics
+import subprocess
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlencode
+
+import sqlalchemy
+from fastapi import FastAPI
+
+from application.database import get_async_db, get_async_read_db, get_db, get_read_db
+from application.routers import ad
+
+# the dependencies override_database replaces
+DATABASE_DEPENDENCIES = (get_db, get_read_db, get_async_db, get_async_read_db)
+
+
+async def asgi_request(
+    app, method: str, path: str, query: Optional[dict] = None, body: Optional[object] = None
+) -> Tuple[int, bytes]:
+    """Call the ASGI app directly, without a server or an HTTP client, and return the status and the body."""
+    content = json.dumps(body).encode() if body is not None else b''
+    headers = [(b'host', b'benchmark')]
+    if body is not None:
+        headers += [(b'content-type', b'application/json'), (b'content-length', str(len(content)).encode())]
+
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method, 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': urlencode(query or {}, doseq=True).encode(),
+        'root_path': '', 'headers': headers, 'client': ('127.0.0.1', 1), 'server': ('benchmark', 80)
+    }
+    response = {'status': None, 'body': []}
+
+    async def receive():
+        return {'type': 'http.request', 'body': content, 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+        elif message['type'] == 'http.response.body':
+            response['body'].append(message.get('body', b''))
+
+    await app(scope, receive, send)
+
+    return response['status'], b''.join(response['body'])
+
+
+def override_database(app: FastAPI, session_factory, async_session_factory=None) -> FastAPI:
+    """Serve the app with sessions of the given factories instead of the engines of the config."""
+    def override_get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
+
+    if async_session_factory is not None:
+        async def override_get_async_db():
+            async with async_session_factory() as db:
+                yield db
+
+        app.dependency_overrides[get_async_db] = override_get_async_db
+        app.dependency_overrides[get_async_read_db] = override_get_async_db
+
+    return app
+
+
+def ad_app(session_factory) -> FastAPI:
+    """An app with the ad routes only, and none of the middleware or startup handlers of application.asgi."""
+    app = FastAPI()
+    app.include_router(ad.router)
+
+    return override_database(app, session_factory)
+
+
+def summary(timings: List[float], elapsed: Optional[float] = None) -> Dict[str, float]:
+    """Timings in seconds, summarized in microseconds; elapsed is the wall time of all of them, for the throughput."""
+    timings = sorted(timings)
+    elapsed = sum(timings) if elapsed is None else elapsed
+
+    def percentile(p: float) -> float:
+        return timings[min(len(timings) - 1, int(len(timings) * p))]
+
+    return {
+        'n': len(timings),
+        'mean_us': round(statistics.mean(timings) * 1e6, 1),
+        'p50_us': round(percentile(0.5) * 1e6, 1),
+        'p95_us': round(percentile(0.95) * 1e6, 1),
+        'p99_us': round(percentile(0.99) * 1e6, 1),
+        'max_us': round(timings[-1] * 1e6, 1),
+        'ops_per_s': round(len(timings) / elapsed, 1) if elapsed else None
+    }
+
+
+def environment(urls: Iterable[str] = ()) -> dict:
+    """What results depend on, so that runs of different commits can be compared."""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'sqlalchemy': sqlalchemy.__version__,
+        'platform': platform.platform(),
+        'databases': [sqlalchemy.engine.make_url(url).get_backend_name() for url in urls]
+    }
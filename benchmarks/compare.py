@@ -0,0 +1,40 @@
+"""Compares two benchmark result files case by case.
+
+    python -m benchmarks.compare before.json after.json [--metric p50_us]
+
+Prints one line per case found in both files, with the ratio after / before: below 1 is faster.
+"""
+import argparse
+import json
+from typing import Dict, Tuple
+
+
+def _cases(results: dict, metric: str) -> Dict[Tuple, float]:
+    return {
+        (item['database'], item['size'], item['case'], json.dumps(item['params'], sort_keys=True), item['mode']):
+            item[metric]
+        for item in results['results']
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('before', type=argparse.FileType('r'))
+    parser.add_argument('after', type=argparse.FileType('r'))
+    parser.add_argument('--metric', default='p50_us')
+    args = parser.parse_args(argv)
+
+    with args.before, args.after:
+        before, after = json.load(args.before), json.load(args.after)
+
+    print(f'{before["environment"]["commit"]} -> {after["environment"]["commit"]}, {args.metric}')
+
+    after_cases = _cases(after, args.metric)
+    for key, value in _cases(before, args.metric).items():
+        if key in after_cases:
+            ratio = after_cases[key] / value if value else float('nan')
+            print(f'{" ".join(map(str, key))}: {value} -> {after_cases[key]} ({ratio:.2f}x)')
+
+
+if __name__ == '__main__':
+    main()
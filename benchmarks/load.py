@@ -0,0 +1,245 @@
+"""Load generator: drives a mix of requests at a fixed concurrency and reports latency, errors and throughput.
+
+    python -m benchmarks.load --concurrency 1 8 32 --duration 10 --mix list=6,get=3,create=1
+    python -m benchmarks.load --url http://localhost:8000 --concurrency 64
+
+Without --url, application.asgi:application is served by uvicorn in a thread of this process, on the database
+of the current config. Every concurrency level is a stage of closed-loop clients; the JSON output has
+per-operation latency percentiles and histograms, error counts and the throughput of each stage, and the
+highest throughput reached with an error rate below --max-error-rate. In-process, the clients and the server
+share the interpreter, so point --url at a separate server for throughput figures.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import random
+import socket
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+import uvicorn
+
+from application.metrics import LATENCY_BUCKETS
+
+from .common import environment, summary
+
+OPERATIONS = ('list', 'get', 'create')
+
+SORT_ORDERS = (None, 'asc', 'desc')
+
+FIELDS = ([], ['description'], ['photos'], ['description', 'photos'])
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    mix = {}
+
+    for item in value.split(','):
+        operation, _, weight = item.partition('=')
+        if operation not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f'unknown operation {operation!r}, expected one of {OPERATIONS}')
+        try:
+            mix[operation] = float(weight)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f'invalid weight {weight!r} for {operation}')
+
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError('at least one operation needs a positive weight')
+
+    return mix
+
+
+def _new_ad(rng: random.Random) -> dict:
+    return {
+        'name': f'Load test ad {rng.randrange(10 ** 9)}',
+        'description': 'Created by the load generator',
+        'price': rng.randint(1, 100_000),
+        'photos': [{'url': f'https://example.com/load/{rng.randrange(10 ** 9)}.jpg'} for _ in range(rng.randint(1, 3))]
+    }
+
+
+def _request(operation: str, ids: List[int], rng: random.Random, max_page: int) -> Tuple[str, str, dict]:
+    if operation == 'list':
+        params = {'page': rng.randint(1, max_page)}
+        for key in ('date_order', 'price_order'):
+            order = rng.choice(SORT_ORDERS)
+            if order is not None:
+                params[key] = order
+        return 'GET', '/ad/', {'params': params}
+    if operation == 'get':
+        return 'GET', f'/ad/{rng.choice(ids)}', {'params': {'fields': rng.choice(FIELDS)}}
+
+    return 'POST', '/ad/', {'json': _new_ad(rng)}
+
+
+class Recorder:
+    def __init__(self):
+        self.timings: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, Counter] = defaultdict(Counter)
+
+    def record(self, operation: str, elapsed: float, error: Optional[str]):
+        self.timings[operation].append(elapsed)
+        if error is not None:
+            self.errors[operation][error] += 1
+
+    def report(self, elapsed: float) -> dict:
+        operations = {}
+
+        for operation, timings in sorted(self.timings.items()):
+            histogram = Counter(
+                next((str(bound) for bound in LATENCY_BUCKETS if timing <= bound), '+Inf') for timing in timings
+            )
+            operations[operation] = {
+                **summary(timings, elapsed),
+                'errors': dict(self.errors[operation]),
+                'histogram': {
+                    str(bound): histogram[str(bound)] for bound in LATENCY_BUCKETS + ('+Inf',)
+                    if histogram[str(bound)]
+                }
+            }
+
+        requests = sum(len(timings) for timings in self.timings.values())
+        errors = sum(sum(errors.values()) for errors in self.errors.values())
+
+        return {
+            'duration_s': round(elapsed, 3),
+            'requests': requests,
+            'errors': errors,
+            'error_rate': round(errors / requests, 4) if requests else 0.0,
+            'rps': round(requests / elapsed, 1) if elapsed else 0.0,
+            'operations': operations
+        }
+
+
+async def _client(
+    client: httpx.AsyncClient, mix: Dict[str, float], ids: List[int], rng: random.Random, max_page: int,
+    deadline: float, record: Callable
+):
+    operations, weights = zip(*mix.items())
+
+    while time.perf_counter() < deadline:
+        operation = rng.choices(operations, weights)[0]
+        method, url, options = _request(operation, ids, rng, max_page)
+        started_at = time.perf_counter()
+
+        try:
+            response = await client.request(method, url, **options)
+        except httpx.HTTPError as e:
+            error = type(e).__name__
+        else:
+            error = str(response.status_code) if response.status_code >= 400 else None
+            if error is None and operation == 'create':
+                ids.append(response.json()['id'])
+
+        record(operation, time.perf_counter() - started_at, error)
+
+
+async def _known_ids(client: httpx.AsyncClient, pages: int, rng: random.Random) -> List[int]:
+    ids = []
+
+    for page in range(1, pages + 1):
+        response = await client.get('/ad/', params={'page': page})
+        response.raise_for_status()
+        if not response.json():
+            break
+        ids += [ad['id'] for ad in response.json()]
+
+    # an empty database gets a few ads, so that there is something to read
+    while len(ids) < 10:
+        response = await client.post('/ad/', json=_new_ad(rng))
+        response.raise_for_status()
+        ids.append(response.json()['id'])
+
+    return ids
+
+
+async def run(
+    url: str, concurrency_levels: List[int], duration: float, warmup: float, mix: Dict[str, float], max_page: int,
+    seed: int
+) -> List[dict]:
+    rng = random.Random(seed)
+    stages = []
+    limits = httpx.Limits(max_connections=max(concurrency_levels), max_keepalive_connections=max(concurrency_levels))
+
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+        ids = await _known_ids(client, max_page, rng)
+
+        for concurrency in concurrency_levels:
+            for stage_duration, recorder in ((warmup, Recorder()), (duration, Recorder())):
+                started_at = time.perf_counter()
+                deadline = started_at + stage_duration
+                await asyncio.gather(*[
+                    _client(client, mix, ids, random.Random(rng.random()), max_page, deadline, recorder.record)
+                    for _ in range(concurrency)
+                ])
+            stages.append({'concurrency': concurrency, **recorder.report(time.perf_counter() - started_at)})
+            print(f'concurrency {concurrency}: {stages[-1]["rps"]} rps, {stages[-1]["errors"]} errors', file=sys.stderr)
+
+    return stages
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+@contextlib.contextmanager
+def serve(app: str = 'application.asgi:application') -> Iterator[str]:
+    """Serves the app from a thread of this process and yields its URL."""
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=port, log_level='warning'))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError(f'{app} failed to start')
+        time.sleep(0.01)
+
+    try:
+        yield f'http://127.0.0.1:{port}'
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='server to load, by default the app is served in-process')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32], help='clients, one stage each')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per stage')
+    parser.add_argument('--warmup', type=float, default=1, help='seconds before each stage, not reported')
+    parser.add_argument('--mix', type=parse_mix, default='list=6,get=3,create=1', help='operation weights')
+    parser.add_argument('--max-page', type=int, default=10, help='highest page requested by GET /ad/')
+    parser.add_argument('--max-error-rate', type=float, default=0.01, help='for the maximum sustainable throughput')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', type=argparse.FileType('w'), default=sys.stdout)
+    args = parser.parse_args(argv)
+
+    with contextlib.ExitStack() as stack:
+        url = args.url or stack.enter_context(serve())
+        stages = asyncio.run(run(
+            url, args.concurrency, args.duration, args.warmup, args.mix, args.max_page, args.seed
+        ))
+
+    sustainable = [stage['rps'] for stage in stages if stage['error_rate'] <= args.max_error_rate]
+    report = {
+        'environment': environment(),
+        'url': args.url,
+        'mix': args.mix,
+        'stages': stages,
+        'max_sustainable_rps': max(sustainable, default=None)
+    }
+
+    with args.output:
+        json.dump(report, args.output, indent=2)
+        args.output.write('\n')
+
+
+if __name__ == '__main__':
+    main()
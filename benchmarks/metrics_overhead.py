@@ -0,0 +1,99 @@
+"""Measures what the metrics middleware and the SQL statement listeners add to a request.
+
+The ASGI app is called directly, without a server or an HTTP client, so the overhead is not hidden by
+transport costs. Prints JSON: median microseconds per request without and with metrics, for a request served
+from the cache (no SQL) and one that hits the database.
+
+    python -m benchmarks.metrics_overhead --requests 5000
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+from typing import Callable, Dict
+
+from fastapi import FastAPI
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from application import cache, crud, metrics
+from application.database import Base, engine_options
+from application.dto import AdIn
+
+from .common import ad_app, asgi_request
+
+
+async def _timed(app: FastAPI, path: str, before: Callable) -> float:
+    before()
+    started_at = time.perf_counter()
+    status, _ = await asgi_request(app, 'GET', path)
+    assert status == 200, status
+
+    return (time.perf_counter() - started_at) * 1e6
+
+
+async def run(requests: int) -> Dict[str, dict]:
+    with tempfile.TemporaryDirectory() as directory:
+        url = f'sqlite:///{os.path.join(directory, "bench.sqlite3")}'
+        # separate engines, so that only one of them carries the listeners
+        plain_engine = create_engine(url, **engine_options(url))
+        instrumented_engine = create_engine(url, **engine_options(url))
+        metrics.instrument_engine('benchmark', instrumented_engine)
+        Base.metadata.create_all(bind=plain_engine)
+
+        with sessionmaker(bind=plain_engine)() as db:
+            crud.save_ads(db, [
+                AdIn(name=f'Ad number {i}', description='Description', price=i + 1, photos=[{'url': 'http://example.com/1.jpg'}])
+                for i in range(100)
+            ])
+
+        apps = {
+            'without_metrics': ad_app(sessionmaker(bind=plain_engine)),
+            'with_metrics': ad_app(sessionmaker(bind=instrumented_engine))
+        }
+        apps['with_metrics'].add_middleware(metrics.MetricsMiddleware)
+        scenarios = {
+            'cached': (lambda: None),
+            'database': cache.clear
+        }
+        paths = [f'/ad/{i % 100 + 1}' for i in range(requests)]
+        results = {}
+
+        for scenario, before in scenarios.items():
+            timings = {name: [] for name in apps}
+
+            for path in paths[:100]:
+                for app in apps.values():
+                    await _timed(app, path, before)
+            # the variants alternate request by request, so that drift and noise hit both alike
+            for path in paths:
+                for name, app in apps.items():
+                    timings[name].append(await _timed(app, path, before))
+
+            median = {name: statistics.median(values) for name, values in timings.items()}
+            overhead = median['with_metrics'] - median['without_metrics']
+            results[scenario] = {
+                **{f'{name}_us': round(value, 1) for name, value in median.items()},
+                'overhead_us': round(overhead, 1),
+                'overhead_percent': round(overhead / median['without_metrics'] * 100, 1)
+            }
+
+        plain_engine.dispose()
+        instrumented_engine.dispose()
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=5000, help='requests per variant and scenario')
+    args = parser.parse_args(argv)
+
+    print(json.dumps(asyncio.run(run(args.requests)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
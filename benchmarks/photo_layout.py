@@ -0,0 +1,121 @@
+"""Compares the photo layouts of an ad: rows of the photo table and the ad.photo_urls column.
+
+Times GET /ad/{ad_id}?fields=photos with each PHOTO_STORAGE, directly through crud and through the ASGI app
+with the caches cleared, the layouts alternating request by request. Both layouts are always written, so they
+are read from the same seeded database. Prints JSON: latency per layout and mode, and the bytes each layout takes.
+
+    python -m benchmarks.photo_layout --size 100000 --requests 2000 [--database-url URL]
+
+The tables at --database-url are dropped.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+
+from application import cache, crud
+from application.database import engine_options
+
+from .common import ad_app, asgi_request, environment, summary
+from .seed import seed
+
+LAYOUTS = ('table', 'embedded')
+
+STORAGE = {
+    'sqlite': {
+        'ad_bytes': "SELECT sum(pgsize) FROM dbstat WHERE name = 'ad'",
+        'photo_table_bytes': "SELECT sum(pgsize) FROM dbstat WHERE name = 'photo'",
+        'photo_index_bytes': "SELECT sum(pgsize) FROM dbstat WHERE name = 'ix_photo_ad_id'",
+        'photo_urls_bytes': 'SELECT sum(length(photo_urls)) FROM ad'
+    },
+    'postgresql': {
+        'ad_bytes': "SELECT pg_table_size('ad')",
+        'photo_table_bytes': "SELECT pg_table_size('photo')",
+        'photo_index_bytes': "SELECT pg_indexes_size('photo')",
+        'photo_urls_bytes': 'SELECT sum(pg_column_size(photo_urls)) FROM ad'
+    }
+}
+
+
+def storage(engine: Engine) -> Dict[str, int]:
+    """Bytes of the ad table, which holds photo_urls, of the photo table and its indexes, and of photo_urls alone."""
+    with engine.connect() as connection:
+        if engine.dialect.name == 'postgresql':
+            connection.execute(text('VACUUM ANALYZE').execution_options(isolation_level='AUTOCOMMIT'))
+
+        return {name: connection.execute(text(query)).scalar() for name, query in STORAGE[engine.dialect.name].items()}
+
+
+async def run(url: str, size: int, requests: int) -> dict:
+    engine = create_engine(url, **engine_options(url))
+    session_factory = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+    app = ad_app(session_factory)
+    layout = crud.config.PHOTO_STORAGE
+
+    def direct(id: int):
+        # a session per call, so that the identity map does not serve the ad
+        with session_factory() as db:
+            crud.photo_urls(crud.get_ad_by_id(db, id, photos=True))
+
+    async def asgi(id: int):
+        cache.clear()
+        status, body = await asgi_request(app, 'GET', f'/ad/{id}', {'fields': 'photos'})
+        assert status == 200, (status, body)
+
+    try:
+        seed(engine, size)
+        ids = random.Random(size).choices(range(1, size + 1), k=requests)
+        timings = {(name, mode): [] for name in LAYOUTS for mode in ('direct', 'asgi')}
+
+        # the layouts alternate request by request, so that drift and noise hit both alike
+        for id in ids:
+            for name in LAYOUTS:
+                crud.config.PHOTO_STORAGE = name
+
+                started_at = time.perf_counter()
+                direct(id)
+                timings[name, 'direct'].append(time.perf_counter() - started_at)
+
+                started_at = time.perf_counter()
+                await asgi(id)
+                timings[name, 'asgi'].append(time.perf_counter() - started_at)
+
+        return {
+            'environment': environment([url]),
+            'size': size,
+            'latency': {f'{name}_{mode}': summary(values) for (name, mode), values in timings.items()},
+            'storage': storage(engine)
+        }
+    finally:
+        crud.config.PHOTO_STORAGE = layout
+        engine.dispose()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=100_000, help='number of ads to seed')
+    parser.add_argument('--requests', type=int, default=2000, help='requests per layout and mode')
+    parser.add_argument('--database-url', help='database to run on instead of a temporary SQLite one, wiped')
+    parser.add_argument('--output', type=argparse.FileType('w'), default=sys.stdout)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        url = args.database_url or f'sqlite:///{os.path.join(directory, "benchmark.sqlite3")}'
+        results = asyncio.run(run(url, args.size, args.requests))
+
+    with args.output:
+        json.dump(results, args.output, indent=2)
+        args.output.write('\n')
+
+
+if __name__ == '__main__':
+    main()
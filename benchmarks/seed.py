@@ -0,0 +1,84 @@
+"""Fill a database with generated ads, 1 to 3 photos each. The tables are dropped and recreated.
+
+    python -m benchmarks.seed --database-url sqlite:///bench.sqlite3 --count 100000
+
+The data only depends on the count and the seed, so runs against different commits see the same rows.
+"""
+import argparse
+import datetime
+import random
+import sys
+import time
+from decimal import Decimal
+from typing import Iterator, List
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+
+from application.database import engine_options
+from application.database.models import Base
+from application.importer import BATCH_SIZE, import_ads, Row
+
+SEED = 42
+
+# dates are spread over a year, in an order unrelated to the IDs
+DATE_FROM = datetime.datetime(2021, 1, 1)
+DATE_RANGE = 365 * 24 * 60 * 60
+
+SPREAD_DATES = {
+    'sqlite': "UPDATE ad SET date = datetime(:start, '+' || ((id * 7919) % :range) || ' seconds')",
+    'postgresql': "UPDATE ad SET date = CAST(:start AS timestamp) + ((id * 7919) % :range) * interval '1 second'"
+}
+
+
+def generate_ads(count: int, seed: int = SEED, batch_size: int = BATCH_SIZE) -> Iterator[List[Row]]:
+    generator = random.Random(seed)
+
+    for start in range(0, count, batch_size):
+        yield [
+            (
+                f'Ad number {i}',
+                f'Description of the ad number {i} ' + 'lorem ipsum ' * generator.randint(1, 50),
+                Decimal(generator.randint(100, 10_000_000)) / 100,
+                [f'https://example.com/{i}/{photo}.jpg' for photo in range(generator.randint(1, 3))]
+            )
+            for i in range(start, min(start + batch_size, count))
+        ]
+
+
+def seed(engine: Engine, count: int, seed: int = SEED, progress=None) -> int:
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+    total = import_ads(generate_ads(count, seed), engine=engine, progress=progress)
+
+    with engine.begin() as connection:
+        connection.execute(
+            text(SPREAD_DATES[engine.dialect.name]), {'start': DATE_FROM.isoformat(' '), 'range': DATE_RANGE}
+        )
+        if engine.dialect.name == 'postgresql':
+            connection.execute(text('ANALYZE ad'))
+            connection.execute(text('ANALYZE photo'))
+        else:
+            connection.execute(text('ANALYZE'))
+
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', required=True)
+    parser.add_argument('--count', type=int, default=100_000)
+    parser.add_argument('--seed', type=int, default=SEED)
+    args = parser.parse_args(argv)
+
+    engine = create_engine(args.database_url, **engine_options(args.database_url))
+    started_at = time.perf_counter()
+    total = seed(engine, args.count, args.seed, progress=sys.stderr)
+    engine.dispose()
+
+    print(f'Seeded {total} ads in {time.perf_counter() - started_at:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""Throughput of python -m application.serve by number of workers.
+
+Seeds a temporary SQLite database, then for each --workers count starts the server on it in a subprocess and
+loads it with --clients load generator processes (benchmarks.load, read-only mix by default) for --duration
+seconds. Prints JSON: the throughput and errors per worker count, and the scaling efficiency, the throughput
+over the worker count times the throughput per worker of the first run. It stays near 1 only while there are
+CPUs left for both the workers and the clients, so compare it with the cpus of the environment.
+
+    python -m benchmarks.serve_scaling --workers 1 2 4 8 --clients 4 --duration 10
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import httpx
+from sqlalchemy import create_engine
+
+from application.database import engine_options
+
+from .common import environment
+from .load import _free_port, parse_mix, run as load
+from .seed import seed
+
+
+def _load(url: str, concurrency: int, duration: float, warmup: float, mix: Dict[str, float], seed: int) -> dict:
+    return asyncio.run(load(url, [concurrency], duration, warmup, mix, 10, seed))[0]
+
+
+def _wait_until_ready(url: str, server: subprocess.Popen, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f'the server exited with status {server.returncode}')
+        try:
+            if httpx.get(f'{url}/ad/', timeout=1).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.1)
+
+    raise RuntimeError(f'the server did not start within {timeout:.0f} s')
+
+
+def measure(
+    database_url: str, workers: int, clients: int, concurrency: int, duration: float, warmup: float,
+    mix: Dict[str, float]
+) -> dict:
+    port = _free_port()
+    url = f'http://127.0.0.1:{port}'
+    env = {**os.environ, 'CONFIG': 'production', 'DATABASE_URL': database_url}
+    server = subprocess.Popen(
+        [
+            sys.executable, '-m', 'application.serve',
+            '--port', str(port), '--workers', str(workers), '--no-access-log'
+        ],
+        env=env,
+        stderr=subprocess.DEVNULL
+    )
+
+    try:
+        _wait_until_ready(url, server)
+
+        with multiprocessing.Pool(clients) as pool:
+            stages = pool.starmap(_load, [(url, concurrency, duration, warmup, mix, seed) for seed in range(clients)])
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait()
+
+    requests = sum(stage['requests'] for stage in stages)
+    errors = sum(stage['errors'] for stage in stages)
+
+    return {
+        'workers': workers,
+        'rps': round(sum(stage['rps'] for stage in stages), 1),
+        'requests': requests,
+        'errors': errors,
+        'error_rate': round(errors / requests, 4) if requests else 0
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help='worker counts, one run each')
+    parser.add_argument('--clients', type=int, default=os.cpu_count(), help='load generator processes')
+    parser.add_argument('--concurrency', type=int, default=8, help='connections per load generator process')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per run')
+    parser.add_argument('--warmup', type=float, default=1, help='seconds before each run, not reported')
+    parser.add_argument('--mix', type=parse_mix, default='list=6,get=3', help='operation weights')
+    parser.add_argument('--size', type=int, default=10_000, help='number of ads to seed')
+    parser.add_argument('--output', type=argparse.FileType('w'), default=sys.stdout)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        url = f'sqlite:///{os.path.join(directory, "benchmark.sqlite3")}'
+        engine = create_engine(url, **engine_options(url))
+        seed(engine, args.size)
+        engine.dispose()
+
+        runs = []
+        for workers in args.workers:
+            runs.append(measure(url, workers, args.clients, args.concurrency, args.duration, args.warmup, args.mix))
+            print(f'{workers} workers: {runs[-1]["rps"]} rps, {runs[-1]["errors"]} errors', file=sys.stderr)
+
+    base = next((item['rps'] / item['workers'] for item in runs if item['rps']), None)
+    for item in runs:
+        item['efficiency'] = round(item['rps'] / (item['workers'] * base), 2) if base else None
+
+    report = {
+        'environment': {**environment([url]), 'cpus': os.cpu_count()},
+        'mix': args.mix,
+        'clients': args.clients,
+        'concurrency': args.concurrency,
+        'runs': runs
+    }
+
+    with args.output:
+        json.dump(report, args.output, indent=2)
+        args.output.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Import and startup time of the app, what a new container or worker pays before serving its first request.
+
+Every run is a fresh interpreter that imports application.asgi (which builds the app), runs its startup handlers,
+which create the engines, and its shutdown handlers. Prints JSON: the timings of each phase over --repeat runs
+and the modules that took the longest to import (python -X importtime), and fails if the median of import plus
+startup is above --budget seconds.
+
+    python -m benchmarks.startup --repeat 10 --budget 1.5
+
+The app runs with the config of the environment (CONFIG), against its database, which it does not query.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Optional, Tuple
+
+from .common import environment, summary
+
+PHASES = ('import', 'startup', 'shutdown')
+
+# nothing is imported before the clock starts but time itself
+CHILD = '''
+import time
+started_at = time.perf_counter()
+from application.asgi import application
+imported_at = time.perf_counter()
+import asyncio
+import json
+asyncio.run(application.router.startup())
+started_up_at = time.perf_counter()
+asyncio.run(application.router.shutdown())
+print(json.dumps({
+    'import': imported_at - started_at,
+    'startup': started_up_at - imported_at,
+    'shutdown': time.perf_counter() - started_up_at
+}))
+'''
+
+
+def _imports(log: str) -> Dict[str, Tuple[int, int]]:
+    """Self and cumulative microseconds per module, from the output of -X importtime."""
+    imports = {}
+
+    for line in log.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, module = line[len('import time:'):].split('|')
+        imports[module.strip()] = (int(self_us), int(cumulative_us))
+
+    return imports
+
+
+def measure() -> Tuple[Dict[str, float], Dict[str, Tuple[int, int]]]:
+    child = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', CHILD], capture_output=True, text=True, check=True
+    )
+
+    return json.loads(child.stdout.splitlines()[-1]), _imports(child.stderr)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=10, help='fresh interpreters to time')
+    parser.add_argument('--top', type=int, default=15, help='slowest modules to list')
+    parser.add_argument('--budget', type=float, help='seconds allowed for the median of import plus startup')
+    parser.add_argument('--output', type=argparse.FileType('w'), default=sys.stdout)
+    args = parser.parse_args(argv)
+
+    timings: Dict[str, List[float]] = {phase: [] for phase in PHASES + ('total',)}
+    imports: Dict[str, Tuple[int, int]] = {}
+
+    for _ in range(args.repeat):
+        phases, imports = measure()
+        for phase in PHASES:
+            timings[phase].append(phases[phase])
+        timings['total'].append(phases['import'] + phases['startup'])
+
+    total = statistics.median(timings['total'])
+    slowest = sorted(imports.items(), key=lambda item: item[1][0], reverse=True)[:args.top]
+    report = {
+        'environment': environment(),
+        'latency': {phase: summary(values) for phase, values in timings.items()},
+        # of the last run, by time spent in the module itself rather than in the ones it imports
+        'slowest_imports': [
+            {'module': module, 'self_us': self_us, 'cumulative_us': cumulative_us}
+            for module, (self_us, cumulative_us) in slowest
+        ],
+        'budget_s': args.budget
+    }
+
+    with args.output:
+        json.dump(report, args.output, indent=2)
+        args.output.write('\n')
+
+    if args.budget is not None and total > args.budget:
+        sys.exit(f'import and startup took {total:.3f} s, above the budget of {args.budget} s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+"""Times the crud functions and the routes on top of them, on seeded databases of several sizes.
+
+    python -m benchmarks.suite --sizes 10000 100000 1000000 --output results.json
+
+Runs against a temporary SQLite database, plus every --database-url given (the tables there are dropped)
+and BENCHMARK_POSTGRESQL_URL when it is set and the server answers. Prints JSON results: one entry per
+database, size, case and mode, "direct" calling the crud function and "asgi" requesting the route
+through the application, caches cleared before every request.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, Iterator, List, Optional
+
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from application import cache, crud
+from application.asgi import application
+from application.config import _async_url
+from application.crud import SortOrder
+from application.database import engine_options
+from application.dto import AdIn
+from application.routers.ad import ExtraFields
+
+from .common import asgi_request, DATABASE_DEPENDENCIES, environment, override_database, summary
+from .seed import seed
+
+SIZES = (10_000, 100_000, 1_000_000)
+
+SORT_ORDERS = (None, SortOrder.ASC, SortOrder.DESC)
+
+FIELDS = [
+    list(fields) for count in range(len(ExtraFields) + 1) for fields in itertools.combinations(ExtraFields, count)
+]
+
+
+def _new_ad(i: int) -> AdIn:
+    return AdIn(
+        name=f'Benchmark ad {i}',
+        description='Description of a benchmark ad',
+        price=100,
+        photos=[{'url': f'https://example.com/benchmark/{i}/{photo}.jpg'} for photo in range(3)]
+    )
+
+
+class Benchmark:
+    def __init__(self, url: str, repeat: int):
+        self.url = url
+        self.repeat = repeat
+        self.engine = create_engine(url, **engine_options(url))
+        self.session_factory = sessionmaker(bind=self.engine, autocommit=False, autoflush=False)
+        async_url = _async_url(url)
+        self.async_engine = create_async_engine(async_url, **engine_options(async_url, is_async=True))
+        self.async_session_factory = sessionmaker(
+            self.async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+        )
+
+    def time_direct(self, call: Callable, args: List[tuple]) -> Dict[str, float]:
+        timings = []
+        started_at = time.perf_counter()
+
+        for arguments in args:
+            with self.session_factory() as db:
+                call_started_at = time.perf_counter()
+                call(db, *arguments)
+                timings.append(time.perf_counter() - call_started_at)
+
+        return summary(timings, time.perf_counter() - started_at)
+
+    async def time_asgi(self, requests: List[dict], expected_status: int = 200) -> Dict[str, float]:
+        timings = []
+        started_at = time.perf_counter()
+
+        for request in requests:
+            cache.clear()
+            request_started_at = time.perf_counter()
+            status, body = await asgi_request(application, **request)
+            timings.append(time.perf_counter() - request_started_at)
+            assert status == expected_status, (status, body)
+
+        return summary(timings, time.perf_counter() - started_at)
+
+    def get_ads_cases(self, size: int) -> Iterator[dict]:
+        deep_page = max(1, size // crud.PAGE_SIZE * 9 // 10)
+
+        for date_order, price_order in itertools.product(SORT_ORDERS, SORT_ORDERS):
+            orders = {'date_order': date_order, 'price_order': price_order}
+            query = {key: value.value for key, value in orders.items() if value is not None}
+
+            with self.session_factory() as db:
+                last = crud.get_ads(db, date_order, price_order, deep_page - 1)[-1]
+                cursor = crud.make_cursor(last, date_order, price_order)
+            after = crud.parse_cursor(cursor, date_order, price_order)
+
+            for pagination, page, after_values, page_query in (
+                ('first', 1, None, {}),
+                ('deep_offset', deep_page, None, {'page': deep_page}),
+                ('deep_cursor', deep_page, after, {'cursor': cursor})
+            ):
+                yield {
+                    'params': {**query, 'pagination': pagination},
+                    'direct': (crud.get_ads, [(date_order, price_order, page, after_values)] * self.repeat),
+                    'asgi': [{'method': 'GET', 'path': '/ad/', 'query': {**query, **page_query}}] * self.repeat
+                }
+
+    def get_ad_by_id_cases(self, size: int) -> Iterator[dict]:
+        ids = random.Random(size).choices(range(1, size + 1), k=self.repeat)
+
+        def get_ad_by_id(db, id, fields):
+            crud.get_ad_by_id(db, id, ExtraFields.DESCRIPTION in fields, ExtraFields.PHOTOS in fields)
+
+        for fields in FIELDS:
+            values = [field.value for field in fields]
+            yield {
+                'params': {'fields': values},
+                'direct': (get_ad_by_id, [(id, fields) for id in ids]),
+                'asgi': [{'method': 'GET', 'path': f'/ad/{id}', 'query': {'fields': values}} for id in ids]
+            }
+
+    async def run(self, size: int, results: List[dict]):
+        database = self.engine.dialect.name
+
+        def record(case: str, params: dict, mode: str, result: Dict[str, float]):
+            results.append({'database': database, 'size': size, 'case': case, 'params': params, 'mode': mode, **result})
+            print(f'{database} {size} {case} {params} {mode}: {result["p50_us"]} us', file=sys.stderr)
+
+        seed(self.engine, size)
+        override_database(application, self.session_factory, self.async_session_factory)
+
+        for case, cases in (('get_ads', self.get_ads_cases(size)), ('get_ad_by_id', self.get_ad_by_id_cases(size))):
+            for item in cases:
+                call, args = item['direct']
+                record(case, item['params'], 'direct', self.time_direct(call, args))
+                record(case, item['params'], 'asgi', await self.time_asgi(item['asgi']))
+
+        # writes go last, they change the data the reads above are measured on
+        ads = [_new_ad(i) for i in range(self.repeat)]
+        record('save_ad', {}, 'direct', self.time_direct(crud.save_ad, [(ad,) for ad in ads]))
+        record('save_ad', {}, 'asgi', await self.time_asgi(
+            [{'method': 'POST', 'path': '/ad/', 'body': json.loads(ad.json())} for ad in ads], expected_status=201
+        ))
+
+    async def close(self):
+        for dependency in DATABASE_DEPENDENCIES:
+            application.dependency_overrides.pop(dependency, None)
+        self.engine.dispose()
+        await self.async_engine.dispose()
+
+
+def _available(url: str) -> bool:
+    engine = create_engine(url)
+
+    try:
+        with engine.connect():
+            return True
+    except OperationalError:
+        return False
+    finally:
+        engine.dispose()
+
+
+async def run(urls: List[str], sizes: List[int], repeat: int) -> dict:
+    results = []
+
+    for url in urls:
+        benchmark = Benchmark(url, repeat)
+        try:
+            for size in sizes:
+                await benchmark.run(size, results)
+        finally:
+            await benchmark.close()
+
+    return {'environment': environment(urls), 'repeat': repeat, 'results': results}
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES), help='numbers of ads to seed')
+    parser.add_argument('--repeat', type=int, default=100, help='calls per case and mode')
+    parser.add_argument('--database-url', action='append', default=[], help='additional database, wiped')
+    parser.add_argument('--no-sqlite', action='store_true', help='skip the temporary SQLite database')
+    parser.add_argument('--output', type=argparse.FileType('w'), default=sys.stdout)
+    args = parser.parse_args(argv)
+
+    # deep OFFSET pages are slow on purpose here
+    logging.getLogger('application.metrics').setLevel(logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as directory:
+        urls = [] if args.no_sqlite else [f'sqlite:///{os.path.join(directory, "benchmark.sqlite3")}']
+        urls += args.database_url
+        postgresql_url = os.getenv('BENCHMARK_POSTGRESQL_URL')
+        if postgresql_url and postgresql_url not in urls:
+            if _available(postgresql_url):
+                urls.append(postgresql_url)
+            else:
+                print(f'Skipping {postgresql_url}: not available', file=sys.stderr)
+
+        results = asyncio.run(run(urls, args.sizes, args.repeat))
+
+    with args.output:
+        json.dump(results, args.output, indent=2)
+        args.output.write('\n')
+
+
+if __name__ == '__main__':
+    main()
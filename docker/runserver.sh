@@ -1,4 +1,4 @@
 #!/bin/sh
 
 alembic upgrade head
-uvicorn application.asgi:application --port 80 --host 0.0.0.0
+exec python -m application.serve --port 80 --host 0.0.0.0
@@ -0,0 +1,24 @@
+"""Shared by the migrations in versions/, importable since alembic.ini prepends the project root to sys.path."""
+import sqlalchemy as sa
+
+BATCH_SIZE = 10_000
+
+# created by DDL events of the models and by the migrations, with the shadow tables of FTS5 on SQLite
+UNMODELED_TABLES = 'ad_search'
+
+
+def backfill(connection, statement: str, batch_size: int = BATCH_SIZE):
+    """Execute the statement for every range of ad IDs, given as :start (exclusive) and :end (inclusive).
+
+    ID ranges keep every statement small, whatever the size of the table.
+    """
+    statement = sa.text(statement)
+    last_id = connection.execute(sa.text('SELECT coalesce(max(id), 0) FROM ad')).scalar()
+
+    for start in range(0, last_id, batch_size):
+        connection.execute(statement, {'start': start, 'end': start + batch_size})
+
+
+def include_object(object, name: str, type_: str, reflected: bool, compare_to) -> bool:
+    """Leaves the tables the models do not declare out of autogenerate, which would drop them otherwise."""
+    return not (type_ == 'table' and name.startswith(UNMODELED_TABLES))
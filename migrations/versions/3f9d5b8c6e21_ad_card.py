@@ -0,0 +1,67 @@
+"""ad card
+
+Revision ID: 3f9d5b8c6e21
+Revises: a7c4d2e9f815
+Create Date: 2026-10-18 15:02:44.180365
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import sqlite
+
+from migrations.helpers import backfill
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9d5b8c6e21'
+down_revision = 'a7c4d2e9f815'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'ad_card',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=200), nullable=False),
+        sa.Column('price', sa.DECIMAL(), nullable=True),
+        sa.Column(
+            'date',
+            sa.DateTime().with_variant(sqlite.DATETIME(truncate_microseconds=True), 'sqlite'),
+            nullable=True
+        ),
+        sa.Column('main_photo_url', sa.String(length=512), nullable=True),
+        sa.Column('json', sa.Text(), nullable=True),
+        sa.ForeignKeyConstraint(['id'], ['ad.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+    # json is left NULL, those cards are rendered when read
+    backfill(
+        op.get_bind(),
+        'INSERT INTO ad_card (id, name, price, date, main_photo_url) '
+        'SELECT id, name, price, date, main_photo_url FROM ad WHERE id > :start AND id <= :end'
+    )
+
+    # built once the rows are in; the list no longer reads the ad table, so its indexes go
+    op.create_index('ix_ad_card_date_id_price', 'ad_card', ['date', 'id', 'price'], unique=False)
+    op.create_index('ix_ad_card_price_id_date', 'ad_card', ['price', 'id', 'date'], unique=False)
+    op.create_index('ix_ad_card_date_price_id', 'ad_card', ['date', 'price', 'id'], unique=False)
+    op.create_index(
+        'ix_ad_card_date_price_desc_id_desc', 'ad_card', ['date', sa.text('price DESC'), sa.text('id DESC')],
+        unique=False
+    )
+    op.drop_index('ix_ad_date_price_desc_id_desc', table_name='ad')
+    op.drop_index('ix_ad_date_price_id', table_name='ad')
+    op.drop_index('ix_ad_price_id_date', table_name='ad')
+    op.drop_index('ix_ad_date_id_price', table_name='ad')
+
+
+def downgrade():
+    op.create_index('ix_ad_date_id_price', 'ad', ['date', 'id', 'price'], unique=False)
+    op.create_index('ix_ad_price_id_date', 'ad', ['price', 'id', 'date'], unique=False)
+    op.create_index('ix_ad_date_price_id', 'ad', ['date', 'price', 'id'], unique=False)
+    op.create_index(
+        'ix_ad_date_price_desc_id_desc', 'ad', ['date', sa.text('price DESC'), sa.text('id DESC')], unique=False
+    )
+    op.drop_table('ad_card')
@@ -0,0 +1,37 @@
+"""keyset pagination indexes
+
+Revision ID: 4f2a9c1e7b3d
+Revises: d551dc7fee10
+Create Date: 2026-10-18 10:12:31.204518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f2a9c1e7b3d'
+down_revision = 'd551dc7fee10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_ad_date_id', 'ad', ['date', 'id'], unique=False)
+    op.create_index('ix_ad_price_id', 'ad', ['price', 'id'], unique=False)
+    op.create_index('ix_ad_date_price_id', 'ad', ['date', 'price', 'id'], unique=False)
+    op.create_index(
+        'ix_ad_date_price_desc_id_desc', 'ad', ['date', sa.text('price DESC'), sa.text('id DESC')], unique=False
+    )
+    # superseded by the composite indexes above
+    op.drop_index('ix_ad_date', table_name='ad')
+    op.drop_index('ix_ad_price', table_name='ad')
+
+
+def downgrade():
+    op.create_index('ix_ad_price', 'ad', ['price'], unique=False)
+    op.create_index('ix_ad_date', 'ad', ['date'], unique=False)
+    op.drop_index('ix_ad_date_price_desc_id_desc', table_name='ad')
+    op.drop_index('ix_ad_date_price_id', table_name='ad')
+    op.drop_index('ix_ad_price_id', table_name='ad')
+    op.drop_index('ix_ad_date_id', table_name='ad')
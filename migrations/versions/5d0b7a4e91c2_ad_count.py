@@ -0,0 +1,29 @@
+"""ad count
+
+Revision ID: 5d0b7a4e91c2
+Revises: c3e81f6a2d94
+Create Date: 2026-10-18 13:02:41.208364
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d0b7a4e91c2'
+down_revision = 'c3e81f6a2d94'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ad_count',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('value', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute('INSERT INTO ad_count (id, value) SELECT 1, count(*) FROM ad')
+
+
+def downgrade():
+    op.drop_table('ad_count')
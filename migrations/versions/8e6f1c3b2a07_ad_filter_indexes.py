@@ -0,0 +1,32 @@
+"""ad filter indexes
+
+Revision ID: 8e6f1c3b2a07
+Revises: 5d0b7a4e91c2
+Create Date: 2026-10-18 13:41:09.553817
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e6f1c3b2a07'
+down_revision = '5d0b7a4e91c2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # the other filter column rides along, so a range on one column sorted by the other is filtered in the index
+    op.create_index('ix_ad_date_id_price', 'ad', ['date', 'id', 'price'], unique=False)
+    op.create_index('ix_ad_price_id_date', 'ad', ['price', 'id', 'date'], unique=False)
+    # prefixes of the indexes above
+    op.drop_index('ix_ad_date_id', table_name='ad')
+    op.drop_index('ix_ad_price_id', table_name='ad')
+
+
+def downgrade():
+    op.create_index('ix_ad_price_id', 'ad', ['price', 'id'], unique=False)
+    op.create_index('ix_ad_date_id', 'ad', ['date', 'id'], unique=False)
+    op.drop_index('ix_ad_price_id_date', table_name='ad')
+    op.drop_index('ix_ad_date_id_price', table_name='ad')
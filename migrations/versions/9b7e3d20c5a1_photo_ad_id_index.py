@@ -0,0 +1,24 @@
+"""photo ad_id index
+
+Revision ID: 9b7e3d20c5a1
+Revises: 4f2a9c1e7b3d
+Create Date: 2026-10-18 11:02:47.915306
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b7e3d20c5a1'
+down_revision = '4f2a9c1e7b3d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(op.f('ix_photo_ad_id'), 'photo', ['ad_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_photo_ad_id'), table_name='photo')
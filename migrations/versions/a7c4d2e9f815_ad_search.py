@@ -0,0 +1,45 @@
+"""ad search
+
+Revision ID: a7c4d2e9f815
+Revises: 8e6f1c3b2a07
+Create Date: 2026-10-18 14:20:37.916042
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import backfill
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c4d2e9f815'
+down_revision = '8e6f1c3b2a07'
+branch_labels = None
+depends_on = None
+
+SEARCH_DOCUMENT = (
+    "setweight(to_tsvector('simple', name), 'A') || setweight(to_tsvector('simple', description), 'B')"
+)
+
+
+def upgrade():
+    connection = op.get_bind()
+
+    if connection.dialect.name == 'postgresql':
+        op.execute('CREATE TABLE ad_search (ad_id INTEGER PRIMARY KEY REFERENCES ad (id), document TSVECTOR NOT NULL)')
+        statement = f'INSERT INTO ad_search (ad_id, document) SELECT id, {SEARCH_DOCUMENT} FROM ad ' \
+                    'WHERE id > :start AND id <= :end'
+    else:
+        op.execute("CREATE VIRTUAL TABLE ad_search USING fts5(name, description, content='')")
+        statement = 'INSERT INTO ad_search (rowid, name, description) SELECT id, name, description FROM ad ' \
+                    'WHERE id > :start AND id <= :end'
+
+    backfill(connection, statement)
+
+    if connection.dialect.name == 'postgresql':
+        # built once the rows are in, which is faster than maintaining it row by row
+        op.execute('CREATE INDEX ix_ad_search_document ON ad_search USING gin (document)')
+
+
+def downgrade():
+    op.execute('DROP TABLE ad_search')
@@ -0,0 +1,34 @@
+"""ad photo_urls
+
+Revision ID: b2d8e4f07a63
+Revises: 3f9d5b8c6e21
+Create Date: 2026-10-18 15:47:12.604118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import backfill
+
+
+# revision identifiers, used by Alembic.
+revision = 'b2d8e4f07a63'
+down_revision = '3f9d5b8c6e21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('ad', sa.Column('photo_urls', sa.JSON(), nullable=True))
+
+    connection = op.get_bind()
+    if connection.dialect.name == 'postgresql':
+        urls = "SELECT coalesce(json_agg(url ORDER BY id), '[]') FROM photo WHERE photo.ad_id = ad.id"
+    else:
+        urls = 'SELECT json_group_array(url) FROM (SELECT url FROM photo WHERE photo.ad_id = ad.id ORDER BY id)'
+    backfill(connection, f'UPDATE ad SET photo_urls = ({urls}) WHERE id > :start AND id <= :end')
+
+
+def downgrade():
+    with op.batch_alter_table('ad') as batch_op:
+        batch_op.drop_column('photo_urls')
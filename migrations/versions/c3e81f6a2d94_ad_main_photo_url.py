@@ -0,0 +1,30 @@
+"""ad main_photo_url
+
+Revision ID: c3e81f6a2d94
+Revises: 9b7e3d20c5a1
+Create Date: 2026-10-18 11:48:05.671392
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3e81f6a2d94'
+down_revision = '9b7e3d20c5a1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('ad', sa.Column('main_photo_url', sa.String(length=512), nullable=True))
+    op.execute(
+        'UPDATE ad SET main_photo_url = ('
+        'SELECT photo.url FROM photo WHERE photo.ad_id = ad.id ORDER BY photo.id LIMIT 1'
+        ')'
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('ad') as batch_op:
+        batch_op.drop_column('main_photo_url')
@@ -0,0 +1,26 @@
+"""ad date and price indexes
+
+Revision ID: e4b6c8d0f2a1
+Revises: b2d8e4f07a63
+Create Date: 2026-10-18 18:41:09.527310
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4b6c8d0f2a1'
+down_revision = 'b2d8e4f07a63'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # dropped when the list moved to ad_card, still needed by the export since a date and the ordered search
+    op.create_index('ix_ad_date_id', 'ad', ['date', 'id'], unique=False)
+    op.create_index('ix_ad_price_id', 'ad', ['price', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_ad_price_id', table_name='ad')
+    op.drop_index('ix_ad_date_id', table_name='ad')
@@ -0,0 +1,29 @@
+"""ad count shards
+
+Revision ID: f7c2a9e4d1b8
+Revises: e4b6c8d0f2a1
+Create Date: 2026-10-18 21:12:36.402815
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f7c2a9e4d1b8'
+down_revision = 'e4b6c8d0f2a1'
+branch_labels = None
+depends_on = None
+
+# AD_COUNT_SHARDS at this revision
+SHARDS = 16
+
+
+def upgrade():
+    # the existing row keeps the count, the others start at 0
+    op.execute('INSERT INTO ad_count (id, value) VALUES ' + ', '.join(f'({id}, 0)' for id in range(2, SHARDS + 1)))
+
+
+def downgrade():
+    op.execute('UPDATE ad_count SET value = (SELECT sum(value) FROM ad_count) WHERE id = 1')
+    op.execute('DELETE FROM ad_count WHERE id > 1')
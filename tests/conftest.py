@@ -1,11 +1,18 @@
+import contextlib
+
 import pytest
+from fastapi import FastAPI
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 
+from application import cache, metrics
 from application.config import get_config
-from application.database import Base, get_db
-from application.asgi import application
+from application.database import Base, get_async_db, get_async_read_db, get_db, get_read_db
+from application.asgi import create_app
+from application.routers import ad_async
 
 config = get_config()
 
@@ -13,6 +20,28 @@ SQLALCHEMY_DATABASE_URL = config.SQLALCHEMY_DATABASE_URL
 
 engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+metrics.instrument_engine('test', engine)
+
+# TestClient runs every request in a fresh event loop, so async connections must not be pooled
+async_engine = create_async_engine(config.SQLALCHEMY_ASYNC_DATABASE_URL, poolclass=NullPool)
+TestingAsyncSessionLocal = sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+application = create_app(config)
+
+
+def walk_pages(client, params: dict) -> list:
+    """The IDs of all the ads of GET /ad/, following X-Next-Cursor from the first page to the last."""
+    ids = []
+    response = client.get('/ad/', params=params)
+
+    while 'X-Next-Cursor' in response.headers:
+        ids.extend(ad['id'] for ad in response.json())
+        response = client.get('/ad/', params={**params, 'cursor': response.headers['X-Next-Cursor']})
+
+    assert response.status_code == 200
+    ids.extend(ad['id'] for ad in response.json())
+
+    return ids
 
 
 @pytest.fixture
@@ -24,6 +53,7 @@ def test_db():
     finally:
         db.close()
         Base.metadata.drop_all(bind=engine)
+        cache.clear()
 
 
 @pytest.fixture
@@ -32,8 +62,49 @@ def client(test_db):
         yield test_db
     
     application.dependency_overrides[get_db] = override_get_db
-    yield TestClient(application)
-    del application.dependency_overrides[get_db]
+    application.dependency_overrides[get_read_db] = override_get_db
+    # the app connects to the database of the config on startup, for the routes that are not overridden
+    with TestClient(application) as client:
+        yield client
+    application.dependency_overrides.pop(get_db, None)
+    application.dependency_overrides.pop(get_read_db, None)
+
+
+@pytest.fixture
+def async_client(test_db):
+    async def override_get_async_db():
+        async with TestingAsyncSessionLocal() as db:
+            yield db
+
+    async_application = FastAPI()
+    async_application.include_router(ad_async.router)
+    async_application.dependency_overrides[get_async_db] = override_get_async_db
+    async_application.dependency_overrides[get_async_read_db] = override_get_async_db
+    yield TestClient(async_application)
+
+
+@pytest.fixture
+def sql_statements():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    yield statements
+    event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+@pytest.fixture
+def max_queries(sql_statements):
+    @contextlib.contextmanager
+    def assert_max_queries(limit):
+        start = len(sql_statements)
+        yield
+        issued = sql_statements[start:]
+        assert len(issued) <= limit, f'{len(issued)} statements, at most {limit} expected:\n' + '\n'.join(issued)
+
+    return assert_max_queries
 
 
 @pytest.fixture
@@ -0,0 +1,73 @@
+import datetime
+
+import pytest
+
+from application import crud, dto
+from application.database.models import Ad
+
+
+def test_async_ad_create_success(async_client, test_db, ad_sample_input):
+    response = async_client.post('/ad/', json=ad_sample_input)
+
+    assert response.status_code == 201
+
+    ad = crud.get_ad_by_id(test_db, response.json()['id'])
+    assert ad.name == ad_sample_input['name']
+    assert [photo.url for photo in ad.photos] == [photo['url'] for photo in ad_sample_input['photos']]
+
+
+def test_async_ad_create_invalid(async_client, test_db, ad_sample_input):
+    response = async_client.post('/ad/', json={**ad_sample_input, 'photos': []})
+
+    assert response.status_code == 422
+
+
+@pytest.mark.parametrize('photo_storage', ['embedded', 'table'])
+@pytest.mark.parametrize('fields', [[], ['description'], ['photos'], ['photos', 'description']])
+def test_async_get_ad_success(async_client, test_db, ad_sample_input, fields, photo_storage, monkeypatch):
+    monkeypatch.setattr(crud.config, 'PHOTO_STORAGE', photo_storage)
+    ad = crud.save_ad(test_db, dto.AdIn(**ad_sample_input))
+
+    response = async_client.get(f'/ad/{ad.id}/', params={'fields': fields})
+
+    assert response.status_code == 200
+
+    data = response.json()
+    assert data['id'] == ad.id
+    assert data['main_photo'] == ad_sample_input['photos'][0]
+    assert data.get('description') == (ad_sample_input['description'] if 'description' in fields else None)
+    assert data.get('photos') == (ad_sample_input['photos'] if 'photos' in fields else None)
+
+
+def test_async_get_ad_not_found(async_client, test_db):
+    response = async_client.get('/ad/1/')
+
+    assert response.status_code == 404
+    assert response.json() == {'detail': 'NOT_FOUND'}
+
+
+def test_async_get_ads_matches_sync(client, async_client, test_db, ad_sample_input):
+    ads = [crud.save_ad(test_db, dto.AdIn(**{**ad_sample_input, 'price': i % 4 + 1})) for i in range(15)]
+
+    for i, ad in enumerate(ads):
+        ad.date = datetime.datetime(2021, 1, 1, 0, 0, i)
+        test_db.add(ad)
+        test_db.commit()
+
+    params = {'date_order': crud.SortOrder.DESC, 'price_order': crud.SortOrder.ASC}
+    sync_response = client.get('/ad/', params=params)
+    async_response = async_client.get('/ad/', params=params)
+
+    assert async_response.status_code == 200
+    assert async_response.json() == sync_response.json()
+    assert async_response.headers['X-Next-Cursor'] == sync_response.headers['X-Next-Cursor']
+
+    async_response = async_client.get('/ad/', params={**params, 'cursor': async_response.headers['X-Next-Cursor']})
+
+    assert [ad['id'] for ad in async_response.json()] == [
+        ad.id for ad in test_db.query(Ad).order_by(Ad.date.desc(), Ad.price.asc(), Ad.id.asc()).offset(crud.PAGE_SIZE)
+    ]
+
+    params = {**params, 'envelope': True, 'page': 2}
+
+    assert async_client.get('/ad/', params=params).json() == client.get('/ad/', params=params).json()
@@ -0,0 +1,85 @@
+import datetime
+import json
+
+import pytest
+from fastapi.encoders import jsonable_encoder
+
+from application import cache, crud, dto, serializers
+from application.crud import SortOrder
+from application.database.models import Ad, AdCard
+
+
+def test_save_ad_writes_card(client, test_db, ad_sample_input):
+    ad = crud.save_ad(test_db, dto.AdIn(**ad_sample_input))
+    card = test_db.get(AdCard, ad.id)
+
+    assert (card.name, card.price, card.date, card.main_photo_url) == (ad.name, ad.price, ad.date, ad.main_photo_url)
+    assert json.loads(card.json) == client.get('/ad/').json()[0]
+
+
+def test_add_ads_writes_cards(client, test_db, ad_sample_input):
+    ids = [ad['id'] for ad in client.post('/ad/batch', json=[ad_sample_input] * 3).json()]
+
+    assert [card.id for card in test_db.query(AdCard).order_by(AdCard.id)] == ids
+
+
+def test_cards_without_json_render_the_same(client, test_db, ad_sample_input):
+    for i in range(12):
+        crud.save_ad(test_db, dto.AdIn(**{**ad_sample_input, 'price': i + 1}))
+    params = {'price_order': SortOrder.DESC, 'envelope': True}
+    expected = client.get('/ad/', params=params).json()
+
+    # as backfilled by the migration
+    test_db.query(AdCard).update({AdCard.json: None})
+    test_db.commit()
+    cache.clear()
+
+    assert client.get('/ad/', params=params).json() == expected
+
+
+def test_card_follows_ad_updates(client, test_db, ad_sample_input):
+    ads = [crud.save_ad(test_db, dto.AdIn(**ad_sample_input)) for _ in range(2)]
+
+    ads[0].date = datetime.datetime(2030, 1, 1)
+    ads[0].name = 'Renamed ad'
+    test_db.commit()
+
+    data = client.get('/ad/', params={'date_order': SortOrder.DESC}).json()
+    assert [(ad['id'], ad['name']) for ad in data] == [(ads[0].id, 'Renamed ad'), (ads[1].id, ads[1].name)]
+    assert test_db.query(Ad).count() == test_db.query(AdCard).count() == 2
+
+
+@pytest.mark.parametrize('client_fixture', ['client', 'async_client'])
+def test_ad_update_invalidates_cached_responses(request, test_db, ad_sample_input, client_fixture):
+    client = request.getfixturevalue(client_fixture)
+    ad = crud.save_ad(test_db, dto.AdIn(**ad_sample_input))
+    urls = ['/ad/', f'/ad/{ad.id}/']
+    before = {url: client.get(url) for url in urls}
+
+    ad.name = 'Renamed ad'
+    test_db.commit()
+
+    for url in urls:
+        response = client.get(url, headers={'If-None-Match': before[url].headers['ETag']})
+
+        assert response.status_code == 200
+        assert response.headers['ETag'] != before[url].headers['ETag']
+        assert 'Renamed ad' in response.text
+
+
+def test_list_page_renders_the_same_without_fast_serialization(client, test_db, ad_sample_input, monkeypatch):
+    for i in range(12):
+        crud.save_ad(test_db, dto.AdIn(**{**ad_sample_input, 'name': f'Объявление #{i}', 'price': i + 1.5}))
+    params = {'price_order': SortOrder.DESC, 'envelope': True}
+    fast = client.get('/ad/', params=params).content
+
+    encoded = []
+    monkeypatch.setattr(serializers, 'jsonable_encoder', lambda *args, **kwargs: encoded.append(args) or
+                        jsonable_encoder(*args, **kwargs))
+    monkeypatch.setattr(serializers.config, 'FAST_SERIALIZATION', False)
+    cache.clear()
+    slow = client.get('/ad/', params=params).content
+
+    assert slow == fast
+    # the stored card JSON is left to the fast path
+    assert len(encoded) == crud.PAGE_SIZE
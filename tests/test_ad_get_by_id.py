@@ -1,6 +1,6 @@
 import pytest
 
-from application import crud, dto
+from application import cache, crud, dto
 
 
 def test_get_ad_success(client, test_db, ad_sample_input):
@@ -32,7 +32,9 @@ def test_get_ad_with_description_success(client, test_db, ad_sample_input):
     assert data['main_photo'] == ad_sample_input['photos'][0]
 
 
-def test_get_ad_with_photos_success(client, test_db, ad_sample_input):
+@pytest.mark.parametrize('photo_storage', ['embedded', 'table'])
+def test_get_ad_with_photos_success(client, test_db, ad_sample_input, photo_storage, monkeypatch):
+    monkeypatch.setattr(crud.config, 'PHOTO_STORAGE', photo_storage)
     ad = crud.save_ad(test_db, dto.AdIn(**ad_sample_input))
 
     response = client.get(f'/ad/{ad.id}/', params={'fields': ['photos']})
@@ -76,3 +78,51 @@ def test_get_ad_not_found(client, test_db):
 
     assert response.status_code == 404
     assert response.json() == {'detail': 'NOT_FOUND'}
+
+
+def test_get_ad_served_from_cache(client, test_db, ad_sample_input, sql_statements):
+    ad = crud.save_ad(test_db, dto.AdIn(**ad_sample_input))
+
+    first = client.get(f'/ad/{ad.id}/', params={'fields': ['photos', 'description']})
+    sql_statements.clear()
+    second = client.get(f'/ad/{ad.id}/', params={'fields': ['description', 'photos']})
+
+    assert second.status_code == 200
+    assert second.content == first.content
+    assert sql_statements == []
+    assert cache.ads.hits == 1
+
+
+def test_get_ad_not_found_is_cached_until_insert(client, test_db, ad_sample_input, sql_statements):
+    client.get('/ad/1/')
+    sql_statements.clear()
+
+    assert client.get('/ad/1/').status_code == 404
+    assert sql_statements == []
+
+    crud.save_ad(test_db, dto.AdIn(**ad_sample_input))
+
+    assert client.get('/ad/1/').status_code == 200
+
+
+@pytest.mark.parametrize('photo_storage', ['embedded', 'table'])
+def test_get_ad_reads_only_the_requested_fields(
+    client, test_db, ad_sample_input, sql_statements, photo_storage, monkeypatch
+):
+    monkeypatch.setattr(crud.config, 'PHOTO_STORAGE', photo_storage)
+    ad = crud.save_ad(test_db, dto.AdIn(**ad_sample_input))
+    sql_statements.clear()
+
+    for fields in ([], ['description'], ['photos']):
+        assert client.get(f'/ad/{ad.id}/', params={'fields': fields}).status_code == 200
+
+    default, description, photos = sql_statements
+
+    assert 'ad.main_photo_url' in default
+    assert not any(column in default for column in ('ad.description', 'ad.photo_urls', 'photo_1'))
+    assert 'ad.description' in description and 'ad.photo_urls' not in description
+    assert 'ad.description' not in photos
+    if photo_storage == 'embedded':
+        assert 'ad.photo_urls' in photos and 'JOIN' not in photos
+    else:
+        assert 'ad.photo_urls' not in photos and 'LEFT OUTER JOIN photo' in photos
@@ -0,0 +1,78 @@
+import pytest
+
+from application import crud
+from application.config import get_config
+from application.database.models import Ad, Photo
+
+config = get_config()
+
+
+@pytest.fixture
+def ads_batch_input(ad_sample_input):
+    return [{
+        **ad_sample_input,
+        'name': f'Ad #{i}',
+        'photos': [{'url': f'http://example.com/{i}/{j}.jpg'} for j in range(1, i % 3 + 2)]
+    } for i in range(1, 6)]
+
+
+def test_ads_create_batch_success(client, test_db, ads_batch_input, sql_statements):
+    response = client.post('/ad/batch', json=ads_batch_input)
+
+    assert response.status_code == 201
+
+    ids = [item['id'] for item in response.json()]
+    assert len(set(ids)) == len(ads_batch_input)
+
+    for id, ad_input in zip(ids, ads_batch_input):
+        ad = crud.get_ad_by_id(test_db, id)
+        assert ad.name == ad_input['name']
+        assert ad.main_photo_url == ad_input['photos'][0]['url']
+        assert [photo.url for photo in ad.photos] == [photo['url'] for photo in ad_input['photos']]
+        assert ad.photo_urls == [photo['url'] for photo in ad_input['photos']]
+
+    ad_inserts = [statement for statement in sql_statements if statement.startswith('INSERT INTO ad ')]
+    assert len(ad_inserts) == 1 # all the ads go in a single multi-row INSERT
+
+    photo_inserts = [statement for statement in sql_statements if statement.startswith('INSERT INTO photo')]
+    assert len(photo_inserts) == 1 # all the photos go in a single executemany
+
+
+def test_ads_create_batch_chunked(client, test_db, ads_batch_input, sql_statements, monkeypatch):
+    # 5 columns a row: 2 rows a statement
+    monkeypatch.setattr(crud, 'SQLITE_MAX_VARIABLE_NUMBER', 10)
+
+    response = client.post('/ad/batch', json=ads_batch_input)
+
+    assert response.status_code == 201
+    assert [crud.get_ad_by_id(test_db, item['id']).name for item in response.json()] == [
+        ad['name'] for ad in ads_batch_input
+    ]
+    assert len([statement for statement in sql_statements if statement.startswith('INSERT INTO ad ')]) == 3
+
+
+def test_ads_create_batch_async(async_client, test_db, ads_batch_input):
+    response = async_client.post('/ad/batch', json=ads_batch_input)
+
+    assert response.status_code == 201
+    assert [crud.get_ad_by_id(test_db, item['id']).name for item in response.json()] == [
+        ad['name'] for ad in ads_batch_input
+    ]
+
+
+def test_ads_create_batch_invalid_item(client, test_db, ads_batch_input):
+    ads_batch_input[3]['price'] = 0
+
+    response = client.post('/ad/batch', json=ads_batch_input)
+
+    assert response.status_code == 422
+    assert [error['loc'] for error in response.json()['detail']] == [['body', 3, 'price']]
+    assert test_db.query(Ad).count() == 0
+    assert test_db.query(Photo).count() == 0
+
+
+@pytest.mark.parametrize('size', [0, config.AD_BATCH_MAX_SIZE + 1])
+def test_ads_create_batch_invalid_size(client, test_db, ad_sample_input, size):
+    response = client.post('/ad/batch', json=[ad_sample_input] * size)
+
+    assert response.status_code == 422
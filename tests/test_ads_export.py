@@ -0,0 +1,89 @@
+import datetime
+import json
+
+import pytest
+from sqlalchemy import text
+
+from application import crud, dto
+
+from .conftest import engine
+
+
+@pytest.fixture
+def ads(test_db, ad_sample_input):
+    ads = [crud.save_ad(test_db, dto.AdIn(**{
+        **ad_sample_input,
+        'name': f'Ad #{i}',
+        'price': i * 100,
+        'photos': [{'url': f'http://example.com/{i}/{j}.jpg'} for j in range(1, i % 3 + 2)]
+    })) for i in range(1, 8)]
+
+    for i, ad in enumerate(ads):
+        ad.date = datetime.datetime(2021, 1, 1 + i)
+        test_db.add(ad)
+        test_db.commit()
+
+    return ads
+
+
+def export(client, **params):
+    response = client.get('/ad/export', params=params)
+
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'application/x-ndjson'
+
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+@pytest.mark.parametrize('client_fixture', ['client', 'async_client'])
+@pytest.mark.parametrize('photo_storage', ['embedded', 'table'])
+def test_export_all_ads(request, test_db, ads, photo_storage, client_fixture, monkeypatch):
+    client = request.getfixturevalue(client_fixture)
+    monkeypatch.setattr(crud, 'EXPORT_BATCH_SIZE', 2)
+    monkeypatch.setattr(crud.config, 'PHOTO_STORAGE', photo_storage)
+
+    lines = export(client)
+
+    assert [line['id'] for line in lines] == [ad.id for ad in ads]
+    for line, ad in zip(lines, ads):
+        assert line == {
+            'id': ad.id,
+            'name': ad.name,
+            'description': ad.description,
+            'price': float(ad.price),
+            'date': ad.date.isoformat(),
+            'photos': [{'url': photo.url} for photo in ad.photos]
+        }
+
+
+def test_export_empty_db(client, test_db):
+    assert export(client) == []
+
+
+def test_export_since_id(client, test_db, ads):
+    assert [line['id'] for line in export(client, since_id=ads[4].id)] == [ad.id for ad in ads[5:]]
+
+
+def test_export_since_date(client, test_db, ads):
+    assert [line['id'] for line in export(client, since_date='2021-01-03T00:00:00')] == [ad.id for ad in ads[2:]]
+
+    # dates out of ID order
+    ads[1].date = datetime.datetime(2021, 2, 1)
+    test_db.commit()
+
+    assert [line['id'] for line in export(client, since_date='2021-01-03T00:00:00')] == [ad.id for ad in ads[1:]]
+
+
+def test_export_since_date_query_plan(test_db):
+    statement = crud._export_statement(None, datetime.datetime(2021, 1, 1))
+    compiled = statement.compile(engine, compile_kwargs={'literal_binds': True})
+
+    with engine.connect() as connection:
+        plan = [row[3] for row in connection.execute(text(f'EXPLAIN QUERY PLAN {compiled}'))]
+
+    assert 'SEARCH ad USING COVERING INDEX ix_ad_date_id (date>?)' in plan, plan
+    assert not any(step.startswith('SCAN') for step in plan), plan
+
+
+def test_export_async(client, async_client, test_db, ads):
+    assert export(async_client, since_id=ads[0].id) == export(client, since_id=ads[0].id)
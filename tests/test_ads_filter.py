@@ -0,0 +1,120 @@
+import datetime
+import itertools
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import text
+
+from application import crud, dto
+from application.crud import AdFilters, SortOrder
+from application.database.models import Ad
+
+from .conftest import engine, walk_pages
+
+ORDERS = list(itertools.product([None, SortOrder.ASC, SortOrder.DESC], repeat=2))
+
+PRICE_RANGE = {'price_min': 500, 'price_max': 1500}
+
+DATE_RANGE = {'date_from': '2021-01-01T00:00:05', 'date_to': '2021-01-01T00:00:14'}
+
+
+@pytest.fixture
+def ads(test_db, ad_sample_input):
+    ads = [crud.save_ad(test_db, dto.AdIn(**{**ad_sample_input, 'price': 100 * (i % 20 + 1)})) for i in range(30)]
+
+    for i, ad in enumerate(ads):
+        ad.date = datetime.datetime(2021, 1, 1, 0, 0, (i * 7) % 30)
+    test_db.commit()
+
+    return ads
+
+
+def _expected(test_db, date_order, price_order, **params):
+    keys = [(Ad.date, date_order), (Ad.price, price_order)]
+    keys = [(column, order) for column, order in keys if order is not None]
+    keys.append((Ad.id, keys[-1][1] if keys else SortOrder.ASC))
+    query = test_db.query(Ad).order_by(*[
+        column.asc() if order == SortOrder.ASC else column.desc() for column, order in keys
+    ])
+
+    if 'price_min' in params:
+        query = query.filter(Ad.price >= params['price_min'], Ad.price <= params['price_max'])
+    if 'date_from' in params:
+        query = query.filter(
+            Ad.date >= datetime.datetime.fromisoformat(params['date_from']),
+            Ad.date <= datetime.datetime.fromisoformat(params['date_to'])
+        )
+
+    return [ad.id for ad in query]
+
+
+@pytest.mark.parametrize('date_order, price_order', ORDERS)
+@pytest.mark.parametrize('bounds', [PRICE_RANGE, DATE_RANGE, {**PRICE_RANGE, **DATE_RANGE}])
+def test_get_ads_filtered_walks_all_pages(client, test_db, ads, date_order, price_order, bounds):
+    params = {'date_order': date_order, 'price_order': price_order, **bounds}
+    actual = walk_pages(client, params)
+
+    assert actual == _expected(test_db, date_order, price_order, **bounds)
+
+
+def test_get_ads_filtered_envelope(client, test_db, ads):
+    data = client.get('/ad/', params={'envelope': True, **PRICE_RANGE, **DATE_RANGE}).json()
+    expected = _expected(test_db, None, None, **PRICE_RANGE, **DATE_RANGE)
+
+    assert [ad['id'] for ad in data['items']] == expected[:crud.PAGE_SIZE]
+    assert data['total'] == len(expected)
+
+
+def test_get_ads_filtered_count_is_capped(client, test_db, ads, monkeypatch):
+    monkeypatch.setattr(crud.config, 'AD_COUNT_FILTERED_LIMIT', 12)
+    expected = _expected(test_db, None, None, **PRICE_RANGE)
+
+    data = client.get('/ad/', params={'envelope': True, **PRICE_RANGE}).json()
+
+    assert len(expected) > 12
+    assert (data['total'], data['has_next']) == (12, True)
+    assert client.get('/ad/', params={'envelope': True, 'exact': True, **PRICE_RANGE}).json()['total'] == len(expected)
+
+
+def test_get_ads_filters_are_cached_separately(client, test_db, ads):
+    everything = client.get('/ad/', params={'price_order': SortOrder.ASC})
+    filtered = client.get('/ad/', params={'price_order': SortOrder.ASC, 'price_min': 1000})
+
+    assert filtered.json()[0]['price'] == 1000
+    assert filtered.headers['ETag'] != everything.headers['ETag']
+    assert ',' not in filtered.headers['ETag']
+
+
+def test_get_ads_invalid_filter(client, test_db):
+    assert client.get('/ad/', params={'price_min': -1}).status_code == 422
+    assert client.get('/ad/', params={'date_from': 'yesterday'}).status_code == 422
+
+
+def _plan(filters: AdFilters, date_order, price_order, after=None):
+    statement = crud._ads_statement(date_order, price_order, 1, after, filters=filters)
+    compiled = statement.compile(engine, compile_kwargs={'literal_binds': True})
+
+    with engine.connect() as connection:
+        return [row[3] for row in connection.execute(text(f'EXPLAIN QUERY PLAN {compiled}'))]
+
+
+@pytest.mark.parametrize('date_order, price_order', ORDERS)
+@pytest.mark.parametrize('filters', [
+    AdFilters(price_min=Decimal(500), price_max=Decimal(1500)),
+    AdFilters(date_from=datetime.datetime(2021, 1, 1), date_to=datetime.datetime(2021, 2, 1))
+])
+def test_filtered_query_plan_searches_an_index(test_db, date_order, price_order, filters):
+    plan = _plan(filters, date_order, price_order)
+
+    assert all(step.startswith('SEARCH ad_card USING') for step in plan if step.startswith(('SCAN', 'SEARCH'))), plan
+    leading = 'date' if date_order is not None else 'price' if price_order is not None else None
+    if leading is not None and getattr(filters, 'date_from' if leading == 'date' else 'price_min') is not None:
+        # the range is on the leading sort key: read in order, no sort step
+        assert not any('TEMP B-TREE' in step for step in plan), plan
+
+
+def test_filtered_keyset_query_plan(test_db):
+    filters = AdFilters(date_from=datetime.datetime(2021, 1, 1), date_to=datetime.datetime(2021, 2, 1))
+    plan = _plan(filters, SortOrder.DESC, None, after=[datetime.datetime(2021, 1, 15), 10])
+
+    assert plan == ['SEARCH ad_card USING INDEX ix_ad_card_date_id_price (date>? AND date<?)'], plan
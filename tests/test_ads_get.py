@@ -3,7 +3,9 @@ import datetime
 import pytest
 
 from application import crud, dto
-from application.database.models import Ad, Photo
+from application.database.models import Ad, AD_COUNT_SHARDS, AdCount
+
+from .conftest import walk_pages
 
 
 @pytest.fixture
@@ -72,8 +74,8 @@ def test_get_ads_price_asc(client, test_db, ads_small_input, page, offset):
     actual = [ad['id'] for ad in response.json()]
     expected = [
         ad.id for ad in test_db.query(Ad)
-            .order_by(Ad.price.asc())
-            .join(Photo).offset(offset)
+            .order_by(Ad.price.asc(), Ad.id.asc())
+            .offset(offset)
             .limit(crud.PAGE_SIZE)
     ]
 
@@ -98,8 +100,8 @@ def test_get_ads_price_desc(client, test_db, ads_small_input, page, offset):
     actual = [ad['id'] for ad in response.json()]
     expected = [
         ad.id for ad in test_db.query(Ad)
-            .order_by(Ad.price.desc())
-            .join(Photo).offset(offset)
+            .order_by(Ad.price.desc(), Ad.id.desc())
+            .offset(offset)
             .limit(crud.PAGE_SIZE)
     ]
 
@@ -124,8 +126,8 @@ def test_get_ads_date_asc(client, test_db, ads_small_input, page, offset):
     actual = [ad['id'] for ad in response.json()]
     expected = [
         ad.id for ad in test_db.query(Ad)
-            .order_by(Ad.date.asc())
-            .join(Photo).offset(offset)
+            .order_by(Ad.date.asc(), Ad.id.asc())
+            .offset(offset)
             .limit(crud.PAGE_SIZE)
     ]
 
@@ -150,8 +152,8 @@ def test_get_ads_date_desc(client, test_db, ads_small_input, page, offset):
     actual = [ad['id'] for ad in response.json()]
     expected = [
         ad.id for ad in test_db.query(Ad)
-            .order_by(Ad.date.desc())
-            .join(Photo).offset(offset)
+            .order_by(Ad.date.desc(), Ad.id.desc())
+            .offset(offset)
             .limit(crud.PAGE_SIZE)
     ]
 
@@ -177,8 +179,8 @@ def test_get_ads_date_asc_price_asc(client, test_db, ads_small_input, page, offs
     actual = [ad['id'] for ad in response.json()]
     expected = [
         ad.id for ad in test_db.query(Ad)
-            .order_by(Ad.date.asc(), Ad.price.asc())
-            .join(Photo).offset(offset)
+            .order_by(Ad.date.asc(), Ad.price.asc(), Ad.id.asc())
+            .offset(offset)
             .limit(crud.PAGE_SIZE)
     ]
 
@@ -204,8 +206,8 @@ def test_get_ads_date_desc_price_desc(client, test_db, ads_small_input, page, of
     actual = [ad['id'] for ad in response.json()]
     expected = [
         ad.id for ad in test_db.query(Ad)
-            .order_by(Ad.date.desc(), Ad.price.desc())
-            .join(Photo).offset(offset)
+            .order_by(Ad.date.desc(), Ad.price.desc(), Ad.id.desc())
+            .offset(offset)
             .limit(crud.PAGE_SIZE)
     ]
 
@@ -231,8 +233,8 @@ def test_get_ads_pagination(client, test_db, ads_large_input):
     actual = [ad['id'] for ad in response.json()]
     expected = [
         ad.id for ad in test_db.query(Ad)
-            .order_by(Ad.date.asc())
-            .join(Photo).offset(crud.PAGE_SIZE * (page - 1))
+            .order_by(Ad.date.asc(), Ad.id.asc())
+            .offset(crud.PAGE_SIZE * (page - 1))
             .limit(crud.PAGE_SIZE)
     ]
 
@@ -276,3 +278,205 @@ def test_get_ads_pagination_negative_page_number(client, test_db, ads_large_inpu
     })
 
     assert response.status_code == 422
+
+
+@pytest.mark.parametrize('date_order', [None, crud.SortOrder.ASC, crud.SortOrder.DESC])
+@pytest.mark.parametrize('price_order', [None, crud.SortOrder.ASC, crud.SortOrder.DESC])
+def test_get_ads_cursor_walks_all_pages(client, test_db, ads_large_input, date_order, price_order):
+    ads = [crud.save_ad(test_db, dto.AdIn(**{**ad, 'price': 100 * (i % 3 + 1)})) for i, ad in enumerate(ads_large_input)]
+
+    for i, ad in enumerate(ads):
+        ad.date = datetime.datetime(2021, 1, 1, 0, 0, i // 4) # ties on date as well as on price
+        test_db.add(ad)
+        test_db.commit()
+
+    params = {'date_order': date_order, 'price_order': price_order}
+    actual = walk_pages(client, params)
+
+    keys = [(Ad.date, date_order), (Ad.price, price_order)]
+    keys = [(column, order) for column, order in keys if order is not None]
+    last_order = keys[-1][1] if keys else crud.SortOrder.ASC
+    keys.append((Ad.id, last_order))
+    expected = [
+        ad.id for ad in test_db.query(Ad).order_by(*[
+            column.asc() if order == crud.SortOrder.ASC else column.desc() for column, order in keys
+        ])
+    ]
+
+    assert actual == expected
+
+
+def test_get_ads_cursor_is_stable_under_inserts(client, test_db, ads_large_input):
+    ads = [crud.save_ad(test_db, dto.AdIn(**ad)) for ad in ads_large_input]
+
+    for i, ad in enumerate(ads):
+        ad.date = datetime.datetime(2021, 1, 1, 0, 0, i)
+        test_db.add(ad)
+        test_db.commit()
+
+    params = {'date_order': crud.SortOrder.DESC}
+    first_page = client.get('/ad/', params=params)
+
+    crud.save_ad(test_db, dto.AdIn(**ads_large_input[0])) # the newest ad lands on the first page
+
+    second_page = client.get('/ad/', params={**params, 'cursor': first_page.headers['X-Next-Cursor']})
+
+    assert second_page.status_code == 200
+    assert [ad['id'] for ad in second_page.json()] == [ad.id for ad in reversed(ads[:crud.PAGE_SIZE])]
+
+
+@pytest.mark.parametrize('cursor', ['', 'garbage', 'W10', 'WyJhc2MiLG51bGwsWzFdXQ'])
+def test_get_ads_invalid_cursor(client, test_db, cursor):
+    response = client.get('/ad/', params={'cursor': cursor})
+
+    assert response.status_code == 400
+    assert response.json() == {'detail': 'INVALID_CURSOR'}
+
+
+def test_get_ads_cursor_of_another_order(client, test_db, ads_large_input):
+    for ad in ads_large_input:
+        crud.save_ad(test_db, dto.AdIn(**ad))
+
+    response = client.get('/ad/', params={'price_order': crud.SortOrder.ASC})
+    response = client.get('/ad/', params={
+        'price_order': crud.SortOrder.DESC,
+        'cursor': response.headers['X-Next-Cursor']
+    })
+
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('client_fixture', ['client', 'async_client'])
+def test_get_ads_cursor_is_validated_before_the_cache(request, test_db, ads_large_input, client_fixture):
+    client = request.getfixturevalue(client_fixture)
+
+    for ad in ads_large_input:
+        crud.save_ad(test_db, dto.AdIn(**ad))
+
+    first_page = client.get('/ad/')
+    cursor = first_page.headers['X-Next-Cursor']
+    second_page = client.get('/ad/', params={'cursor': cursor})
+
+    # the key holds the decoded cursor, so its padded encoding is the same page
+    padded = client.get('/ad/', params={'cursor': cursor + '=' * (-len(cursor) % 4)})
+    assert padded.headers['ETag'] == second_page.headers['ETag']
+
+    # a cursor that does not decode never gets as far as a key, whatever the client claims to have
+    forged = second_page.headers['ETag'].replace(cursor, 'garbage')
+    response = client.get('/ad/', params={'cursor': 'garbage'}, headers={
+        'If-None-Match': ', '.join([forged, first_page.headers['ETag'], second_page.headers['ETag'], '*'])
+    })
+
+    assert response.status_code == 400
+    assert response.json() == {'detail': 'INVALID_CURSOR'}
+
+
+def test_get_ads_sql_statements_count(client, test_db, ads_small_input, ads_large_input, sql_statements):
+    for ad in ads_small_input + ads_large_input:
+        crud.save_ad(test_db, dto.AdIn(**ad))
+    sql_statements.clear()
+
+    response = client.get('/ad/', params={'date_order': crud.SortOrder.DESC})
+
+    assert response.status_code == 200
+    assert len(response.json()) == crud.PAGE_SIZE
+    assert len(sql_statements) == 1 # main photos are stored on the ad rows
+
+
+def test_get_ads_one_item_per_ad(client, test_db, ads_large_input):
+    ads = [crud.save_ad(test_db, dto.AdIn(**{**ad, 'photos': [
+        {'url': f'http://example.com/{i}/{j}.jpg'} for j in range(1, 4)
+    ]})) for i, ad in enumerate(ads_large_input)]
+
+    response = client.get('/ad/', params={'price_order': crud.SortOrder.ASC})
+
+    assert response.status_code == 200
+
+    data = response.json()
+    assert [ad['id'] for ad in data] == [ad.id for ad in ads[:crud.PAGE_SIZE]]
+    assert [ad['main_photo']['url'] for ad in data] == [
+        f'http://example.com/{i}/1.jpg' for i in range(crud.PAGE_SIZE)
+    ]
+
+
+def test_get_ads_served_from_cache_until_insert(client, test_db, ads_large_input, sql_statements):
+    for ad in ads_large_input[:crud.PAGE_SIZE + 1]:
+        crud.save_ad(test_db, dto.AdIn(**ad))
+
+    params = {'price_order': crud.SortOrder.DESC}
+    first = client.get('/ad/', params=params)
+    sql_statements.clear()
+    second = client.get('/ad/', params=params)
+
+    assert second.content == first.content
+    assert second.headers['X-Next-Cursor'] == first.headers['X-Next-Cursor']
+    assert sql_statements == []
+
+    ad = crud.save_ad(test_db, dto.AdIn(**{**ads_large_input[0], 'price': 1_000_000}))
+    third = client.get('/ad/', params=params)
+
+    assert third.json()[0]['id'] == ad.id
+
+
+def test_get_ads_envelope(client, test_db, ads_large_input):
+    ads = [crud.save_ad(test_db, dto.AdIn(**ad)) for ad in ads_large_input + ads_large_input[:1]]
+
+    response = client.get('/ad/', params={'envelope': True, 'price_order': crud.SortOrder.ASC})
+
+    assert response.status_code == 200
+
+    data = response.json()
+    assert [ad['id'] for ad in data['items']] == [ad.id for ad in ads[:1] + ads[-1:] + ads[1:crud.PAGE_SIZE - 1]]
+    assert (data['total'], data['pages'], data['has_next']) == (21, 3, True)
+
+    last_page = client.get('/ad/', params={'envelope': True, 'page': 3}).json()
+
+    assert (len(last_page['items']), last_page['has_next']) == (1, False)
+
+
+def test_get_ads_full_last_page_has_no_next(client, test_db, ads_large_input):
+    for ad in ads_large_input:
+        crud.save_ad(test_db, dto.AdIn(**ad))
+
+    response = client.get('/ad/', params={'envelope': True, 'page': 2})
+
+    assert len(response.json()['items']) == crud.PAGE_SIZE
+    assert response.json()['has_next'] is False
+    assert 'X-Next-Cursor' not in response.headers
+    assert 'X-Next-Cursor' in client.get('/ad/').headers
+
+
+def test_get_ads_envelope_counter(client, test_db, ads_large_input, sql_statements):
+    crud.save_ads(test_db, [dto.AdIn(**ad) for ad in ads_large_input])
+    crud.save_ad(test_db, dto.AdIn(**ads_large_input[0]))
+    sql_statements.clear()
+
+    assert client.get('/ad/', params={'envelope': True}).json()['total'] == 21
+    assert not any('count(' in statement.lower() for statement in sql_statements)
+
+    # rows inserted around the application only show up with exact=true
+    test_db.execute(Ad.__table__.delete().where(Ad.id == 1))
+    test_db.commit()
+
+    assert client.get('/ad/', params={'envelope': True}).json()['total'] == 21
+    assert client.get('/ad/', params={'envelope': True, 'exact': True}).json()['total'] == 20
+
+
+def test_counter_is_spread_over_rows(test_db, ads_small_input):
+    for _ in range(10):
+        crud.save_ads(test_db, [dto.AdIn(**ad) for ad in ads_small_input])
+
+    values = [count.value for count in test_db.query(AdCount)]
+
+    assert len(values) == AD_COUNT_SHARDS
+    assert len([value for value in values if value]) > 1
+    assert crud.count_ads(test_db) == sum(values) == 30
+
+
+def test_count_ads_without_counter_row(test_db, ads_small_input):
+    for ad in ads_small_input:
+        crud.save_ad(test_db, dto.AdIn(**ad))
+    test_db.execute(AdCount.__table__.delete())
+    test_db.commit()
+
+    assert crud.count_ads(test_db) == 3
@@ -0,0 +1,76 @@
+import pytest
+
+from application import crud, dto, importer
+
+from .conftest import engine
+
+
+@pytest.fixture
+def ad_input(ad_sample_input):
+    def make(name, description, price=100):
+        return dto.AdIn(**{**ad_sample_input, 'name': name, 'description': description, 'price': price})
+
+    return make
+
+
+def _ids(response):
+    assert response.status_code == 200
+
+    return [ad['id'] for ad in response.json()]
+
+
+def test_search_ranks_name_matches_first(client, test_db, ad_input):
+    in_description = crud.save_ad(test_db, ad_input('Office chair', 'Goes well with a wooden desk'))
+    in_name = crud.save_ad(test_db, ad_input('Wooden desk', 'Oak, two drawers, barely used'))
+    crud.save_ad(test_db, ad_input('Gaming mouse', 'Wireless, with a charging dock'))
+
+    assert _ids(client.get('/ad/search', params={'q': 'desk'})) == [in_name.id, in_description.id]
+    assert _ids(client.get('/ad/search', params={'q': 'wooden desk'})) == [in_name.id, in_description.id]
+    assert _ids(client.get('/ad/search', params={'q': 'oak desk'})) == [in_name.id]
+    assert _ids(client.get('/ad/search', params={'q': 'sofa'})) == []
+
+
+def test_search_is_case_insensitive(client, test_db, ad_input):
+    ad = crud.save_ad(test_db, ad_input('Беспроводная мышь', 'Мышь для ноутбука, 2.4 ГГц'))
+
+    assert _ids(client.get('/ad/search', params={'q': 'МЫШЬ'})) == [ad.id]
+
+
+def test_search_sort_and_pagination(client, test_db, ad_input):
+    ads = [crud.save_ad(test_db, ad_input(f'Bicycle #{i}', 'Red city bicycle', price=(i * 7) % 25 + 1)) for i in range(25)]
+    expected = [ad.id for ad in sorted(ads, key=lambda ad: (-ad.price, -ad.id))]
+
+    actual = []
+    for page in (1, 2, 3):
+        actual += _ids(client.get('/ad/search', params={'q': 'bicycle', 'price_order': 'desc', 'page': page}))
+
+    assert actual == expected
+
+
+@pytest.mark.parametrize('q', ['"unbalanced', 'NEAR(a b)', 'name:desk', 'AND OR NOT', '*', '   '])
+def test_search_input_is_not_query_syntax(client, test_db, ad_input, q):
+    crud.save_ad(test_db, ad_input('Wooden desk', 'Oak, two drawers, barely used'))
+
+    assert _ids(client.get('/ad/search', params={'q': q})) == []
+
+
+def test_search_requires_q(client, test_db):
+    assert client.get('/ad/search').status_code == 422
+    assert client.get('/ad/search', params={'q': ''}).status_code == 422
+
+
+def test_search_finds_batch_and_imported_ads(client, test_db, ad_input):
+    [batch_id] = crud.save_ads(test_db, [ad_input('Wooden desk', 'Created in a batch')])
+    importer.import_ads([[('Wooden desk', 'Created by the importer', 100, ['http://example.com/1.jpg'])]], engine=engine)
+
+    assert sorted(_ids(client.get('/ad/search', params={'q': 'desk'}))) == [batch_id, batch_id + 1]
+
+
+def test_search_async_matches_sync(client, async_client, test_db, ad_input, ad_sample_input):
+    crud.save_ad(test_db, ad_input('Office chair', 'Goes well with a wooden desk'))
+    async_client.post('/ad/', json={**ad_sample_input, 'name': 'Wooden desk', 'description': 'Oak, two drawers'})
+
+    params = {'q': 'desk'}
+
+    assert async_client.get('/ad/search', params=params).json() == client.get('/ad/search', params=params).json()
+    assert len(client.get('/ad/search', params=params).json()) == 2
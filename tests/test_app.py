@@ -0,0 +1,68 @@
+import subprocess
+import sys
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+
+from application import database
+from application.asgi import create_app
+from application.config import TestConfig
+from application.database import Base
+
+
+def test_import_creates_no_engine():
+    code = 'import application.asgi, application.database as database; assert database.engine is None'
+
+    assert subprocess.run([sys.executable, '-c', code]).returncode == 0
+
+
+def test_engines_follow_the_lifespan(tmp_path, ad_sample_input):
+    class Config(TestConfig):
+        SQLALCHEMY_DATABASE_URL = f'sqlite:///{tmp_path / "app.sqlite3"}'
+
+    engine = create_engine(Config.SQLALCHEMY_DATABASE_URL)
+    Base.metadata.create_all(bind=engine)
+    engine.dispose()
+
+    with TestClient(create_app(Config)) as client:
+        assert str(database.engine.url) == Config.SQLALCHEMY_DATABASE_URL
+        assert client.post('/ad/', json=ad_sample_input).status_code == 201
+        assert client.get('/status/pool').json()['database']['checked_out'] == 0
+
+    assert database.engine is None
+
+
+def test_one_config_connected_at_a_time(tmp_path):
+    class OtherConfig(TestConfig):
+        SQLALCHEMY_DATABASE_URL = f'sqlite:///{tmp_path / "other.sqlite3"}'
+
+    with TestClient(create_app()):
+        engine = database.engine
+
+        with pytest.raises(RuntimeError), TestClient(create_app(OtherConfig)):
+            pass
+
+        assert database.engine is engine
+        # the same config gets the same engines
+        assert database.connect() is engine
+
+    assert database.engine is None
+
+
+def test_replica_stickiness_follows_the_config(tmp_path, ad_sample_input):
+    class Config(TestConfig):
+        SQLALCHEMY_DATABASE_URL = f'sqlite:///{tmp_path / "app.sqlite3"}'
+        DATABASE_REPLICA_URLS = [f'sqlite:///{tmp_path / "replica.sqlite3"}']
+        DATABASE_REPLICA_STICKY_SECONDS = 60
+
+    for url in [Config.SQLALCHEMY_DATABASE_URL] + Config.DATABASE_REPLICA_URLS:
+        engine = create_engine(url)
+        Base.metadata.create_all(bind=engine)
+        engine.dispose()
+
+    with TestClient(create_app(Config)) as client:
+        response = client.post('/ad/', json=ad_sample_input)
+
+    assert float(response.cookies[database.READ_PRIMARY_COOKIE]) > time.time() + 55
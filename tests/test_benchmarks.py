@@ -0,0 +1,73 @@
+import json
+
+import pytest
+
+from application import cache, crud
+from benchmarks import compare, photo_layout, serve_scaling, startup, suite
+
+
+def test_benchmark_suite(tmp_path, capsys):
+    output = tmp_path / 'results.json'
+
+    try:
+        suite.main(['--sizes', '50', '--repeat', '2', '--output', str(output)])
+    finally:
+        cache.clear()
+
+    results = json.loads(output.read_text())
+    cases = {(item['case'], item['mode']) for item in results['results']}
+
+    assert results['environment']['databases'] == ['sqlite']
+    assert cases == {(case, mode) for case in ('get_ads', 'get_ad_by_id', 'save_ad') for mode in ('direct', 'asgi')}
+    assert len(results['results']) == 2 * (9 * 3 + 4 + 1)
+    assert all(item['n'] == 2 and item['p50_us'] > 0 for item in results['results'])
+
+    compare.main([str(output), str(output)])
+
+    assert '(1.00x)' in capsys.readouterr().out
+
+
+def test_photo_layout_benchmark(tmp_path):
+    output = tmp_path / 'results.json'
+    layout = crud.config.PHOTO_STORAGE
+
+    try:
+        photo_layout.main(['--size', '50', '--requests', '2', '--output', str(output)])
+    finally:
+        cache.clear()
+
+    results = json.loads(output.read_text())
+
+    assert crud.config.PHOTO_STORAGE == layout
+    assert set(results['latency']) == {f'{name}_{mode}' for name in ('table', 'embedded') for mode in ('direct', 'asgi')}
+    assert all(item['n'] == 2 for item in results['latency'].values())
+    assert all(value > 0 for value in results['storage'].values())
+
+
+def test_serve_scaling_benchmark(tmp_path):
+    output = tmp_path / 'results.json'
+
+    serve_scaling.main([
+        '--workers', '1', '2', '--clients', '1', '--concurrency', '2', '--duration', '0.5', '--warmup', '0',
+        '--size', '50', '--output', str(output)
+    ])
+
+    runs = json.loads(output.read_text())['runs']
+
+    assert [run['workers'] for run in runs] == [1, 2]
+    assert all(run['requests'] > 0 and run['errors'] == 0 for run in runs)
+    assert runs[0]['efficiency'] == 1
+
+
+def test_startup_benchmark(tmp_path):
+    output = tmp_path / 'results.json'
+
+    startup.main(['--repeat', '2', '--top', '3', '--output', str(output)])
+
+    results = json.loads(output.read_text())
+
+    assert all(results['latency'][phase]['n'] == 2 for phase in ('import', 'startup', 'shutdown', 'total'))
+    assert len(results['slowest_imports']) == 3
+
+    with pytest.raises(SystemExit):
+        startup.main(['--repeat', '1', '--budget', '0', '--output', str(tmp_path / 'over_budget.json')])
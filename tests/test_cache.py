@@ -0,0 +1,156 @@
+import pytest
+
+from application import cache
+from application.cache import CacheBackend, InMemoryBackend, LRUCache, RedisBackend, UNAVAILABLE, VersionedCache
+
+
+def test_lru_cache_get_set():
+    lru = LRUCache(maxsize=2)
+    lru.set('a', 1)
+
+    assert lru.get('a') == 1
+    assert lru.get('b') is None
+    assert lru.get('b', 0) == 0
+    assert lru.stats() == {'size': 1, 'maxsize': 2, 'hits': 1, 'misses': 2, 'evictions': 0}
+
+
+def test_lru_cache_evicts_least_recently_used():
+    lru = LRUCache(maxsize=2)
+    lru.set('a', 1)
+    lru.set('b', 2)
+    lru.get('a')
+    lru.set('c', 3)
+
+    assert lru.get('b') is None
+    assert lru.get('a') == 1
+    assert lru.get('c') == 3
+    assert lru.evictions == 1
+    assert len(lru) == 2
+
+
+def test_lru_cache_ttl(monkeypatch):
+    now = 100.0
+    monkeypatch.setattr('application.cache.time.monotonic', lambda: now)
+
+    lru = LRUCache(maxsize=2, ttl=5)
+    lru.set('a', 1)
+
+    assert lru.get('a') == 1
+
+    now = 105.0
+
+    assert lru.get('a') is None
+    assert len(lru) == 0
+
+
+def test_lru_cache_clear():
+    lru = LRUCache(maxsize=2)
+    lru.set('a', 1)
+    lru.clear()
+
+    assert lru.get('a') is None
+
+
+def test_versioned_cache_bump_invalidates_entries():
+    pages = VersionedCache(InMemoryBackend(maxsize=10), 'pages')
+    version = pages.version()
+    pages.set(version, 'key', b'value')
+
+    assert pages.get(pages.version(), 'key') == b'value'
+
+    pages.bump()
+
+    assert pages.version() == version + 1
+    assert pages.get(pages.version(), 'key') is None
+
+
+def test_in_memory_backend_is_bounded():
+    backend = InMemoryBackend(maxsize=1)
+    backend.set('a', b'1')
+    backend.set('b', b'2')
+
+    assert backend.get('a') is None
+    assert backend.get('b') == b'2'
+    assert backend.values.evictions == 1
+
+
+def test_cache_backend_is_abstract():
+    with pytest.raises(TypeError):
+        CacheBackend()
+
+
+class FakeRedis:
+    """The commands RedisBackend uses, on a dict, failing with error when it is set."""
+
+    def __init__(self):
+        self.data = {}
+        self.error = None
+
+    def _check(self):
+        if self.error is not None:
+            raise self.error
+
+    def get(self, key):
+        self._check()
+        return self.data.get(key)
+
+    def set(self, key, value):
+        self._check()
+        self.data[key] = value
+
+    def incr(self, key):
+        self._check()
+        self.data[key] = int(self.data.get(key, 0)) + 1
+        return self.data[key]
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    redis = pytest.importorskip('redis')
+    client = FakeRedis()
+    monkeypatch.setattr(redis.Redis, 'from_url', lambda url, **kwargs: client)
+    client.errors = (redis.ConnectionError('connection refused'), redis.TimeoutError('timed out'))
+
+    return client
+
+
+def test_redis_backend(fake_redis):
+    pages = VersionedCache(RedisBackend(maxsize=10, url='redis://cache'), 'pages')
+    pages.set(pages.version(), 'key', b'value')
+
+    assert pages.get(pages.version(), 'key') == b'value'
+
+    pages.bump()
+
+    assert pages.version() == 1
+    assert pages.get(pages.version(), 'key') is None
+
+
+@pytest.mark.parametrize('error', [0, 1])
+def test_redis_errors_are_misses(fake_redis, error, caplog):
+    backend = RedisBackend(maxsize=10, url='redis://cache')
+    pages = VersionedCache(backend, 'pages')
+    pages.set(0, 'key', b'value')
+    fake_redis.error = fake_redis.errors[error]
+
+    assert pages.version() == UNAVAILABLE
+    assert pages.get(0, 'key') is None
+    pages.set(UNAVAILABLE, 'key', b'other')
+    pages.bump()
+    backend.set('other', b'value')
+
+    fake_redis.error = None
+    assert fake_redis.data == {'ad-service:pages:0:key': b'value'}
+    assert 'failed' in caplog.text
+
+
+def test_routes_serve_the_database_when_redis_fails(client, test_db, fake_redis, ad_sample_input, monkeypatch):
+    monkeypatch.setattr(cache.ad_pages, 'backend', RedisBackend(maxsize=10, url='redis://cache'))
+    fake_redis.error = fake_redis.errors[0]
+
+    id = client.post('/ad/', json=ad_sample_input).json()['id']
+
+    assert client.get('/ad/2').status_code == 404
+    assert [ad['id'] for ad in client.get('/ad/').json()] == [id]
+    assert client.get(f'/ad/{id}').status_code == 200
+    assert fake_redis.data == {}
@@ -0,0 +1,107 @@
+import pytest
+
+from application import crud, dto
+
+
+@pytest.fixture
+def ad(test_db, ad_sample_input):
+    return crud.save_ad(test_db, dto.AdIn(**ad_sample_input))
+
+
+def test_get_ad_etag_depends_on_fields(client, ad):
+    plain = client.get(f'/ad/{ad.id}/')
+    with_fields = client.get(f'/ad/{ad.id}/', params={'fields': ['photos', 'description']})
+    with_fields_reordered = client.get(f'/ad/{ad.id}/', params={'fields': ['description', 'photos']})
+
+    assert plain.headers['ETag'].startswith('"')
+    assert plain.headers['ETag'] != with_fields.headers['ETag']
+    assert with_fields.headers['ETag'] == with_fields_reordered.headers['ETag']
+
+
+@pytest.mark.parametrize('if_none_match', ['{etag}', 'W/{etag}', '"other", {etag}', '*'])
+def test_get_ad_not_modified(client, ad, sql_statements, if_none_match):
+    etag = client.get(f'/ad/{ad.id}/').headers['ETag']
+    sql_statements.clear()
+
+    response = client.get(f'/ad/{ad.id}/', headers={'If-None-Match': if_none_match.format(etag=etag)})
+
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+    assert response.content == b''
+    assert sql_statements == []
+
+
+def test_get_ad_with_fields_not_modified(client, ad):
+    params = {'fields': ['photos', 'description']}
+    etag = client.get(f'/ad/{ad.id}/', params=params).headers['ETag']
+
+    # If-None-Match is a comma-separated list, so the tag of several fields must not contain one
+    assert client.get(f'/ad/{ad.id}/', params=params, headers={'If-None-Match': etag}).status_code == 304
+
+
+def test_get_ad_modified(client, ad):
+    etag = client.get(f'/ad/{ad.id}/').headers['ETag']
+
+    response = client.get(f'/ad/{ad.id}/', params={'fields': ['photos']}, headers={'If-None-Match': etag})
+
+    assert response.status_code == 200
+
+
+def test_get_ad_not_found_has_no_etag(client, test_db):
+    response = client.get('/ad/1/')
+
+    assert response.status_code == 404
+    assert 'ETag' not in response.headers
+
+
+@pytest.mark.parametrize('cached', [False, True])
+def test_get_ad_not_found_ignores_if_none_match_any(client, test_db, cached):
+    if cached:
+        client.get('/ad/1/')
+
+    response = client.get('/ad/1/', headers={'If-None-Match': '*'})
+
+    assert response.status_code == 404
+
+
+def test_get_ad_if_none_match_any_loads_the_ad(client, ad):
+    response = client.get(f'/ad/{ad.id}/', headers={'If-None-Match': '*'})
+
+    assert response.status_code == 304
+    assert response.headers['ETag'] == client.get(f'/ad/{ad.id}/').headers['ETag']
+
+
+def test_get_ads_if_none_match_any_checks_the_request(client, ad):
+    assert client.get('/ad/', headers={'If-None-Match': '*'}).status_code == 304
+    assert client.get('/ad/', params={'cursor': 'invalid'}, headers={'If-None-Match': '*'}).status_code == 400
+
+
+def test_get_ads_not_modified_until_insert(client, test_db, ad, ad_sample_input, sql_statements):
+    params = {'price_order': crud.SortOrder.ASC}
+    etag = client.get('/ad/', params=params).headers['ETag']
+    sql_statements.clear()
+
+    response = client.get('/ad/', params=params, headers={'If-None-Match': etag})
+
+    assert response.status_code == 304
+    assert sql_statements == []
+
+    assert client.get('/ad/', params={'price_order': crud.SortOrder.DESC}, headers={'If-None-Match': etag}) \
+        .status_code == 200
+
+    crud.save_ad(test_db, dto.AdIn(**ad_sample_input))
+    response = client.get('/ad/', params=params, headers={'If-None-Match': etag})
+
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert len(response.json()) == 2
+
+
+def test_async_get_ad_not_modified(async_client, ad):
+    etag = async_client.get(f'/ad/{ad.id}/').headers['ETag']
+
+    assert async_client.get(f'/ad/{ad.id}/', headers={'If-None-Match': etag}).status_code == 304
+    assert async_client.get('/ad/', headers={
+        'If-None-Match': async_client.get('/ad/').headers['ETag']
+    }).status_code == 304
+    assert async_client.get(f'/ad/{ad.id + 1}/', headers={'If-None-Match': '*'}).status_code == 404
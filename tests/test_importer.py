@@ -0,0 +1,68 @@
+import io
+import json
+
+from application import crud, dto, importer
+from application.database.models import Ad, AdCard, Photo
+
+from .conftest import engine
+
+
+def test_import_ads(test_db, ad_sample_input):
+    crud.save_ad(test_db, dto.AdIn(**ad_sample_input)) # imported IDs continue after the existing ones
+
+    lines = [json.dumps({**ad_sample_input, 'name': f'Ad #{i}', 'price': i}) for i in range(1, 26)]
+    progress = io.StringIO()
+
+    total = importer.import_ads(importer.read_ads(lines, batch_size=10), engine=engine, progress=progress)
+
+    assert total == 25
+    assert len(progress.getvalue().splitlines()) == 3
+    ads = test_db.query(Ad).order_by(Ad.id).all()
+    assert [ad.name for ad in ads[1:]] == [f'Ad #{i}' for i in range(1, 26)]
+    assert all(ad.main_photo_url == ad_sample_input['photos'][0]['url'] for ad in ads)
+    assert all(ad.date is not None for ad in ads)
+    assert [photo.url for photo in ads[-1].photos] == [photo['url'] for photo in ad_sample_input['photos']]
+    assert ads[-1].photo_urls == [photo['url'] for photo in ad_sample_input['photos']]
+    assert test_db.query(Photo).count() == 26 * len(ad_sample_input['photos'])
+    assert crud.count_ads(test_db) == 26
+    cards = test_db.query(AdCard).order_by(AdCard.id).all()
+    assert [(card.id, card.name, card.date) for card in cards] == [(ad.id, ad.name, ad.date) for ad in ads]
+    assert all(card.json is not None for card in cards)
+
+
+def test_import_ads_skips_invalid_lines(test_db, ad_sample_input):
+    lines = [json.dumps(ad_sample_input), '{"name": "N"}', '', 'not json', json.dumps(ad_sample_input)]
+    errors = io.StringIO()
+
+    total = importer.import_ads(importer.read_ads(lines, errors=errors), engine=engine)
+
+    assert total == 2
+    assert test_db.query(Ad).count() == 2
+    assert [line.split(':')[0] for line in errors.getvalue().splitlines()] == ['line 2', 'line 4']
+
+
+def test_import_ads_validated_in_processes(test_db, ad_sample_input):
+    lines = [json.dumps({**ad_sample_input, 'name': f'Ad #{i}'}) for i in range(1, 26)]
+
+    total = importer.import_ads(importer.read_ads(lines, batch_size=4, jobs=2), engine=engine)
+
+    assert total == 25
+    assert [ad.name for ad in test_db.query(Ad).order_by(Ad.id)] == [f'Ad #{i}' for i in range(1, 26)]
+
+
+def test_import_ads_cli(test_db, ad_sample_input, tmp_path, capsys):
+    path = tmp_path / 'ads.jsonl'
+    path.write_text('\n'.join(json.dumps(ad_sample_input) for _ in range(3)))
+
+    importer.main([str(path)])
+
+    assert test_db.query(Ad).count() == 3
+    assert 'Imported 3 ads' in capsys.readouterr().out
+
+
+def test_import_ads_invalidates_cached_404(client, ad_sample_input):
+    assert client.get('/ad/1').status_code == 404
+
+    importer.import_ads(importer.read_ads([json.dumps(ad_sample_input)]), engine=engine)
+
+    assert client.get('/ad/1').status_code == 200
@@ -0,0 +1,33 @@
+import argparse
+import json
+
+import pytest
+
+from benchmarks import load
+
+
+def test_parse_mix():
+    assert load.parse_mix('list=6,get=3,create=1') == {'list': 6, 'get': 3, 'create': 1}
+
+    with pytest.raises(argparse.ArgumentTypeError):
+        load.parse_mix('delete=1')
+    with pytest.raises(argparse.ArgumentTypeError):
+        load.parse_mix('list=0')
+
+
+def test_load_in_process(test_db, tmp_path):
+    output = tmp_path / 'load.json'
+
+    load.main(['--concurrency', '1', '2', '--duration', '0.3', '--warmup', '0', '--output', str(output)])
+
+    report = json.loads(output.read_text())
+
+    assert [stage['concurrency'] for stage in report['stages']] == [1, 2]
+    for stage in report['stages']:
+        assert stage['requests'] > 0
+        assert stage['errors'] == 0
+        assert set(stage['operations']) <= set(load.OPERATIONS)
+        for operation in stage['operations'].values():
+            assert operation['p50_us'] <= operation['p95_us'] <= operation['p99_us']
+            assert sum(operation['histogram'].values()) == operation['n']
+    assert report['max_sustainable_rps'] == max(stage['rps'] for stage in report['stages'])
@@ -0,0 +1,87 @@
+import re
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from application import metrics
+
+
+def _sample(text, name, **labels):
+    pattern = re.escape(name) + r'\{' + ','.join(
+        '{}="{}"'.format(key, re.escape(str(value))) for key, value in labels.items()
+    ) + r'\} (\S+)'
+    match = re.search(pattern, text)
+
+    return float(match.group(1)) if match else 0.0
+
+
+def test_metrics_by_route_template(client, ad_sample_input):
+    before = client.get('/metrics').text
+
+    response = client.post('/ad/', json=ad_sample_input)
+    client.get(f'/ad/{response.json()["id"]}')
+    client.get('/ad/999')
+
+    response = client.get('/metrics')
+
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/plain; version=0.0.4')
+
+    text = response.text
+    route = dict(route='/ad/{ad_id}', method='GET')
+    for status in (200, 404):
+        assert _sample(text, 'http_request_duration_seconds_count', **route, status=status) == \
+            _sample(before, 'http_request_duration_seconds_count', **route, status=status) + 1
+    assert _sample(text, 'http_request_duration_seconds_bucket', **route, status=200, le='+Inf') == \
+        _sample(text, 'http_request_duration_seconds_count', **route, status=200)
+    assert _sample(text, 'db_statements_total', route='/ad/') > _sample(before, 'db_statements_total', route='/ad/')
+    assert _sample(text, 'db_statement_duration_seconds_total', route='/ad/') > 0
+    assert 'db_pool_checked_out{engine="database"}' in text
+    assert 'cache_hits{cache="ads"}' in text
+
+
+def test_unmatched_route_is_not_a_label(client):
+    client.get('/no/such/path/12345')
+
+    text = client.get('/metrics').text
+
+    assert '/no/such/path' not in text
+    assert _sample(
+        text, 'http_request_duration_seconds_count', route=metrics.UNMATCHED_ROUTE, method='GET', status=404
+    ) >= 1
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram('latency_seconds', 'Latency', ('route',), buckets=(0.1, 1.0))
+
+    for value in (0.05, 0.1, 0.5, 2):
+        histogram.observe(('/',), value)
+
+    assert list(histogram.render())[2:] == [
+        'latency_seconds_bucket{route="/",le="0.1"} 2',
+        'latency_seconds_bucket{route="/",le="1.0"} 3',
+        'latency_seconds_bucket{route="/",le="+Inf"} 4',
+        'latency_seconds_sum{route="/"} 2.65',
+        'latency_seconds_count{route="/"} 4',
+    ]
+
+
+def test_label_values_are_escaped():
+    counter = metrics.Counter('things_total', 'Things', ('name',))
+    counter.inc(('say "hi"\\',))
+
+    assert list(counter.render())[-1] == 'things_total{name="say \\"hi\\"\\\\"} 1'
+
+
+def test_failed_statements_leave_no_timing_behind():
+    engine = create_engine('sqlite://')
+    metrics.instrument_engine('failing', engine)
+
+    with engine.connect() as connection:
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                connection.execute(text('SELECT * FROM no_such_table'))
+
+        assert connection.execute(text('SELECT 1')).scalar() == 1
+        assert not connection.info
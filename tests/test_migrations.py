@@ -0,0 +1,23 @@
+import os
+import subprocess
+import sys
+
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from sqlalchemy import create_engine
+
+from application.database import Base
+from migrations.helpers import include_object
+
+
+def test_autogenerate_against_head_is_empty(tmp_path):
+    url = f'sqlite:///{tmp_path / "migrated.sqlite3"}'
+    env = {**os.environ, 'CONFIG': 'production', 'DATABASE_URL': url}
+    subprocess.run([sys.executable, '-m', 'alembic', 'upgrade', 'head'], env=env, check=True, capture_output=True)
+    engine = create_engine(url)
+
+    with engine.connect() as connection:
+        context = MigrationContext.configure(connection, opts={'include_object': include_object})
+        assert compare_metadata(context, Base.metadata) == []
+
+    engine.dispose()
@@ -0,0 +1,82 @@
+import logging
+
+import pytest
+
+from application import crud, metrics
+from application.routers import ad
+
+
+@pytest.fixture
+def ad_id(client, ad_sample_input):
+    return client.post('/ad/', json=ad_sample_input).json()['id']
+
+
+def test_add_ad_queries(client, max_queries, ad_sample_input):
+    ad_sample_input['photos'].append({'url': 'http://example.com/3.jpg'})
+
+    with max_queries(8):
+        assert client.post('/ad/', json=ad_sample_input).status_code == 201
+
+
+def test_get_ad_by_id_queries(client, max_queries, ad_id):
+    with max_queries(1):
+        assert client.get(f'/ad/{ad_id}', params={'fields': ['description', 'photos']}).status_code == 200
+    with max_queries(0):
+        assert client.get(f'/ad/{ad_id}', params={'fields': ['description', 'photos']}).status_code == 200
+
+
+def test_get_ad_by_id_photo_table_queries(client, max_queries, ad_id, monkeypatch):
+    monkeypatch.setattr(crud.config, 'PHOTO_STORAGE', 'table')
+
+    with max_queries(1):
+        assert client.get(f'/ad/{ad_id}', params={'fields': ['description', 'photos']}).status_code == 200
+
+
+def test_get_ads_queries(client, max_queries, ad_id):
+    with max_queries(1):
+        assert client.get('/ad/', params={'date_order': 'desc', 'price_order': 'asc'}).status_code == 200
+    with max_queries(2):
+        assert client.get('/ad/', params={'envelope': True}).status_code == 200
+    with max_queries(0):
+        assert client.get('/ad/', params={'date_order': 'desc', 'price_order': 'asc'}).status_code == 200
+
+
+def test_add_ads_queries(client, max_queries, ad_sample_input):
+    # one INSERT per ad (on PostgreSQL, the IDs from the sequence and one multi-row INSERT), then one each
+    # for all the photos, the cards, the search index and the counter
+    with max_queries(7):
+        assert client.post('/ad/batch', json=[ad_sample_input] * 3).status_code == 201
+
+
+def test_export_ads_queries(client, max_queries, ad_id):
+    with max_queries(1):
+        assert client.get('/ad/export').status_code == 200
+
+
+def test_query_budget_exceeded_fails(client, ad_id, monkeypatch):
+    monkeypatch.setattr(ad.get_ad_by_id, 'query_budget', 0)
+
+    with pytest.raises(metrics.QueryBudgetExceeded, match='GET /ad/{ad_id} issued 1 SQL statements, the budget is 0'):
+        client.get(f'/ad/{ad_id}', params={'fields': 'photos'})
+
+
+def test_query_budget_exceeded_is_logged(client, ad_id, monkeypatch, caplog):
+    monkeypatch.setattr(ad.get_ad_by_id, 'query_budget', 0)
+    monkeypatch.setattr(metrics.config, 'QUERY_BUDGET_ENFORCED', False)
+
+    with caplog.at_level(logging.WARNING, logger='application.metrics'):
+        assert client.get(f'/ad/{ad_id}', params={'fields': 'photos'}).status_code == 200
+
+    assert 'GET /ad/{ad_id} issued 1 SQL statements, the budget is 0' in caplog.text
+
+
+def test_slow_query_log(client, ad_id, monkeypatch, caplog):
+    monkeypatch.setattr(metrics.config, 'SLOW_QUERY_THRESHOLD', 1e-9)
+
+    with caplog.at_level(logging.WARNING, logger='application.metrics'):
+        client.get(f'/ad/{ad_id}', params={'fields': 'photos'})
+
+    record = caplog.records[0]
+    assert record.getMessage().startswith('Slow query (')
+    assert 'on GET /ad/{ad_id}: SELECT' in record.getMessage()
+    assert f'parameters: ({ad_id},)' in record.getMessage()
@@ -0,0 +1,191 @@
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from application import cache, crud, database, dto
+from application.database import Base, engine_options, get_async_read_db, get_read_db, READ_PRIMARY_COOKIE
+from application.database.replicas import ReplicaSet
+
+from .conftest import async_engine
+
+
+def _engine(url):
+    return create_engine(url, **engine_options(url))
+
+
+@pytest.fixture
+def replica_engines(tmp_path):
+    engines = [_engine(f'sqlite:///{tmp_path / f"replica_{i}.sqlite3"}') for i in range(2)]
+    yield engines
+    for engine in engines:
+        engine.dispose()
+
+
+@pytest.fixture
+def broken_engine(tmp_path):
+    engine = _engine(f'sqlite:///{tmp_path / "missing" / "replica.sqlite3"}')
+    yield engine
+    engine.dispose()
+
+
+def test_round_robin(replica_engines):
+    replicas = ReplicaSet(replica_engines)
+
+    assert [replicas.choose() for _ in range(4)] == replica_engines * 2
+
+
+def test_least_connections(replica_engines):
+    replicas = ReplicaSet(replica_engines, 'least_connections')
+
+    with replica_engines[0].connect():
+        assert [replicas.choose() for _ in range(3)] == [replica_engines[1]] * 3
+
+    assert set(replicas.choose() for _ in range(2)) == set(replica_engines)
+
+
+def test_unknown_strategy(replica_engines):
+    with pytest.raises(ValueError):
+        ReplicaSet(replica_engines, 'random')
+
+
+def test_failed_replica_is_left_out(replica_engines, broken_engine, monkeypatch):
+    replicas = ReplicaSet([broken_engine, replica_engines[0]], retry_after=30)
+
+    with pytest.raises(Exception):
+        broken_engine.connect()
+
+    assert replicas.is_down(broken_engine)
+    assert [replicas.choose() for _ in range(3)] == [replica_engines[0]] * 3
+
+    now = time.monotonic()
+    monkeypatch.setattr(time, 'monotonic', lambda: now + 31)
+
+    assert not replicas.is_down(broken_engine)
+    assert broken_engine in [replicas.choose() for _ in range(2)]
+
+
+def test_statement_errors_keep_the_replica(replica_engines):
+    replicas = ReplicaSet(replica_engines)
+
+    with pytest.raises(Exception), replica_engines[0].connect() as connection:
+        connection.execute(text('SELECT * FROM no_such_table'))
+
+    assert not replicas.is_down(replica_engines[0])
+
+
+def test_no_replica_available(broken_engine):
+    replicas = ReplicaSet([broken_engine])
+
+    with pytest.raises(Exception):
+        broken_engine.connect()
+
+    assert replicas.choose() is None
+    assert ReplicaSet([]).choose() is None
+
+
+@pytest.fixture
+def replica(client, replica_engines, ad_sample_input, monkeypatch):
+    engine = replica_engines[0]
+    Base.metadata.create_all(bind=engine)
+    with sessionmaker(bind=engine)() as db:
+        crud.save_ad(db, dto.AdIn(**{**ad_sample_input, 'name': 'Replicated ad'}))
+    cache.clear()
+
+    monkeypatch.setattr(database, 'replicas', ReplicaSet([engine]))
+    # the GET routes get their session from the replicas again, the writes still go to test_db
+    client.app.dependency_overrides.pop(get_read_db)
+
+    yield engine
+
+    Base.metadata.drop_all(bind=engine)
+
+
+def test_reads_go_to_the_replica(client, test_db, replica, ad_sample_input):
+    crud.save_ad(test_db, dto.AdIn(**{**ad_sample_input, 'name': 'Primary ad'}))
+    cache.clear()
+
+    assert [ad['name'] for ad in client.get('/ad/').json()] == ['Replicated ad']
+    assert client.get('/ad/1', params={'fields': 'description'}).json()['name'] == 'Replicated ad'
+
+
+def test_cached_reads_leave_the_replica_alone(client, test_db, replica):
+    etag = client.get('/ad/').headers['ETag']
+    client.get('/ad/1')
+    statements, checkouts = [], []
+    event.listen(replica, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    event.listen(replica.pool, 'checkout', lambda *args: checkouts.append(args))
+
+    assert client.get('/ad/').status_code == 200
+    assert client.get('/ad/1').status_code == 200
+    assert client.get('/ad/', headers={'If-None-Match': etag}).status_code == 304
+    assert statements == checkouts == []
+
+
+def test_reads_after_a_write_go_to_the_primary(client, test_db, replica, ad_sample_input):
+    response = client.post('/ad/', json={**ad_sample_input, 'name': 'Primary ad'})
+
+    assert response.status_code == 201
+    assert READ_PRIMARY_COOKIE in response.cookies
+    assert [ad['name'] for ad in client.get('/ad/').json()] == ['Primary ad']
+
+    client.cookies.clear()
+    cache.clear()
+
+    assert [ad['name'] for ad in client.get('/ad/').json()] == ['Replicated ad']
+
+
+def test_replica_reads_do_not_fill_the_cache_of_sticky_reads(client, test_db, replica, ad_sample_input):
+    crud.save_ad(test_db, dto.AdIn(**{**ad_sample_input, 'name': 'Primary ad'}))
+    id = client.post('/ad/', json={**ad_sample_input, 'name': 'New ad'}).json()['id']
+    other_client = TestClient(client.app)
+
+    # another client reads from the replica, which has not received the ad yet, between the write and the read
+    assert [ad['name'] for ad in other_client.get('/ad/').json()] == ['Replicated ad']
+    assert other_client.get(f'/ad/{id}').status_code == 404
+    etag = other_client.get('/ad/').headers['ETag']
+
+    response = client.get('/ad/', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert [ad['name'] for ad in response.json()] == ['Primary ad', 'New ad']
+    assert client.get(f'/ad/{id}').json()['name'] == 'New ad'
+
+
+def test_expired_stickiness(client, test_db, replica):
+    client.cookies.set(READ_PRIMARY_COOKIE, str(time.time() - 1))
+
+    assert [ad['name'] for ad in client.get('/ad/').json()] == ['Replicated ad']
+
+
+def test_no_stickiness_without_replicas(client, test_db, ad_sample_input):
+    response = client.post('/ad/', json=ad_sample_input)
+
+    assert response.status_code == 201
+    assert READ_PRIMARY_COOKIE not in response.cookies
+
+
+def test_failover_to_the_primary(client, test_db, broken_engine, ad_sample_input, monkeypatch):
+    crud.save_ad(test_db, dto.AdIn(**{**ad_sample_input, 'name': 'Primary ad'}))
+    monkeypatch.setattr(database, 'replicas', ReplicaSet([broken_engine]))
+    client.app.dependency_overrides.pop(get_read_db)
+
+    # the read that finds the replica down is retried on the primary, the next ones go there directly
+    assert [ad['name'] for ad in client.get('/ad/').json()] == ['Primary ad']
+    assert database.replicas.is_down(broken_engine)
+    assert client.get('/ad/1').json()['name'] == 'Primary ad'
+
+
+def test_async_failover_to_the_primary(async_client, test_db, tmp_path, ad_sample_input, monkeypatch):
+    crud.save_ad(test_db, dto.AdIn(**{**ad_sample_input, 'name': 'Primary ad'}))
+    url = f'sqlite+aiosqlite:///{tmp_path / "missing" / "replica.sqlite3"}'
+    broken_engine = create_async_engine(url, poolclass=NullPool)
+    monkeypatch.setattr(database, 'async_replicas', ReplicaSet([broken_engine]))
+    monkeypatch.setattr(database, 'async_engine', async_engine)
+    async_client.app.dependency_overrides.pop(get_async_read_db)
+
+    assert [ad['name'] for ad in async_client.get('/ad/').json()] == ['Primary ad']
+    assert database.async_replicas.is_down(broken_engine)
@@ -0,0 +1,54 @@
+import pytest
+
+from application import serializers
+from application.database.models import Photo
+from application.dto import AdOut, AdShort
+from application.serializers import Serializer
+
+
+@pytest.fixture
+def ad_data():
+    return {
+        'id': 1,
+        'name': 'Беспроводная мышь',
+        'price': 500.5,
+        'main_photo': {'url': 'http://example.com/1.jpg'},
+        'description': None,
+        'photos': [Photo(url='http://example.com/1.jpg'), Photo(url='http://example.com/2.jpg')]
+    }
+
+
+def render_both(monkeypatch, render):
+    monkeypatch.setattr(serializers.config, 'FAST_SERIALIZATION', True)
+    fast = render()
+    monkeypatch.setattr(serializers.config, 'FAST_SERIALIZATION', False)
+    slow = render()
+
+    return fast, slow
+
+
+def test_serializer_matches_response_model(monkeypatch, ad_data):
+    serializer = Serializer(AdOut, exclude_none=True)
+
+    fast, slow = render_both(monkeypatch, lambda: serializer.render(ad_data))
+
+    assert fast == slow
+    assert b'description' not in fast
+
+
+def test_serializer_many_matches_response_model(monkeypatch, ad_data):
+    serializer = Serializer(AdShort)
+    items = [{**ad_data, 'id': i, 'price': i * 100} for i in range(1, 4)]
+
+    fast, slow = render_both(monkeypatch, lambda: serializer.render_many(items))
+
+    assert fast == slow
+
+
+def test_serializer_keeps_none_fields(monkeypatch, ad_data):
+    serializer = Serializer(AdOut)
+
+    fast, slow = render_both(monkeypatch, lambda: serializer.render(ad_data))
+
+    assert fast == slow
+    assert b'"description":null' in fast
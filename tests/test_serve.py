@@ -0,0 +1,103 @@
+import os
+import re
+import signal
+import subprocess
+import sys
+import time
+
+import httpx
+import pytest
+from sqlalchemy import create_engine
+
+from application.database import Base, engine_options
+from application import cache
+from application.serve import cpu_count, default_workers
+from benchmarks.load import _free_port
+
+
+def _wait_for(condition, timeout: float = 20):
+    deadline = time.monotonic() + timeout
+
+    while time.monotonic() < deadline:
+        if condition():
+            return
+        time.sleep(0.05)
+
+    raise AssertionError('timed out')
+
+
+@pytest.fixture
+def database_url(tmp_path):
+    url = f'sqlite:///{tmp_path / "serve.sqlite3"}'
+    engine = create_engine(url, **engine_options(url))
+    Base.metadata.create_all(bind=engine)
+    engine.dispose()
+
+    return url
+
+
+@pytest.fixture
+def server(tmp_path, database_url):
+    port = _free_port()
+    log = tmp_path / 'serve.log'
+    env = {**os.environ, 'CONFIG': 'production', 'DATABASE_URL': database_url}
+
+    with open(log, 'w') as stderr:
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'application.serve', '--port', str(port), '--workers', '2', '--graceful-timeout', '5'],
+            env=env,
+            stderr=stderr
+        )
+
+    def workers():
+        return [int(pid) for pid in re.findall(r'Started worker \[(\d+)]', log.read_text())]
+
+    process.url = f'http://127.0.0.1:{port}'
+    process.workers = workers
+    _wait_for(lambda: len(workers()) == 2 and log.read_text().count('Application startup complete') == 2)
+
+    yield process
+
+    if process.poll() is None:
+        process.kill()
+        process.wait()
+
+
+def test_cpu_count():
+    assert 1 <= cpu_count() <= os.cpu_count()
+
+
+def test_default_workers(monkeypatch):
+    # the in-memory backend of the test config has a scope of its own
+    assert default_workers() == 1
+
+    monkeypatch.setattr(cache.ad_pages.backend, 'scope', '')
+
+    assert default_workers() == cpu_count()
+
+
+def test_workers_serve_requests(server, ad_sample_input):
+    response = httpx.post(f'{server.url}/ad/', json=ad_sample_input)
+
+    assert response.status_code == 201
+    assert httpx.get(f'{server.url}/ad/{response.json()["id"]}').status_code == 200
+
+
+def test_graceful_reload_and_shutdown(server):
+    old_workers = server.workers()
+
+    server.send_signal(signal.SIGHUP)
+    _wait_for(lambda: len(server.workers()) == 4)
+
+    assert httpx.get(f'{server.url}/ad/').status_code == 200
+
+    # the old workers are drained, the new ones take over the socket
+    for pid in old_workers:
+        _wait_for(lambda: not os.path.exists(f'/proc/{pid}'))
+    assert httpx.get(f'{server.url}/ad/').status_code == 200
+
+    server.send_signal(signal.SIGTERM)
+
+    assert server.wait(timeout=10) == 0
+    assert not any(os.path.exists(f'/proc/{pid}') for pid in server.workers())
+
@@ -0,0 +1,49 @@
+from sqlalchemy import create_engine
+
+from application import database
+from application.database import engine_options
+from application.database.pool import InstrumentedAsyncAdaptedQueuePool, InstrumentedQueuePool, pool_status
+
+
+def test_pool_status(client):
+    response = client.get('/status/pool')
+
+    assert response.status_code == 200
+
+    data = response.json()
+    assert data['database']['class'] == 'InstrumentedQueuePool'
+    assert {'size', 'checked_out', 'overflow', 'checkouts', 'checkout_time'} <= set(data['database'])
+    assert data['threadpool']['size'] > 0
+
+
+def test_instrumented_pool_counts_checkouts(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "db.sqlite3"}', poolclass=InstrumentedQueuePool, pool_size=2)
+
+    with engine.connect(), engine.connect():
+        status = pool_status(engine.pool)
+
+    assert status['checked_out'] == 2
+    assert status['checkouts'] == 2
+    assert status['checkout_time'] >= status['max_checkout_time'] > 0
+    assert pool_status(engine.pool)['checked_in'] == 2
+
+
+def test_engine_options_sqlite(monkeypatch):
+    monkeypatch.setattr(database.config, 'DATABASE_POOL_SIZE', 7)
+
+    options = engine_options('sqlite:///db.sqlite3')
+
+    assert options['poolclass'] is InstrumentedQueuePool
+    assert options['pool_size'] == 7
+    assert options['connect_args']['check_same_thread'] is False
+
+
+def test_engine_options_postgresql_statement_timeout(monkeypatch):
+    monkeypatch.setattr(database.config, 'DATABASE_STATEMENT_TIMEOUT', 1500)
+
+    assert engine_options('postgresql://localhost/db')['connect_args'] == {'options': '-c statement_timeout=1500'}
+    assert engine_options('postgresql+asyncpg://localhost/db', is_async=True) == {
+        **engine_options('postgresql://localhost/db'),
+        'poolclass': InstrumentedAsyncAdaptedQueuePool,
+        'connect_args': {'server_settings': {'statement_timeout': '1500'}}
+    }